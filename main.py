@@ -12,7 +12,14 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import Message, CallbackQuery
 import config as cf
+from src.util.fsm.storage import create_fsm_storage
 from src.mailing.data.notification.notification_google_sheets_worker import notification_gsworker
+from src.analytics.api_client import sova_api_client
+from src.analytics.db.db import user_tokens_db
+from src.analytics.auth.tokens import token_manager
+from src.util.db.postgres import pg_pool
+from src.util.telegram.send_queue import send_queue, send_queue_middleware
+from src.util.render.service import render_service
 from pydub import AudioSegment
 import asyncpg
 import re
@@ -55,16 +62,18 @@ class SubscriptionState(StatesGroup):
 
 # Функция для сохранения подписки в БД
 async def save_subscription(user_id: int, sub_type: str, weekday: int | None, time: str):
-    conn = await asyncpg.connect(**DB_CONFIG)
-    await conn.execute(
-        """
-        INSERT INTO subscriptions (user_id, subscription_type, weekday, time)
-        VALUES ($1, $2, $3, $4)
-        ON CONFLICT (user_id) DO UPDATE 
-        SET subscription_type = $2, weekday = $3, time = $4;
-        """, user_id, sub_type, weekday, time
-    )
-    await conn.close()
+    conn = await pg_pool.acquire()
+    try:
+        await conn.execute(
+            """
+            INSERT INTO subscriptions (user_id, subscription_type, weekday, time)
+            VALUES ($1, $2, $3, $4)
+            ON CONFLICT (user_id) DO UPDATE 
+            SET subscription_type = $2, weekday = $3, time = $4;
+            """, user_id, sub_type, weekday, time
+        )
+    finally:
+        await pg_pool.release(conn)
 
 
 notification_gsworker = NotificationGoogleSheetsWorker()  # Это строка инициализирует worker
@@ -77,7 +86,7 @@ waiting_for_question = set()
 
 # Инициализация роутеров
 router = Router(name=__name__)
-dp = Dispatcher()
+dp = Dispatcher(storage=create_fsm_storage())
 
 # Установите API-ключ для Replicate
 os.environ["REPLICATE_API_TOKEN"] = "r8_TaFGkUSHUTT5nRm6YlFTiW9XxnbYJ6N0ZB0tE"
@@ -529,7 +538,24 @@ async def include_routers() -> None:
 async def main() -> None:
     """Основная функция для запуска бота"""
     bot = Bot(token=cf.TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    bot.session.middleware(send_queue_middleware)
     await include_routers()
+    if "postgres" in (cf.USER_TOKENS_BACKEND, cf.FSM_STORAGE):
+        # otherwise the pool is created by the first subscription query
+        dp.startup.register(pg_pool.start)
+    dp.startup.register(sova_api_client.start)
+    dp.startup.register(user_tokens_db.start)
+    if cf.USER_TOKENS_WARM_UP:
+        dp.startup.register(user_tokens_db.warm_up)
+    dp.startup.register(token_manager.start)
+    dp.startup.register(render_service.start)
+    dp.shutdown.register(token_manager.stop)
+    dp.shutdown.register(sova_api_client.close)
+    dp.shutdown.register(user_tokens_db.close)
+    dp.shutdown.register(send_queue.close)
+    dp.shutdown.register(render_service.close)
+    dp.shutdown.register(dp.storage.close)
+    dp.shutdown.register(pg_pool.close)
     await bot.delete_webhook()
 
     try:
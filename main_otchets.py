@@ -18,6 +18,9 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 
 import config as cf
+from src.util.fsm.storage import create_fsm_storage
+from src.analytics.api_client import sova_api_client
+from src.util.telegram.send_queue import send_queue, send_queue_middleware
 from pydub import AudioSegment
 import asyncpg
 import re
@@ -92,7 +95,7 @@ waiting_for_question = set()
 
 # Инициализация роутеров
 router = Router(name=__name__)
-dp = Dispatcher()
+dp = Dispatcher(storage=create_fsm_storage())
 
 # Установите API-ключ для Replicate
 os.environ["REPLICATE_API_TOKEN"] = "r8_TaFGkUSHUTT5nRm6YlFTiW9XxnbYJ6N0ZB0tE"
@@ -302,6 +305,7 @@ async def recognize_speech_from_audio(file_path: str) -> str:
 async def main() -> None:
     """Основная функция для запуска бота"""
     bot = Bot(token=cf.TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    bot.session.middleware(send_queue_middleware)
     dp.include_router(router)
     dp.include_router(analys_revenue_pdf_router)  # Подключаем роутер для PDF
     dp.include_router(analys_revenue_excel_router)  # Подключаем роутер для Excel
@@ -317,6 +321,9 @@ async def main() -> None:
     dp.include_router(forecasting_losses_excel_router)
     dp.include_router(inventory_pdf_router)
     dp.include_router(inventory_excel_router)
+    dp.startup.register(sova_api_client.start)
+    dp.shutdown.register(sova_api_client.close)
+    dp.shutdown.register(send_queue.close)
     await bot.delete_webhook()
 
     try:
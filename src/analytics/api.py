@@ -1,24 +1,84 @@
-import requests
+from asyncio import gather, Semaphore
+from weakref import WeakValueDictionary
 
-from asyncio import get_event_loop
+from aiohttp import ClientError
 
+from .api_client import sova_api_client
+from .cache import departments_cache, department_directory, report_cache
+from .coalesce import report_coalescer
+from .daily import daily_aggregator
+from .resilience import resilient_call, BackendError, CircuitOpenError
+from .schemas import decode_report
+from .auth.tokens import token_manager, get_token_scope
 from .api_util import get_dates, get_requests_datas_from_state_data, ReportRequestData
 
-from .db.db import user_tokens_db
 from src.util.log import logger
 import config as cf
 
 
-async def get_reports(tgid: int, state_data: dict) -> list[dict] | None:
-    request_data_list = get_requests_datas_from_state_data(tgid, state_data)
-    responses = []
-    for request_data in request_data_list:
-        loop = get_event_loop()
-        response = await loop.run_in_executor(None, m_req_get_report, request_data.token, request_data.url, request_data.group, request_data.departments, request_data.date_from, request_data.date_to)
-        responses.append(response)
+# tgid -> semaphore, lives while at least one get_reports of this user is running
+_user_semaphores: WeakValueDictionary[int, Semaphore] = WeakValueDictionary()
+
+
+def get_user_semaphore(tgid: int) -> Semaphore:
+    semaphore = _user_semaphores.get(tgid)
+    if semaphore is None:
+        semaphore = Semaphore(cf.REPORT_REQUESTS_PER_USER)
+        _user_semaphores[tgid] = semaphore
+    return semaphore
+
+
+class ReportList(list):
+    # responses of get_reports, as_of is set when some of them were served from cache because the backend failed
+    as_of: float | None = None
+
+
+async def get_reports(tgid: int, state_data: dict, semaphore: Semaphore | None = None) -> ReportList:
+    # semaphore: limit of the caller's backend requests, the user's own one by default
+    request_data_list = await get_requests_datas_from_state_data(tgid, state_data)
+    if semaphore is None:
+        semaphore = get_user_semaphore(tgid)
+
+    async def get_report(request_data: ReportRequestData) -> tuple[object | None, float | None]:
+        cached = await report_cache.get(request_data.key)
+        if cached is not None:
+            return cached.report, None
+
+        async def fetch_report() -> tuple[object | None, float | None]:
+            try:
+                async with semaphore:
+                    if daily_aggregator is not None and daily_aggregator.supports(request_data):
+                        report = await daily_aggregator.get_report(request_data, m_req_get_report)
+                    else:
+                        report = await m_req_get_report(request_data.token, request_data.url, request_data.group, request_data.departments, request_data.date_from, request_data.date_to)
+            except (BackendError, CircuitOpenError, ClientError, TimeoutError) as e:
+                stale = report_cache.get_stale(request_data.key)
+                if stale is None:
+                    raise
+                logger.msg("WARNING", f"Serving stale report: url={request_data.url}, fetched_at={stale.fetched_at}: {e!r}")
+                return stale.report, stale.fetched_at
+
+            if report is not None:
+                await report_cache.set(request_data.key, report, request_data.is_closed)
+            return report, None
+
+        return await report_coalescer.run(request_data.key, fetch_report)
+
+    results = await gather(*(get_report(request_data) for request_data in request_data_list), return_exceptions=True)
+
+    # gather keeps the order of request_data_list, failed requests become None
+    responses = ReportList()
+    for request_data, result in zip(request_data_list, results):
+        if isinstance(result, BaseException):
+            logger.msg("ERROR", f"Could not get report: url={request_data.url}, group={request_data.group}, {tgid=}: {result!r}")
+            result = None, None
+        report, as_of = result
+        if as_of is not None:
+            responses.as_of = as_of if responses.as_of is None else min(responses.as_of, as_of)
+        responses.append(report)
     return responses
 
-def m_req_get_report(token: str, url: str, group: str, departments: list[str], date_from: str, date_to: str) -> dict | None:
+async def m_req_get_report(token: str, url: str, group: str, departments: list[str], date_from: str, date_to: str) -> object | None:
     data = {
         "dateFrom": date_from,
         "dateTo": date_to,
@@ -28,38 +88,35 @@ def m_req_get_report(token: str, url: str, group: str, departments: list[str], d
     
     logger.debug(f"SendRequest: {url=}, {data=}, {token=}")
     
-    req = requests.post(
-        url=f"{cf.API_PATH}/api/{url}",
-        headers={
-            "Authorization": f"Bearer {token}", 
-            "Content-type": "application/json",
-        },
-        json=data
-    )
+    # raises BackendError, CircuitOpenError or TimeoutError if the backend does not respond in time
+    status, body = await resilient_call(url, lambda: sova_api_client.post_report(token, url, data))
     
-    logger.debug(f"ResievedResponse: {req.text}, status={req.status_code}; request: {url=}, {data=}, {token=}")
+    logger.debug(f"ResievedResponse: status={status}; request: {url=}, {data=}, {token=}")
     
-    if req.status_code != 200:
+    if status != 200:
         logger.msg("ERROR", f"Could not get request: {url=}, {data=}, {token=}")
         return None
-    return req.json()
+    return decode_report(url, body)
 
 
 async def get_departments(tgid: int) -> dict:
-    token = user_tokens_db.get_token(tgid=str(tgid))
-    loop = get_event_loop()
-    departments = await loop.run_in_executor(None, m_req_get_departments, token)
+    token = await token_manager.get_valid_token(tgid=str(tgid))
+
+    departments_remapped = departments_cache.get(token)
+    if departments_remapped is not None:
+        return departments_remapped
+
+    departments = await m_req_get_departments(token)
     departments_remapped = { dep["id"]: dep["name"] for dep in departments }
+    if departments_remapped:
+        departments_cache.set(token, departments_remapped)
+        department_directory.set(get_token_scope(token), departments_remapped)
     return departments_remapped
 
-def m_req_get_departments(token: str) -> dict:
-    req = requests.get(
-        url=f"{cf.API_PATH}/api/departments",
-        headers={"Authorization": f"Bearer {token}"},
-    )
-    if req.status_code != 200:
+async def m_req_get_departments(token: str) -> list[dict]:
+    status, response = await sova_api_client.get_departments(token)
+    if status != 200:
         logger.msg("ERROR", f"Could not get departments: {token=}")
         return []
-    return req.json()['departments'] + [{"id": "all_departments", "name": "Вся сеть"}]
-
+    return response['departments'] + [{"id": "all_departments", "name": "Вся сеть"}]
 
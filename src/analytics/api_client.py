@@ -0,0 +1,77 @@
+from json import JSONDecodeError
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+from src.util.log import logger
+import config as cf
+
+
+class SovaApiClient:
+    base_url: str
+    session: ClientSession | None
+
+    def __init__(self, base_url: str) -> None:
+        self.base_url = base_url
+        self.session = None
+
+    async def start(self) -> None:
+        if self.session is not None and not self.session.closed:
+            return
+        connector = TCPConnector(
+            limit=cf.SOVA_API_CONNECTIONS,
+            limit_per_host=cf.SOVA_API_CONNECTIONS_PER_HOST,
+            ttl_dns_cache=cf.SOVA_API_DNS_CACHE_TTL,
+            keepalive_timeout=cf.SOVA_API_KEEPALIVE_TIMEOUT,
+        )
+        timeout = ClientTimeout(total=cf.SOVA_API_TIMEOUT, connect=cf.SOVA_API_CONNECT_TIMEOUT)
+        self.session = ClientSession(connector=connector, timeout=timeout)
+        logger.info(f"SOVA API client started: {self.base_url}")
+
+    async def close(self) -> None:
+        if self.session is None:
+            return
+        await self.session.close()
+        self.session = None
+        logger.info("SOVA API client closed")
+
+    async def get_session(self) -> ClientSession:
+        # handlers may run in an entry point which did not register start()
+        if self.session is None or self.session.closed:
+            await self.start()
+        return self.session
+
+    async def login(self, login: str, password: str) -> tuple[int, dict | None]:
+        session = await self.get_session()
+        async with session.post(f"{self.base_url}/api/login", data={"login": login, "password": password}) as resp:
+            try:
+                return resp.status, await resp.json(content_type=None)
+            except JSONDecodeError:
+                # e.g. an html error page of the proxy
+                logger.msg("ERROR", f"Login response is not JSON: status={resp.status}, {await resp.text()!r:.200}")
+                return resp.status, None
+
+    async def refresh(self, token: str) -> tuple[int, dict | None]:
+        session = await self.get_session()
+        async with session.post(f"{self.base_url}{cf.SOVA_API_REFRESH_PATH}", headers={"Authorization": f"Bearer {token}"}) as resp:
+            if resp.status != 200:
+                return resp.status, None
+            return resp.status, await resp.json(content_type=None)
+
+    async def get_departments(self, token: str) -> tuple[int, dict | None]:
+        session = await self.get_session()
+        async with session.get(f"{self.base_url}/api/departments", headers={"Authorization": f"Bearer {token}"}) as resp:
+            if resp.status != 200:
+                return resp.status, None
+            return resp.status, await resp.json(content_type=None)
+
+    async def post_report(self, token: str, url: str, data: dict) -> tuple[int, bytes | None]:
+        # raw body, reports are decoded by their schema (see schemas.py)
+        session = await self.get_session()
+        async with session.post(f"{self.base_url}/api/{url}", headers={"Authorization": f"Bearer {token}"}, json=data) as resp:
+            if resp.status != 200:
+                logger.debug(f"ResievedResponse: {await resp.text()}, status={resp.status}; request: {url=}, {data=}")
+                return resp.status, None
+            return resp.status, await resp.read()
+
+
+sova_api_client = SovaApiClient(cf.API_PATH)
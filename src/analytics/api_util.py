@@ -1,10 +1,11 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
 
 from dataclasses import dataclass
 
+from .auth.tokens import token_manager, get_token_owner, get_token_scope, TokenExpiredError
+from .db.db import user_tokens_db
 from .constant.urls import all_report_urls
 
-from .db.db import user_tokens_db
 import config as cf
 from src.util.log import logger
 
@@ -17,10 +18,32 @@ class ReportRequestData:
     date_from: str
     date_to: str
     departments: list[str]
-    
 
-def get_requests_datas_from_state_data(tgid: int, state_data: dict) -> list[ReportRequestData]:
-    token = user_tokens_db.get_token(tgid=str(tgid))
+    @property
+    def key(self) -> tuple:
+        return (get_token_scope(self.token), self.url, self.group, tuple(self.departments), self.date_from, self.date_to)
+
+    @property
+    def owner_key(self) -> tuple:
+        # the same report of the same user without the dates, kept across token refreshes
+        return (get_token_owner(self.token), self.url, self.group, tuple(self.departments))
+
+    @property
+    def is_closed(self) -> bool:
+        return is_closed_period(date.fromisoformat(self.date_to))
+
+
+async def get_user_scope(tgid: int) -> str:
+    # the stored token is read without refreshing, so no request is made
+    token = await user_tokens_db.get_token(str(tgid))
+    return get_token_scope(token) if token is not None else ""
+
+
+async def get_requests_datas_from_state_data(tgid: int, state_data: dict) -> list[ReportRequestData]:
+    token = await token_manager.get_valid_token(tgid=str(tgid))
+    if token is None:
+        # logged out or the token was deleted meanwhile: the user is asked to authorize again
+        raise TokenExpiredError(f"No token of {tgid=}")
     
     report_type = state_data.get("report:type")
     
@@ -89,5 +112,10 @@ def get_dates(period: str) -> tuple[datetime.date, datetime.date]:
     return date_from, date_to
 
 
+def is_closed_period(date_to: date) -> bool:
+    today = datetime.now(tz=cf.TIMEZONE).date()
+    return date_to < today
+
+
 
 
@@ -0,0 +1,155 @@
+import json
+from asyncio import Task, create_task, sleep
+from base64 import urlsafe_b64decode
+from bisect import bisect_left, bisect_right, insort
+from dataclasses import dataclass
+from hashlib import sha256
+from time import time
+
+from ..api_client import sova_api_client
+from ..cache import department_directory, report_cache
+from ..db.db import user_tokens_db
+from src.util.log import logger
+import config as cf
+
+
+class TokenExpiredError(Exception):
+    pass
+
+
+@dataclass(slots=True)
+class TokenInfo:
+    token: str
+    expires_at: float | None
+
+
+def get_token_payload(token: str) -> dict:
+    # signature is not checked, the payload is only used locally
+    try:
+        payload = token.split('.')[1]
+        payload = json.loads(urlsafe_b64decode(payload + '=' * (-len(payload) % 4)))
+    except (AttributeError, IndexError, ValueError):
+        return {}
+    return payload if isinstance(payload, dict) else {}
+
+
+def get_token_scope(token: str) -> str:
+    # the backend filters reports by the caller's token ("all departments" are the departments of this user),
+    # so cached reports are never shared between tokens; the hash keeps the token out of the disk cache
+    return sha256(token.encode()).hexdigest()[:32]
+
+
+def get_token_owner(token: str) -> str:
+    # the backend user of the token: unlike the scope it stays the same after a refresh or a new login;
+    # tokens without the user claims are their own owner
+    payload = get_token_payload(token)
+    user_id = payload.get("userId")
+    if user_id is None:
+        return get_token_scope(token)
+    return sha256(f"{payload.get('slug')}/{user_id}".encode()).hexdigest()[:32]
+
+
+def get_token_expiration(token: str) -> float | None:
+    # exp claim of the JWT, the signature is checked by the backend only
+    expires_at = get_token_payload(token).get("exp")
+    return float(expires_at) if isinstance(expires_at, (int, float)) else None
+
+
+class TokenManager:
+    # tgid -> token metadata, expiry_index is sorted by expiration for bulk sweeps
+    infos: dict[str, TokenInfo]
+    expiry_index: list[tuple[float, str]]
+    margin: float
+    sweep_task: Task | None
+
+    def __init__(self, margin: float) -> None:
+        self.infos = {}
+        self.expiry_index = []
+        self.margin = margin
+        self.sweep_task = None
+
+    def track(self, tgid: str, token: str) -> TokenInfo:
+        self.forget(tgid)
+        info = TokenInfo(token=token, expires_at=get_token_expiration(token))
+        self.infos[tgid] = info
+        if info.expires_at is not None:
+            insort(self.expiry_index, (info.expires_at, tgid))
+        return info
+
+    def forget(self, tgid: str) -> None:
+        info = self.infos.pop(tgid, None)
+        if info is None or info.expires_at is None:
+            return
+        i = bisect_left(self.expiry_index, (info.expires_at, tgid))
+        if i < len(self.expiry_index) and self.expiry_index[i] == (info.expires_at, tgid):
+            del self.expiry_index[i]
+
+    def is_expiring(self, info: TokenInfo, within: float = 0) -> bool:
+        return info.expires_at is not None and info.expires_at - within <= time()
+
+    def expiring(self, within: float) -> list[str]:
+        end = bisect_right(self.expiry_index, (time() + within, "\uffff"))
+        return [tgid for _expires_at, tgid in self.expiry_index[:end]]
+
+    async def get_valid_token(self, tgid: str) -> str | None:
+        # fails before the backend call, the user is asked to authorize again (see authorization.py)
+        token = await user_tokens_db.get_token(tgid=tgid)
+        if token is None:
+            return None
+
+        info = self.infos.get(tgid)
+        if info is None or info.token != token:
+            info = self.track(tgid, token)
+
+        if self.is_expiring(info, within=self.margin):
+            raise TokenExpiredError(f"Token of {tgid=} is expired")
+        return token
+
+    async def refresh(self, tgid: str) -> bool:
+        info = self.infos.get(tgid)
+        if info is None:
+            return False
+        status, response = await sova_api_client.refresh(info.token)
+        if status != 200 or not response.get("token"):
+            logger.msg("WARNING", f"Could not refresh token: {tgid=}, {status=}")
+            return False
+        await user_tokens_db.insert_user(tgid=tgid, token=response["token"])
+        self.track(tgid, response["token"])
+        # reports of the old token are not requested anymore
+        await report_cache.invalidate(get_token_scope(info.token))
+        department_directory.move(get_token_scope(info.token), get_token_scope(response["token"]))
+        return True
+
+    async def sweep(self) -> None:
+        tgids = self.expiring(within=cf.TOKEN_REFRESH_BEFORE)
+        if not tgids:
+            return
+        if cf.SOVA_API_REFRESH_PATH is None:
+            logger.info(f"Tokens expiring soon: {len(tgids)}, refresh is not configured")
+            return
+        refreshed = 0
+        for tgid in tgids:
+            try:
+                refreshed += await self.refresh(tgid)
+            except Exception as e:
+                logger.msg("ERROR", f"Token refresh error: {tgid=}: {e!r}")
+        logger.info(f"Tokens refreshed: {refreshed}/{len(tgids)}")
+
+    async def sweep_forever(self) -> None:
+        while True:
+            await sleep(cf.TOKEN_SWEEP_INTERVAL)
+            await self.sweep()
+
+    async def start(self) -> None:
+        # from the table: the postgres backend keeps only recently used tokens in memory
+        for tgid, token in await user_tokens_db.get_all_users():
+            self.track(tgid, token)
+        self.sweep_task = create_task(self.sweep_forever())
+
+    async def stop(self) -> None:
+        if self.sweep_task is not None:
+            self.sweep_task.cancel()
+            self.sweep_task = None
+
+
+token_manager = TokenManager(margin=cf.TOKEN_EXPIRATION_MARGIN)
@@ -0,0 +1,114 @@
+"""Load benchmark of the analytics client (get_reports, get_departments).
+
+Starts the fake SOVA API in-process (or uses --api-path) and drives the client
+at the given concurrency, then prints throughput and p50/p95/p99 latency.
+
+    python -m src.analytics.bench.benchmark --requests 500 --concurrency 50 --latency-ms 300
+"""
+import argparse
+import asyncio
+from shutil import rmtree
+from statistics import quantiles
+from tempfile import mkdtemp
+from time import perf_counter
+
+from aiohttp import web
+
+import config as cf
+
+# benchmark users live in a temporary database, set before db.py creates user_tokens_db on import
+bench_db_dir = mkdtemp(prefix="sova-bench-")
+cf.USER_TOKENS_BACKEND = "sqlite"
+cf.USER_TOKENS_DB_PATH = f"{bench_db_dir}/user_tokens.db"
+
+from .fake_api import add_arguments, make_fake_api, make_token
+from ..api import get_reports, get_departments
+from ..api_client import sova_api_client
+from ..cache import departments_cache, report_cache
+from ..coalesce import report_coalescer
+from ..db.db import user_tokens_db
+
+
+async def run_requests(name: str, func, count: int, concurrency: int) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def run_one(i: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            start = perf_counter()
+            try:
+                result = await func(i)
+                # get_departments answers {} and get_reports None items on errors
+                if not result or (isinstance(result, list) and None in result):
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append(perf_counter() - start)
+
+    start = perf_counter()
+    await asyncio.gather(*(run_one(i) for i in range(count)))
+    elapsed = perf_counter() - start
+
+    percentiles = quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    print(
+        f"{name:<16} requests={count} concurrency={concurrency} errors={errors} "
+        f"throughput={count / elapsed:.1f} req/s "
+        f"p50={percentiles[49] * 1000:.0f}ms p95={percentiles[94] * 1000:.0f}ms p99={percentiles[98] * 1000:.0f}ms"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    runner = None
+    if args.api_path is None:
+        runner = web.AppRunner(make_fake_api(args).make_app())
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", args.port).start()
+        sova_api_client.base_url = f"http://127.0.0.1:{args.port}"
+    else:
+        sova_api_client.base_url = args.api_path
+    await sova_api_client.start()
+
+    tgids = [-(i + 1) for i in range(args.users)]
+    for tgid in tgids:
+        slug = "bench" if args.shared_network else f"bench-{tgid}"
+        await user_tokens_db.insert_user(tgid=str(tgid), token=make_token(slug=slug))
+
+    state_data = {"report:type": args.report_type, "report:period": args.period, "report:department": "all_departments"}
+
+    async def reports_request(i: int) -> list:
+        if not args.cache:
+            report_cache.clear()
+        return await get_reports(tgids[i % len(tgids)], state_data)
+
+    async def departments_request(i: int) -> dict:
+        if not args.cache:
+            departments_cache.clear()
+        return await get_departments(tgids[i % len(tgids)])
+
+    try:
+        await run_requests("get_departments", departments_request, args.requests, args.concurrency)
+        await run_requests("get_reports", reports_request, args.requests, args.concurrency)
+        print(f"coalescing: {report_coalescer.stats()}")
+    finally:
+        await user_tokens_db.close()
+        rmtree(bench_db_dir, ignore_errors=True)
+        await sova_api_client.close()
+        if runner is not None:
+            await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analytics client benchmark")
+    parser.add_argument("--requests", type=int, default=200, help="requests of every kind")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--users", type=int, default=20, help="bot users making the requests")
+    parser.add_argument("--report-type", default="revenue", help="report:type, see urls.py")
+    parser.add_argument("--period", default="last-month", help="report:period, see variants.py")
+    parser.add_argument("--cache", action="store_true", help="keep report and department caches between requests")
+    parser.add_argument("--shared-network", action="store_true", help="all users are in one network (same slug in their tokens)")
+    parser.add_argument("--api-path", default=None, help="use a running API instead of the fake one")
+    parser.add_argument("--port", type=int, default=8081, help="port of the fake API")
+    add_arguments(parser)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,158 @@
+"""Local stand-in of the SOVA API for measuring the analytics client.
+
+Serves /api/login, /api/departments and the report urls of urls.py from the
+sample payloads in files/jsons_for_reports, scaled to the requested number of
+departments and products.
+
+    python -m src.analytics.bench.fake_api --port 8081 --departments 50 --latency-ms 300
+"""
+import argparse
+import json
+from asyncio import sleep
+from base64 import urlsafe_b64encode
+from copy import deepcopy
+from os import getcwd
+from random import random, uniform
+from time import time
+
+from aiohttp import web
+
+
+SAMPLES_PATH = f"{getcwd()}/files/jsons_for_reports"
+
+# key - report url, value - sample file and what its rows are
+SAMPLES = {
+    "revenue": ("example.json", "departments"),
+    "loss-forecast": ("loss-forecast_data_example.json", "products"),
+    "turnover": ("turnover-store_example.json", "departments"),
+    "inventory": ("inventory_store_example.json", "departments"),
+    "food-cost": ("food_cost_server_data_example.json", "departments"),
+}
+
+
+def make_token(slug: str, lifetime: int = 24 * 60 * 60) -> str:
+    def encode(part: dict) -> str:
+        return urlsafe_b64encode(json.dumps(part).encode()).decode().rstrip("=")
+
+    now = int(time())
+    payload = {"userId": "1", "slug": slug, "iat": now, "exp": now + lifetime}
+    return f"{encode({'alg': 'HS256', 'typ': 'JWT'})}.{encode(payload)}.fake-signature"
+
+
+def load_sample(file_name: str) -> dict:
+    with open(f"{SAMPLES_PATH}/{file_name}", "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def scale_rows(rows: list[dict], count: int) -> list[dict]:
+    result = []
+    for i in range(count):
+        row = deepcopy(rows[i % len(rows)])
+        row["label"] = f"{i + 1}.{row['label'].split('.', 1)[-1]}"
+        result.append(row)
+    return result
+
+
+def make_losses_sample(forecast: dict) -> dict:
+    # there is no sample of the losses report, it is built from the loss-forecast products
+    rows = []
+    for row in forecast["data"]:
+        old_price = row.get("avg_price_two_week_ago") or 100
+        new_price = row.get("avg_price_one_week_ago") or 100
+        loss = (new_price - old_price) * (row.get("avg_amount") or 1)
+        rows.append({
+            "label": row["label"],
+            "avg_price_current_month": new_price, "avg_price_last_month": old_price, "avg_price_month_before_last": old_price,
+            "avg_price_last_week": new_price, "avg_price_week_before_last": old_price,
+            "losses_current_month_to_last": loss, "losses_last_month_to_month_before_last": loss,
+            "losses_last_week_to_week_before_last": loss,
+        })
+    total = {key: sum(row[key] for row in rows) for key in rows[0] if key.startswith("losses")}
+    return {"data": rows, "sum": {"label": "Всего", **total}}
+
+
+class FakeSovaApi:
+    departments: int
+    products: int
+    latency: float
+    jitter: float
+    error_rate: float
+    payloads: dict[str, bytes]
+
+    def __init__(self, departments: int, products: int, latency: float, jitter: float, error_rate: float) -> None:
+        self.departments = departments
+        self.products = products
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.payloads = self.make_payloads()
+
+    def make_payloads(self) -> dict[str, bytes]:
+        samples = {url: load_sample(file_name) for url, (file_name, _rows) in SAMPLES.items()}
+        samples["losses"] = make_losses_sample(samples["loss-forecast"])
+
+        payloads = {}
+        for url, sample in samples.items():
+            rows = SAMPLES.get(url, (None, "products"))[1]
+            sample["data"] = scale_rows(sample["data"], self.departments if rows == "departments" else self.products)
+            if url == "revenue":
+                # revenue answers with network totals at the top level
+                sample = {**sample["sum"], **sample}
+            payloads[url] = json.dumps(sample, ensure_ascii=False).encode()
+        return payloads
+
+    async def delay(self) -> None:
+        await sleep(max(0.0, self.latency + uniform(-self.jitter, self.jitter)))
+
+    def failed(self) -> bool:
+        return random() < self.error_rate
+
+    async def login(self, request: web.Request) -> web.Response:
+        await self.delay()
+        data = await request.post()
+        if not data.get("login") or not data.get("password"):
+            return web.json_response({"error": "Wrong login or password"}, status=401)
+        return web.json_response({"token": make_token(slug=str(data["login"]))})
+
+    async def departments_handler(self, request: web.Request) -> web.Response:
+        await self.delay()
+        if self.failed():
+            return web.json_response({"error": "Internal error"}, status=500)
+        departments = [{"id": f"dep-{i}", "name": f"{i + 1}.Рогалик Точка {i + 1}"} for i in range(self.departments)]
+        return web.json_response({"departments": departments})
+
+    async def report(self, request: web.Request) -> web.Response:
+        await self.delay()
+        if self.failed():
+            return web.json_response({"error": "Internal error"}, status=500)
+        payload = self.payloads.get(request.match_info["url"])
+        if payload is None:
+            return web.json_response({"error": "Not found"}, status=404)
+        return web.Response(body=payload, content_type="application/json")
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/api/login", self.login)
+        app.router.add_get("/api/departments", self.departments_handler)
+        app.router.add_post("/api/{url}", self.report)
+        return app
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--departments", type=int, default=10, help="departments in the network")
+    parser.add_argument("--products", type=int, default=100, help="products in product reports")
+    parser.add_argument("--latency-ms", type=float, default=200, help="mean response latency")
+    parser.add_argument("--jitter-ms", type=float, default=50, help="latency deviation")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 500 responses, 0..1")
+
+
+def make_fake_api(args: argparse.Namespace) -> FakeSovaApi:
+    return FakeSovaApi(args.departments, args.products, args.latency_ms / 1000, args.jitter_ms / 1000, args.error_rate)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake SOVA API")
+    parser.add_argument("--port", type=int, default=8081)
+    add_arguments(parser)
+    args = parser.parse_args()
+    web.run_app(make_fake_api(args).make_app(), port=args.port)
@@ -0,0 +1,198 @@
+import json
+import sqlite3
+from asyncio import get_event_loop
+from dataclasses import dataclass
+from threading import Lock
+from time import time
+
+from cachetools import LRUCache, TTLCache, TLRUCache
+
+from .schemas import decode_report, encode_report
+from src.util.log import logger
+import config as cf
+
+
+class DepartmentsCache:
+    # token -> {department_id: department_name}, TTLCache evicts least recently used entries when full
+    cache: TTLCache
+
+    def __init__(self, maxsize: int, ttl: int) -> None:
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, token: str) -> dict | None:
+        return self.cache.get(token)
+
+    def set(self, token: str, departments: dict) -> None:
+        self.cache[token] = departments
+
+    def invalidate(self, token: str | None) -> None:
+        self.cache.pop(token, None)
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+
+class DepartmentDirectory:
+    # token scope -> {department_id: department_name}, filled by every departments response and never expired,
+    # names are only displayed, so headers can be rendered without a request;
+    # users of one network may see different departments, so the directory is per token, not per network
+    departments: dict[str, dict[str, str]]
+    # token scope -> number of changes of its departments, part of the header cache key
+    versions: dict[str, int]
+
+    def __init__(self) -> None:
+        self.departments = {}
+        self.versions = {}
+
+    def set(self, scope: str, departments: dict[str, str]) -> None:
+        if self.departments.get(scope) != departments:
+            self.departments[scope] = departments
+            self.versions[scope] = self.versions.get(scope, 0) + 1
+
+    def move(self, old_scope: str, new_scope: str) -> None:
+        # a refreshed token sees the same departments until they are requested again
+        departments = self.departments.pop(old_scope, None)
+        self.versions.pop(old_scope, None)
+        if departments is not None:
+            self.set(new_scope, departments)
+
+    def get_name(self, scope: str, department_id: str | None) -> str | None:
+        return self.departments.get(scope, {}).get(department_id)
+
+    def version(self, scope: str) -> int:
+        return self.versions.get(scope, 0)
+
+
+# (token scope, url, group, departments, date_from, date_to), see get_token_scope
+ReportKey = tuple[str, str, str | None, tuple[str, ...], str, str]
+
+
+@dataclass(slots=True)
+class CachedReport:
+    report: object
+    fetched_at: float
+    expires_at: float
+
+
+class ReportDiskCache:
+    conn: sqlite3.Connection
+    lock: Lock
+
+    def __init__(self, path: str) -> None:
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = Lock()
+        with self.lock:
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS Reports (
+            key TEXT PRIMARY KEY,
+            report BLOB NOT NULL,
+            fetched_at REAL NOT NULL,
+            expires_at REAL NOT NULL
+            )
+            ''')
+            self.conn.commit()
+
+    def get(self, key: ReportKey) -> CachedReport | None:
+        with self.lock:
+            row = self.conn.execute('''
+            SELECT report, fetched_at, expires_at FROM Reports WHERE key == ? AND expires_at > ?
+            ''', (json.dumps(key), time())).fetchone()
+        if row is None:
+            return None
+        report = decode_report(key[1], row[0])
+        if report is None:
+            return None
+        return CachedReport(report=report, fetched_at=row[1], expires_at=row[2])
+
+    def set(self, key: ReportKey, entry: CachedReport) -> None:
+        with self.lock:
+            self.conn.execute('''
+            INSERT OR REPLACE INTO Reports (key, report, fetched_at, expires_at) VALUES (?, ?, ?, ?)
+            ''', (json.dumps(key), encode_report(key[1], entry.report), entry.fetched_at, entry.expires_at))
+            self.conn.execute('''DELETE FROM Reports WHERE expires_at <= ?''', (time(),))
+            self.conn.commit()
+
+    def delete_scope(self, scope: str) -> None:
+        # keys are json arrays starting with the scope, a hex string
+        with self.lock:
+            self.conn.execute('''DELETE FROM Reports WHERE key LIKE ?''', (f'["{scope}",%',))
+            self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+class ReportCache:
+    # reports of closed periods never change and live long, open periods (this-week, this-month...) get a short ttl
+    memory: TLRUCache
+    stale: LRUCache
+    disk: ReportDiskCache | None
+    closed_ttl: int
+    open_ttl: int
+
+    def __init__(self, maxsize: int, closed_ttl: int, open_ttl: int, stale_maxsize: int, disk_path: str | None = None) -> None:
+        self.memory = TLRUCache(maxsize=maxsize, ttu=lambda _key, entry, _now: entry.expires_at, timer=time)
+        # last good response of every key, kept after expiration to be served while the backend is down
+        self.stale = LRUCache(maxsize=stale_maxsize)
+        self.disk = ReportDiskCache(disk_path) if disk_path else None
+        self.closed_ttl = closed_ttl
+        self.open_ttl = open_ttl
+
+    async def get(self, key: ReportKey) -> CachedReport | None:
+        entry = self.memory.get(key)
+        if entry is not None or self.disk is None:
+            return entry
+
+        loop = get_event_loop()
+        entry = await loop.run_in_executor(None, self.disk.get, key)
+        if entry is not None:
+            self.memory[key] = entry
+            self.stale[key] = entry
+        return entry
+
+    def get_stale(self, key: ReportKey) -> CachedReport | None:
+        return self.stale.get(key)
+
+    async def set(self, key: ReportKey, report: object, is_closed: bool) -> CachedReport:
+        now = time()
+        ttl = self.closed_ttl if is_closed else self.open_ttl
+        entry = CachedReport(report=report, fetched_at=now, expires_at=now + ttl)
+        self.memory[key] = entry
+        self.stale[key] = entry
+
+        if self.disk is not None and is_closed:
+            loop = get_event_loop()
+            try:
+                await loop.run_in_executor(None, self.disk.set, key, entry)
+            except sqlite3.Error as e:
+                logger.msg("ERROR", f"Could not save report to disk cache: {e!r}")
+        return entry
+
+    async def invalidate(self, scope: str) -> None:
+        for cache in (self.memory, self.stale):
+            for key in [key for key in cache.keys() if key[0] == scope]:
+                cache.pop(key, None)
+
+        if self.disk is not None:
+            loop = get_event_loop()
+            try:
+                await loop.run_in_executor(None, self.disk.delete_scope, scope)
+            except sqlite3.Error as e:
+                logger.msg("ERROR", f"Could not delete reports from disk cache: {e!r}")
+
+    def clear(self) -> None:
+        self.memory.clear()
+        self.stale.clear()
+
+
+departments_cache = DepartmentsCache(maxsize=cf.DEPARTMENTS_CACHE_SIZE, ttl=cf.DEPARTMENTS_CACHE_TTL)
+
+department_directory = DepartmentDirectory()
+
+report_cache = ReportCache(
+    maxsize=cf.REPORT_CACHE_SIZE,
+    closed_ttl=cf.REPORT_CACHE_CLOSED_TTL,
+    open_ttl=cf.REPORT_CACHE_OPEN_TTL,
+    stale_maxsize=cf.REPORT_STALE_CACHE_SIZE,
+    disk_path=cf.REPORT_CACHE_DB_PATH,
+)
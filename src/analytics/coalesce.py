@@ -0,0 +1,60 @@
+from asyncio import Task, create_task, shield
+from collections.abc import Awaitable, Callable, Hashable
+from typing import Any
+
+
+class RequestCoalescer:
+    # concurrent callers with the same key await one shared task instead of sending duplicate requests;
+    # the key has to include everything the response depends on, reports are keyed per token
+    in_flight: dict[Hashable, Task]
+    # task -> callers awaiting it, the task is cancelled when the last of them is cancelled
+    waiters: dict[Task, int]
+    requests: int
+    coalesced: int
+
+    def __init__(self) -> None:
+        self.in_flight = {}
+        self.waiters = {}
+        self.requests = 0
+        self.coalesced = 0
+
+    async def run(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        self.requests += 1
+
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = create_task(func())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda done: self.forget(key, done))
+
+        self.waiters[task] = self.waiters.get(task, 0) + 1
+        try:
+            # shield: a cancelled caller must not cancel the request for the others
+            return await shield(task)
+        finally:
+            self.leave(key, task)
+
+    def leave(self, key: Hashable, task: Task) -> None:
+        waiters = self.waiters.pop(task) - 1
+        if waiters > 0:
+            self.waiters[task] = waiters
+        elif not task.done():
+            # nobody waits for the response anymore, e.g. a cancelled prefetch
+            self.forget(key, task)
+            task.cancel()
+
+    def forget(self, key: Hashable, task: Task) -> None:
+        if self.in_flight.get(key) is task:
+            del self.in_flight[key]
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "in_flight": len(self.in_flight),
+        }
+
+
+report_coalescer = RequestCoalescer()
@@ -1,5 +1,11 @@
+from collections.abc import Iterator
 from dataclasses import dataclass
 
+from ...schemas import RevenueReport, Report, LossesRow
+from ...selection import select_top_bottom
+from src.basic.report_model import ColumnarReport
+import config as cf
+
 
 @dataclass
 class TextData:
@@ -29,7 +35,7 @@ def revenue_str_if_exists(name, value, properties, is_dynamic: bool) -> str:
     return f"<b>{properties[name][0]}:</b> {value:,.0f} {properties[name][1]} \n"
 
 
-def revenue_text(reports: list) -> str:
+def revenue_sections(reports: list[RevenueReport]) -> Iterator[str]:
     report = reports[0]
 
     revenue_properties = {
@@ -46,23 +52,39 @@ def revenue_text(reports: list) -> str:
         }
     }
 
-    text = ""
     print(f"{report=}")
     
     for prop_type, props in revenue_properties.items():
-        for k, v in report.items():
+        text = ""
+        for k in props.keys():
             is_dynamic = prop_type == "dynamics"
-            text += revenue_str_if_exists(k, v, props, is_dynamic)
-        text += '\n'
+            text += revenue_str_if_exists(k, getattr(report, k), props, is_dynamic)
+        yield text + '\n'
+
 
-    return text
+def revenue_text(reports: list[RevenueReport]) -> str:
+    return "".join(revenue_sections(reports))
 
 
 # losses
-def losses_text(data, period):
+# MarkdownV2 escaping, only values are escaped: the template itself has none of these characters
+markdown_escape = str.maketrans({"-": "\\-", ".": "\\."})
+
+
+def escape_markdown(value) -> str:
+    return str(value).translate(markdown_escape)
+
+
+def losses_row_text(item: LossesRow, price_key_current: str, price_key_previous: str, loss_key: str) -> str:
+    return (
+        f"{escape_markdown(item.label)} {escape_markdown(getattr(item, price_key_previous))} руб / "
+        f"{escape_markdown(getattr(item, price_key_current))} руб / {escape_markdown(getattr(item, loss_key))} руб\n"
+    )
+
+
+def losses_sections(data: list[Report[LossesRow]], period: str) -> Iterator[str]:
     data = data[0]
-    report = "**Рост закупочных цен:**\n"
-    report += "**цена старая / цена новая / факт потерь за период**\n\nТОП 10:\n"
+    n = cf.LOSSES_TOP_N
 
     period_mapping = {
         "this-month": ("avg_price_current_month", "avg_price_last_month", "losses_current_month_to_last"),
@@ -71,33 +93,43 @@ def losses_text(data, period):
     }
 
     price_key_current, price_key_previous, loss_key = period_mapping.get(period, period_mapping["last-week"])
-
-    price_increase = sorted(
-        [item for item in data["data"] if
-         item[price_key_current] and item[price_key_previous] and item[price_key_current] > item[price_key_previous]],
-        key=lambda x: x[loss_key],
-        reverse=True
-    )[:10]
-
-    for item in price_increase:
-        report += f"{item['label']} {item[price_key_previous]} руб / {item[price_key_current]} руб / {item[loss_key]} руб\n"
-
-    report += "\n**Снижение закупочных цен:**\n"
-    report += "**цена старая / цена новая / факт потерь за период**\n\nТОП 10:\n"
-
-    price_decrease = sorted(
-        [item for item in data["data"] if
-         item[price_key_current] and item[price_key_previous] and item[price_key_current] < item[price_key_previous]],
-        key=lambda x: x[loss_key]
-    )[:10]
-
-    for item in price_decrease:
-        report += f"{item['label']} {item[price_key_previous]} руб / {item[price_key_current]} руб / {item[loss_key]} руб\n"
-
-    total_loss = data["sum"][loss_key]
-    report += f"\n**Общая сумма потерь/прибыли за период:** {total_loss} руб"
-
-    return report.replace("-", "\\-").replace(".", "\\.")
+    # only the three columns the selection reads
+    report = ColumnarReport.from_report(data, price_key_current, price_key_previous, loss_key)
+
+    # rows are selected on the columns, the text is formatted from the decoded rows: ints stay ints there
+    current, previous, loss = (report.column(name) for name in (price_key_current, price_key_previous, loss_key))
+    # a null or zero price is no price, rows without losses are skipped
+    known = ~(current.mask | previous.mask | loss.mask) & (current.values != 0) & (previous.values != 0)
+    # both lists by partitioning the loss column, equal losses keep the order of the rows
+    increase, decrease = select_top_bottom(
+        loss.values,
+        n,
+        top_where=known & (current.values > previous.values),
+        bottom_where=known & (current.values < previous.values),
+    )
+    price_increase = [data.data[i] for i in increase.tolist()]
+    price_decrease = [data.data[i] for i in decrease.tolist()]
+
+    parts = [
+        "**Рост закупочных цен:**\n",
+        f"**цена старая / цена новая / факт потерь за период**\n\nТОП {n}:\n",
+    ]
+    parts += [losses_row_text(item, price_key_current, price_key_previous, loss_key) for item in price_increase]
+    yield "".join(parts)
+
+    parts = [
+        "\n**Снижение закупочных цен:**\n",
+        f"**цена старая / цена новая / факт потерь за период**\n\nТОП {n}:\n",
+    ]
+    parts += [losses_row_text(item, price_key_current, price_key_previous, loss_key) for item in price_decrease]
+    yield "".join(parts)
+
+    total_loss = getattr(data.sum, loss_key) if data.sum is not None else None
+    yield f"\n**Общая сумма потерь/прибыли за период:** {escape_markdown(total_loss)} руб"
+
+
+def losses_text(data: list[Report[LossesRow]], period: str) -> str:
+    return "".join(losses_sections(data, period))
 
 
 # key - report:type, value - make_text_func
@@ -107,6 +139,13 @@ text_functions = {
     "loss-forecast": text_func_example,
 }
 
+# key - report:type, value - function that yields the text by sections, for long texts sent by pages
+text_sections = {
+    "revenue": lambda text_data: revenue_sections(text_data.reports),
+    "losses": lambda text_data: losses_sections(text_data.reports, text_data.period),
+    "loss-forecast": lambda text_data: iter([text_func_example(text_data)]),
+}
+
 
 
 
@@ -0,0 +1,210 @@
+import json
+import sqlite3
+from asyncio import Semaphore, Task, create_task, gather, get_event_loop, sleep
+from collections.abc import Awaitable, Callable
+from dataclasses import fields
+from datetime import date, datetime, timedelta
+from threading import Lock
+from time import time
+
+from .api_util import ReportRequestData
+from .schemas import decode_report, encode_report
+from src.util.log import logger
+import config as cf
+
+
+class DailySliceStore:
+    conn: sqlite3.Connection
+    lock: Lock
+
+    def __init__(self, path: str) -> None:
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.lock = Lock()
+        with self.lock:
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS DailySlices (
+            key TEXT NOT NULL,
+            day TEXT NOT NULL,
+            report BLOB NOT NULL,
+            PRIMARY KEY (key, day)
+            )
+            ''')
+            # last request of every key, the days of keys unused for a long time are deleted
+            self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS DailySliceKeys (
+            key TEXT PRIMARY KEY,
+            used_at REAL NOT NULL
+            )
+            ''')
+            self.conn.commit()
+
+    def get_days(self, key: str, url: str, date_from: str, date_to: str) -> dict[str, object]:
+        with self.lock:
+            rows = self.conn.execute('''
+            SELECT day, report FROM DailySlices WHERE key == ? AND day >= ? AND day <= ?
+            ''', (key, date_from, date_to)).fetchall()
+            self.conn.execute('''
+            INSERT OR REPLACE INTO DailySliceKeys (key, used_at) VALUES (?, ?)
+            ''', (key, time()))
+            self.conn.commit()
+        return {day: decode_report(url, report) for day, report in rows}
+
+    def set_days(self, key: str, url: str, reports: dict[str, object]) -> None:
+        with self.lock:
+            self.conn.executemany('''
+            INSERT OR REPLACE INTO DailySlices (key, day, report) VALUES (?, ?, ?)
+            ''', [(key, day, encode_report(url, report)) for day, report in reports.items()])
+            self.conn.commit()
+
+    def sweep(self, unused_since: float) -> int:
+        # also the days of keys that are not in DailySliceKeys, such as keys of old tokens
+        with self.lock:
+            self.conn.execute('''DELETE FROM DailySliceKeys WHERE used_at < ?''', (unused_since,))
+            deleted = self.conn.execute('''
+            DELETE FROM DailySlices WHERE key NOT IN (SELECT key FROM DailySliceKeys)
+            ''').rowcount
+            self.conn.commit()
+        return deleted
+
+    def close(self) -> None:
+        self.conn.close()
+
+
+def sum_records(records: list, additive_fields: tuple[str, ...]) -> object:
+    # non additive values (dynamics, forecasts) have no meaning for a sum of days and become None
+    base = records[-1]
+    values = {}
+    for f in fields(base):
+        if f.name == "label":
+            values[f.name] = base.label
+        elif f.name == "data":
+            rows_by_label = {}
+            for record in records:
+                for row in record.data:
+                    rows_by_label.setdefault(row.label, []).append(row)
+            values[f.name] = [sum_records(rows, additive_fields) for rows in rows_by_label.values()]
+        elif f.name == "sum":
+            sums = [record.sum for record in records if record.sum is not None]
+            values[f.name] = sum_records(sums, additive_fields) if sums else None
+        elif f.name in additive_fields:
+            day_values = [getattr(record, f.name) for record in records if getattr(record, f.name) is not None]
+            values[f.name] = sum(day_values) if day_values else None
+        else:
+            values[f.name] = None
+    return type(base)(**values)
+
+
+class DailyAggregator:
+    # wide periods of additive reports are summed from stored days, only today is requested every time
+    store: DailySliceStore
+    additive_fields: dict[str, tuple[str, ...]]
+    # requests of missing days made during the user's request
+    semaphore: Semaphore
+    # requests of days stored in the background, shared by all users
+    backfill_semaphore: Semaphore
+    # slice key -> background backfill
+    backfills: dict[str, Task]
+    last_sweep: float
+
+    def __init__(self, path: str, additive_fields: dict[str, tuple[str, ...]], concurrency: int, backfill_concurrency: int) -> None:
+        self.store = DailySliceStore(path)
+        self.additive_fields = additive_fields
+        self.semaphore = Semaphore(concurrency)
+        self.backfill_semaphore = Semaphore(backfill_concurrency)
+        self.backfills = {}
+        self.last_sweep = 0.0
+
+    def supports(self, request_data: ReportRequestData) -> bool:
+        return request_data.url in self.additive_fields and request_data.date_from != request_data.date_to
+
+    async def get_report(self, request_data: ReportRequestData, fetch: Callable[..., Awaitable[object | None]]) -> object | None:
+        # not the token scope: the days stay valid after a token refresh or a new login of the same user
+        key = json.dumps(request_data.owner_key)
+        url = request_data.url
+        today = datetime.now(tz=cf.TIMEZONE).date().isoformat()
+        date_from = date.fromisoformat(request_data.date_from)
+        date_to = date.fromisoformat(request_data.date_to)
+        days = [(date_from + timedelta(days=i)).isoformat() for i in range((date_to - date_from).days + 1)]
+
+        async def fetch_range() -> object | None:
+            return await fetch(request_data.token, url, request_data.group, request_data.departments, request_data.date_from, request_data.date_to)
+
+        loop = get_event_loop()
+        self.maybe_sweep()
+        stored = await loop.run_in_executor(None, self.store.get_days, key, url, request_data.date_from, request_data.date_to)
+        # today is not finished yet and is never stored
+        missing = [day for day in days if stored.get(day) is None and day != today]
+        if len(missing) > cf.DAILY_INLINE_DAYS:
+            # e.g. the first this-year request: the days are stored in the background, the range answers now
+            self.start_backfill(key, request_data, missing, fetch)
+            return await fetch_range()
+
+        requested = missing + [today] if today in days else missing
+
+        async def fetch_day(day: str) -> object | None:
+            async with self.semaphore:
+                return await fetch(request_data.token, url, request_data.group, request_data.departments, day, day)
+
+        results = await gather(*(fetch_day(day) for day in requested), return_exceptions=True)
+        fetched = {day: report for day, report in zip(requested, results) if report is not None and not isinstance(report, BaseException)}
+
+        closed = {day: report for day, report in fetched.items() if day != today}
+        if closed:
+            await loop.run_in_executor(None, self.store.set_days, key, url, closed)
+
+        if len(fetched) < len(requested):
+            failed = [day for day in requested if day not in fetched]
+            logger.msg("WARNING", f"Could not get daily slices, requesting the range: {url=}, {failed=}")
+            return await fetch_range()
+
+        reports = {**stored, **fetched}
+        return sum_records([reports[day] for day in days], self.additive_fields[url])
+
+    def maybe_sweep(self) -> None:
+        if time() - self.last_sweep < cf.DAILY_SWEEP_INTERVAL:
+            return
+        self.last_sweep = time()
+        create_task(self.sweep())
+
+    async def sweep(self) -> None:
+        try:
+            deleted = await get_event_loop().run_in_executor(None, self.store.sweep, time() - cf.DAILY_SLICES_TTL)
+        except Exception as e:
+            logger.msg("ERROR", f"Daily slices sweep error: {e!r}")
+            return
+        if deleted:
+            logger.info(f"Daily slices deleted: {deleted}")
+
+    def start_backfill(self, key: str, request_data: ReportRequestData, days: list[str], fetch: Callable[..., Awaitable[object | None]]) -> None:
+        if key in self.backfills:
+            return
+        task = create_task(self.backfill(key, request_data, days, fetch))
+        self.backfills[key] = task
+        task.add_done_callback(lambda _: self.backfills.pop(key, None))
+
+    async def backfill(self, key: str, request_data: ReportRequestData, days: list[str], fetch: Callable[..., Awaitable[object | None]]) -> None:
+        # one day at a time and with a pause, so the backfill never crowds out the users' requests
+        url = request_data.url
+        loop = get_event_loop()
+        for day in days:
+            try:
+                async with self.backfill_semaphore:
+                    report = await fetch(request_data.token, url, request_data.group, request_data.departments, day, day)
+            except Exception as e:
+                report = None
+                logger.debug(f"Daily backfill failed: {url=}, {day=}: {e!r}")
+            if report is None:
+                # the rest is requested by the next wide request
+                logger.msg("WARNING", f"Daily backfill stopped: {url=}, {day=}")
+                return
+            await loop.run_in_executor(None, self.store.set_days, key, url, {day: report})
+            await sleep(cf.DAILY_BACKFILL_DELAY)
+        logger.info(f"Daily backfill finished: {url=}, {len(days)} days")
+
+
+daily_aggregator = DailyAggregator(
+    path=cf.DAILY_SLICES_DB_PATH,
+    additive_fields=cf.DAILY_AGGREGATION_FIELDS,
+    concurrency=cf.DAILY_BACKFILL_CONCURRENCY,
+    backfill_concurrency=cf.DAILY_BACKGROUND_CONCURRENCY,
+) if cf.DAILY_AGGREGATION_FIELDS else None
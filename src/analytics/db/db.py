@@ -1,71 +1,162 @@
 import sqlite3
+from asyncio import wrap_future
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+
 import config as cf
+from src.util.db.postgres import pg_pool
 from src.util.log import logger
+from .postgres import PostgresUserTokensDB
 
 
 class UserTokensDB:
+    # the connection lives in one dedicated thread, the event loop only awaits its futures
+    executor: ThreadPoolExecutor
+    conn: sqlite3.Connection | None
+    path: str
+    # write-through cache: tgid -> token, is updated in the db thread after commit
+    tokens: dict[str, str]
+
     def __init__(self, path):
-        # Устанавливаем соединение с базой данных
-        self.conn = sqlite3.connect(path)
-        self.cursor = self.conn.cursor()
         self.path = path
+        self.conn = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="user_tokens_db")
+        self.tokens = {}
+
+    def _connect(self) -> None:
+        # Устанавливаем соединение с базой данных
+        try:
+            self.conn = sqlite3.connect(self.path, cached_statements=32)
+        except sqlite3.OperationalError:
+            logger.msg("ERROR", f"Please create directory for the database: {self.path}")
+            raise
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        _create_table(self.conn)
+
+    def _run(self, func: Callable, *args) -> Any:
+        if self.conn is None:
+            self._connect()
+        return func(self.conn, *args)
+
+    async def run(self, func: Callable, *args) -> Any:
+        return await wrap_future(self.executor.submit(self._run, func, *args))
+
+    async def insert_user(self, tgid: str, token: str) -> None:
+        await self.run(self._insert_user, tgid, token)
+
+    async def get_token(self, tgid: str) -> str | None:
+        token = self.tokens.get(tgid)
+        if token is not None:
+            return token
+        # not loaded by warm_up: e.g. authorized in another process using the same database
+        return await self.run(self._get_token, tgid)
+
+    async def has_tgid(self, tgid: str) -> bool:
+        return await self.get_token(tgid) is not None
+
+    async def delete_user(self, tgid: str) -> None:
+        await self.run(self._delete_user, tgid)
+
+    async def warm_up(self) -> None:
+        users_count = await self.run(self._warm_up)
+        logger.info(f"User tokens loaded: {users_count}")
+
+    # cache updates, executed in the db thread right after the statement
+    def _insert_user(self, conn: sqlite3.Connection, tgid: str, token: str) -> None:
+        _insert_user(conn, tgid, token)
+        self.tokens[tgid] = token
+
+    def _get_token(self, conn: sqlite3.Connection, tgid: str) -> str | None:
+        token = _get_token(conn, tgid)
+        # users without a token are not cached, they are looked up again after authorization elsewhere
+        if token is not None:
+            self.tokens.setdefault(tgid, token)
+        return token
+
+    def _delete_user(self, conn: sqlite3.Connection, tgid: str) -> None:
+        _delete_user(conn, tgid)
+        # not cached as deleted: a login through another process is seen on the next lookup
+        self.tokens.pop(tgid, None)
+
+    def _warm_up(self, conn: sqlite3.Connection) -> int:
+        users = _get_all_users(conn)
+        self.tokens.update({tgid: token for tgid, token in users})
+        return len(users)
 
-    def insert_user(self, tgid: str, token: str) -> None:
-        self.cursor.execute('''
-        INSERT INTO Users (tgid, token) VALUES (?, ?)
-        ''', (tgid, token,))
-        self.conn.commit()
-
-    def get_token(self, tgid: str) -> str | None:
-        self.cursor.execute('''
-        SELECT * FROM Users WHERE tgid == ?
-        ''', (tgid,))
-        result = self.cursor.fetchone()
-        if result is None:
-            return None
-        return result[1]
-
-    def has_tgid(self, tgid: str) -> bool:
-        return self.get_token(tgid) is not None
-
-    def delete_user(self, tgid: str) -> bool:
-        self.cursor.execute('''
-        DELETE FROM Users WHERE tgid == ?
-        ''', (tgid,))
-        self.conn.commit()
-
-    def create_table(self):
-        # Создаем таблицу Users
-        self.cursor.execute('''
-        CREATE TABLE IF NOT EXISTS Users (
-        tgid TEXT PRIMARY KEY,
-        token TEXT NOT NULL
-        )
-        ''')
-        # Сохраняем изменения и закрываем соединение
-        self.conn.commit()
-
-    def close(self):
-        self.conn.close()
-
-    def get_all_users(self):
-        self.cursor.execute('''SELECT * FROM Users''')
-        return self.cursor.fetchall()
+    async def start(self) -> None:
+        # the connection and the table are created in the db thread, not on import
+        await self.run(lambda conn: None)
+
+    async def close(self):
+        await wrap_future(self.executor.submit(self._close))
+        self.executor.shutdown(wait=False)
+
+    def _close(self) -> None:
+        # the connection is not opened if the db was never used
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+    async def get_all_users(self):
+        return await self.run(_get_all_users)
+
+
+# statements, executed in the db thread
+def _insert_user(conn: sqlite3.Connection, tgid: str, token: str) -> None:
+    # re-authorization replaces the token in one statement
+    conn.execute('''
+    INSERT OR REPLACE INTO Users (tgid, token) VALUES (?, ?)
+    ''', (tgid, token,))
+    conn.commit()
+
+
+def _get_token(conn: sqlite3.Connection, tgid: str) -> str | None:
+    result = conn.execute('''
+    SELECT * FROM Users WHERE tgid == ?
+    ''', (tgid,)).fetchone()
+    if result is None:
+        return None
+    return result[1]
+
+
+def _delete_user(conn: sqlite3.Connection, tgid: str) -> None:
+    conn.execute('''
+    DELETE FROM Users WHERE tgid == ?
+    ''', (tgid,))
+    conn.commit()
+
+
+def _create_table(conn: sqlite3.Connection) -> None:
+    # Создаем таблицу Users
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS Users (
+    tgid TEXT PRIMARY KEY,
+    token TEXT NOT NULL
+    )
+    ''')
+    # Сохраняем изменения
+    conn.commit()
+
+
+def _get_all_users(conn: sqlite3.Connection) -> list[tuple]:
+    return conn.execute('''SELECT * FROM Users''').fetchall()
 
 
 def create_database(path: str) -> UserTokensDB:
-    try:
-        db = UserTokensDB(path)
-        db.create_table()
-        return db
-    except sqlite3.OperationalError:
-        logger.msg("ERROR", f"Please create directory for the database: {path}")
-        raise BaseException(f"Please create directory for the database: {path}")
+    # nothing is opened here, see UserTokensDB.start
+    return UserTokensDB(path)
+
+
+def create_user_tokens_db() -> UserTokensDB | PostgresUserTokensDB:
+    if cf.USER_TOKENS_BACKEND == "postgres":
+        return PostgresUserTokensDB(pg_pool)
+    return create_database(cf.USER_TOKENS_DB_PATH)
 
 
-user_tokens_db = create_database(cf.USER_TOKENS_DB_PATH)
+user_tokens_db = create_user_tokens_db()
 
 
-def get_user_tokens_db() -> UserTokensDB | None:
+def get_user_tokens_db() -> UserTokensDB | PostgresUserTokensDB | None:
     global user_tokens_db
     return user_tokens_db
@@ -0,0 +1,84 @@
+from cachetools import TTLCache
+
+from src.util.db.postgres import PostgresPool
+from src.util.log import logger
+import config as cf
+
+
+class PostgresUserTokensDB:
+    # same interface as UserTokensDB, the tokens are shared by all bot instances behind one database
+    pool: PostgresPool
+    # tgid -> token, only found tokens; other instances change the table, so entries live a few seconds
+    tokens: TTLCache
+
+    def __init__(self, pool: PostgresPool) -> None:
+        self.pool = pool
+        self.tokens = TTLCache(maxsize=cf.USER_TOKENS_CACHE_SIZE, ttl=cf.USER_TOKENS_CACHE_TTL)
+
+    async def start(self) -> None:
+        await self.create_table()
+
+    async def create_table(self) -> None:
+        conn = await self.pool.acquire()
+        try:
+            await conn.execute('''
+            CREATE TABLE IF NOT EXISTS user_tokens (
+            tgid TEXT PRIMARY KEY,
+            token TEXT NOT NULL
+            )
+            ''')
+        finally:
+            await self.pool.release(conn)
+
+    async def insert_user(self, tgid: str, token: str) -> None:
+        conn = await self.pool.acquire()
+        try:
+            await conn.execute('''
+            INSERT INTO user_tokens (tgid, token) VALUES ($1, $2)
+            ON CONFLICT (tgid) DO UPDATE SET token = $2
+            ''', tgid, token)
+        finally:
+            await self.pool.release(conn)
+        self.tokens[tgid] = token
+
+    async def get_token(self, tgid: str) -> str | None:
+        token = self.tokens.get(tgid)
+        if token is not None:
+            return token
+        conn = await self.pool.acquire()
+        try:
+            token = await conn.fetchval('''SELECT token FROM user_tokens WHERE tgid = $1''', tgid)
+        finally:
+            await self.pool.release(conn)
+        # users without a token are not cached, they are looked up again after authorization elsewhere
+        if token is not None:
+            self.tokens[tgid] = token
+        return token
+
+    async def has_tgid(self, tgid: str) -> bool:
+        return await self.get_token(tgid) is not None
+
+    async def delete_user(self, tgid: str) -> None:
+        conn = await self.pool.acquire()
+        try:
+            await conn.execute('''DELETE FROM user_tokens WHERE tgid = $1''', tgid)
+        finally:
+            await self.pool.release(conn)
+        self.tokens.pop(tgid, None)
+
+    async def get_all_users(self) -> list[tuple]:
+        conn = await self.pool.acquire()
+        try:
+            rows = await conn.fetch('''SELECT tgid, token FROM user_tokens''')
+        finally:
+            await self.pool.release(conn)
+        return [tuple(row) for row in rows]
+
+    async def warm_up(self) -> None:
+        users = await self.get_all_users()
+        self.tokens.update({tgid: token for tgid, token in users})
+        logger.info(f"User tokens loaded: {len(users)}")
+
+    async def close(self) -> None:
+        # the pool is shared and closed by its owner
+        pass
@@ -0,0 +1,137 @@
+from asyncio import Lock
+from collections.abc import Awaitable, Callable
+from typing import Any
+from weakref import WeakValueDictionary
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.types import TelegramObject
+
+from src.util.log import logger
+
+
+class FSMSnapshot(FSMContext):
+    # handlers work on an in-memory copy of the FSM data, the storage is read on first use and written once in flush
+    data: dict[str, Any] | None
+    # the data is written only if a key was set or removed
+    dirty: set[str]
+    # lock of this user's FSM key, held from the read to the write: two updates of one user
+    # would otherwise both read the same data and the later write would drop the changes of the other
+    lock: Lock
+    holds_lock: bool
+    loaded_state: str | None
+    state: str | None
+    reads: int
+    writes: int
+
+    def __init__(self, context: FSMContext, raw_state: str | None, lock: Lock) -> None:
+        super().__init__(storage=context.storage, key=context.key)
+        self.data = None
+        self.dirty = set()
+        self.lock = lock
+        self.holds_lock = False
+        # the dispatcher has already read the state for the state filters
+        self.loaded_state = raw_state
+        self.state = raw_state
+        self.reads = 0
+        self.writes = 0
+
+    async def load(self) -> dict[str, Any]:
+        if self.data is None:
+            await self.lock.acquire()
+            self.holds_lock = True
+            self.data = await self.storage.get_data(key=self.key)
+            self.reads += 1
+        return self.data
+
+    async def get_data(self) -> dict[str, Any]:
+        return (await self.load()).copy()
+
+    async def get_value(self, key: str, default: Any | None = None) -> Any | None:
+        return (await self.load()).get(key, default)
+
+    async def set_data(self, data: dict[str, Any]) -> None:
+        self.dirty.update(await self.load(), data)
+        self.data = data.copy()
+
+    async def update_data(self, data: dict[str, Any] | None = None, **kwargs: Any) -> dict[str, Any]:
+        if data:
+            kwargs.update(data)
+        (await self.load()).update(kwargs)
+        self.dirty.update(kwargs)
+        return self.data.copy()
+
+    async def get_state(self) -> str | None:
+        return self.state
+
+    async def set_state(self, state: str | State | None = None) -> None:
+        self.state = state.state if isinstance(state, State) else state
+
+    async def flush(self) -> None:
+        try:
+            if self.dirty:
+                # the loaded data with the changes: no other update of this user has written since, see lock
+                await self.storage.set_data(key=self.key, data=self.data)
+                self.writes += 1
+                self.dirty.clear()
+        finally:
+            if self.holds_lock:
+                self.lock.release()
+                self.holds_lock = False
+        if self.state != self.loaded_state:
+            await self.storage.set_state(key=self.key, state=self.state)
+            self.writes += 1
+            self.loaded_state = self.state
+
+
+class FSMSnapshotMiddleware(BaseMiddleware):
+    # one FSM read per update and one write of the changed keys instead of a round trip per get_data/update_data
+    # FSM key -> lock of the updates that use its data, dropped when no update holds it
+    locks: WeakValueDictionary[StorageKey, Lock]
+    updates: int
+    reads: int
+    writes: int
+
+    def __init__(self) -> None:
+        self.locks = WeakValueDictionary()
+        self.updates = 0
+        self.reads = 0
+        self.writes = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        context = data.get("state")
+        if context is None or isinstance(context, FSMSnapshot):
+            return await handler(event, data)
+
+        lock = self.locks.get(context.key)
+        if lock is None:
+            lock = self.locks[context.key] = Lock()
+        snapshot = FSMSnapshot(context, data.get("raw_state"), lock)
+        data["state"] = snapshot
+        try:
+            return await handler(event, data)
+        finally:
+            # changes made before an error were saved before as well
+            await snapshot.flush()
+            self.updates += 1
+            self.reads += snapshot.reads
+            self.writes += snapshot.writes
+            logger.debug(f"FSM: user {snapshot.key.user_id} storage ops: reads={snapshot.reads}, writes={snapshot.writes}")
+
+    def stats(self) -> dict:
+        return {
+            "updates": self.updates,
+            "reads": self.reads,
+            "writes": self.writes,
+            "ops_per_update": (self.reads + self.writes) / self.updates if self.updates else 0.0,
+        }
+
+
+fsm_snapshot_middleware = FSMSnapshotMiddleware()
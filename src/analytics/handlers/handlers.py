@@ -1,12 +1,15 @@
 
 from aiogram import Router, F
 from aiogram.types import CallbackQuery, Message
+from aiogram.filters import StateFilter
 from aiogram.fsm.context import FSMContext
 
 from .layout_util import next_step, repeat_current_step
 from .types.msg_data import MsgData
 from .states import AnalyticReportStates
-from .msg.messages import recommendations_msg, parameters_msg
+from .msg.messages import recommendations_msg, parameters_msg, department_page_msg, text_page_msg
+from .msg.department_kb import DEPARTMENTS_PAGE_PREFIX, DEPARTMENTS_SEARCH_RESET, DEPARTMENTS_PAGE_NUMBER
+from .msg.text_pages import TEXT_PAGE_PREFIX, TEXT_PAGE_NUMBER, parse_text_page
 
 from src.util.log import logger
 
@@ -26,18 +29,60 @@ async def clear_report_state_data(state: FSMContext) -> None:
     await state.set_state(None)
 
 
-@router.callback_query(AnalyticReportStates.value_input)
+# department keyboard handlers, registered before value_input_handler which takes any callback as a value
+@router.callback_query(AnalyticReportStates.department_input, F.data.startswith(DEPARTMENTS_PAGE_PREFIX))
+async def departments_page_handler(query: CallbackQuery, state: FSMContext) -> None:
+    page = int(query.data.removeprefix(DEPARTMENTS_PAGE_PREFIX))
+    await department_page_msg(MsgData(msg=query.message, state=state, tgid=query.from_user.id), page=page)
+    await query.answer()
+
+
+@router.callback_query(AnalyticReportStates.department_input, F.data == DEPARTMENTS_SEARCH_RESET)
+async def departments_search_reset_handler(query: CallbackQuery, state: FSMContext) -> None:
+    await state.update_data({"report:departments_query": None})
+    await department_page_msg(MsgData(msg=query.message, state=state, tgid=query.from_user.id), page=0)
+    await query.answer()
+
+
+@router.callback_query(AnalyticReportStates.department_input, F.data == DEPARTMENTS_PAGE_NUMBER)
+async def departments_page_number_handler(query: CallbackQuery) -> None:
+    await query.answer()
+
+
+@router.message(AnalyticReportStates.department_input, F.text)
+async def departments_search_handler(message: Message, state: FSMContext) -> None:
+    await state.update_data({"report:departments_query": message.text.strip()})
+    await message.delete()
+    await department_page_msg(MsgData(msg=message, state=state, tgid=message.from_user.id), page=0)
+
+
+# text report pages, in any state: the report stays in the chat while the user goes on
+@router.callback_query(F.data.startswith(TEXT_PAGE_PREFIX))
+async def text_page_handler(query: CallbackQuery) -> None:
+    token, page = parse_text_page(query.data)
+    if not await text_page_msg(query.message, token, page):
+        await query.answer("Отчёт устарел, сформируйте его заново", show_alert=True)
+        return
+    await query.answer()
+
+
+@router.callback_query(F.data == TEXT_PAGE_NUMBER)
+async def text_page_number_handler(query: CallbackQuery) -> None:
+    await query.answer()
+
+
+@router.callback_query(StateFilter(AnalyticReportStates.value_input, AnalyticReportStates.department_input))
 async def value_input_handler(query: CallbackQuery, state: FSMContext) -> None:
     state_data = await state.get_data()
 
     key: str = state_data["report:input"]
     value: str = query.data
-    await state.update_data({key: value})
+    update = {key: value, "report:input": None}
 
     if key == "report:branch":
-        await state.update_data({"report:type": value, "report:step": -1})
+        update.update({"report:type": value, "report:step": -1})
 
-    await state.update_data({"report:input": None})
+    await state.update_data(update)
     await state.set_state(None)
 
     await next_step(MsgData(msg=query.message, state=state, tgid=query.from_user.id))
@@ -1,7 +1,11 @@
+from functools import partial
+
 from ..handlers.types.msg_data import MsgData
 from ..constant.layout import layout
+from ..prefetch import report_prefetcher
 
 from src.util.log import logger
+from src.util.telegram.send_queue import send_queue
 
 
 def get_msg_func(step: int, branch: str) -> callable:
@@ -10,14 +14,15 @@ def get_msg_func(step: int, branch: str) -> callable:
 
 async def enter_step(msg_data: MsgData, step: int, branch: str) -> None:
     logger.debug(f"STEP: user tgid={msg_data.tgid} entering: {branch=}, {step=}")
+    # prefetched reports are useless once the user leaves the branch
+    report_prefetcher.cancel(msg_data.tgid, keep_branch=branch)
     state_data = await msg_data.state.get_data()
     
     messages_to_delete = state_data.get("report:messages_to_delete")
     if messages_to_delete is not None and messages_to_delete:
-        await msg_data.msg.bot.delete_messages(chat_id=msg_data.tgid, message_ids=messages_to_delete)
-    await msg_data.state.update_data({"report:messages_to_delete": []})
-    
-    await msg_data.state.update_data({"report:branch": branch, "report:step": step})
+        # old report messages are removed in the background, the next step does not wait for it
+        send_queue.post(msg_data.tgid, partial(msg_data.msg.bot.delete_messages, chat_id=msg_data.tgid, message_ids=messages_to_delete))
+    await msg_data.state.update_data({"report:messages_to_delete": [], "report:branch": branch, "report:step": step})
     msg_func = get_msg_func(step, branch)
     await msg_func(msg_data)
 
@@ -0,0 +1,64 @@
+from math import ceil
+
+from aiogram.types import InlineKeyboardMarkup as IKM, InlineKeyboardButton as IKB
+from cachetools import LRUCache
+
+import config as cf
+
+
+DEPARTMENTS_PAGE_PREFIX = "report:departments_page:"
+DEPARTMENTS_SEARCH_RESET = "report:departments_search_reset"
+# no-op button with the page number
+DEPARTMENTS_PAGE_NUMBER = "report:departments_page_number"
+
+# (departments of the user, search query, page) -> (keyboard, pages count),
+# the departments themselves are the key: users of one network may see different departments
+department_pages_cache: LRUCache = LRUCache(maxsize=cf.DEPARTMENTS_PAGES_CACHE_SIZE)
+
+
+def department_name(name: str) -> str:
+    # names are numbered by the backend: "1.Рогалик Центр"
+    return name.split('.')[-1]
+
+
+def filter_departments(departments: dict[str, str], query: str | None) -> list[tuple[str, str]]:
+    items = list(departments.items())
+    # the whole network is the most common choice and stays on the first page
+    items.sort(key=lambda item: item[0] != "all_departments")
+    if not query:
+        return items
+    query = query.lower()
+    result = []
+    for _id, _name in items:
+        name = department_name(_name).lower()
+        # the query may start at any word of the name: "точка 2" finds "Рогалик Точка 2"
+        word_starts = [0] + [i + 1 for i, char in enumerate(name) if char == " "]
+        if any(name.startswith(query, i) for i in word_starts):
+            result.append((_id, _name))
+    return result
+
+
+def make_departments_kb(departments: dict[str, str], page: int, query: str | None) -> tuple[IKM, int]:
+    key = (tuple(departments.items()), query, page)
+    cached = department_pages_cache.get(key)
+    if cached is not None:
+        return cached
+
+    items = filter_departments(departments, query)
+    pages = max(1, ceil(len(items) / cf.DEPARTMENTS_PAGE_SIZE))
+    page = min(max(page, 0), pages - 1)
+    page_items = items[page * cf.DEPARTMENTS_PAGE_SIZE:(page + 1) * cf.DEPARTMENTS_PAGE_SIZE]
+
+    kb = [[IKB(text=_name, callback_data=_id)] for _id, _name in page_items]
+    if pages > 1:
+        kb.append([
+            IKB(text="◀️", callback_data=f"{DEPARTMENTS_PAGE_PREFIX}{(page - 1) % pages}"),
+            IKB(text=f"{page + 1}/{pages}", callback_data=DEPARTMENTS_PAGE_NUMBER),
+            IKB(text="▶️", callback_data=f"{DEPARTMENTS_PAGE_PREFIX}{(page + 1) % pages}"),
+        ])
+    if query:
+        kb.append([IKB(text="Сбросить поиск ✖️", callback_data=DEPARTMENTS_SEARCH_RESET)])
+
+    result = IKM(inline_keyboard=kb), pages
+    department_pages_cache[key] = result
+    return result
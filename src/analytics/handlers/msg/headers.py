@@ -1,41 +1,56 @@
-from aiogram.utils.formatting import Bold, Text, as_marked_section, as_key_value
+from cachetools import LRUCache
 
 from ..types.msg_data import MsgData
-from ...constant.variants import all_departments, all_branches, all_types, all_periods
+from ...api_util import get_user_scope
+from ...cache import department_directory
+from ...constant.variants import all_branches, all_types, all_periods
+import config as cf
 
-# make header
-async def make_header(msg_data: MsgData) -> str:
-    state_data = await msg_data.state.get_data()
-    
+
+# (token scope, directory version, department, branch, type, period) -> rendered header
+header_cache: LRUCache = LRUCache(maxsize=cf.HEADER_CACHE_SIZE)
+
+
+def render_header(department: str | None, branch: str | None, report_type: str | None, period: str | None) -> str:
     headers = []
-    
-    department = state_data.get("report:department")
-    branch = state_data.get("report:branch")
-    report_type = state_data.get("report:type")
-    period = state_data.get("report:period")
-    
-    assert msg_data.tgid is not None, "tgid is not specified"
-    
-    department = (await all_departments(msg_data.tgid)).get(department)
+
     branch = all_branches.get(branch)
     report_type = all_types.get(report_type)
     period = all_periods.get(period)
-    
+
     if department is not None:
         headers.append(f"<code>Объект:</code> <b>{department.split('.')[-1]}</b>")
-        
+
     if report_type is None and branch is not None:
         headers.append(f"<code>Отчёт:</code> <b>{branch}</b>")
-        
+
     if report_type is not None:
         headers.append(f"<code>Отчёт:</code> <b>{report_type}</b>")
-        
+
     if period is not None:
         headers.append(f"<code>Период:</code> <b>{period}</b>")
-        
+
     return "\n".join(headers)
-    
-    
-    
-    
-    
\ No newline at end of file
+
+
+# make header
+async def make_header(msg_data: MsgData) -> str:
+    state_data = await msg_data.state.get_data()
+
+    assert msg_data.tgid is not None, "tgid is not specified"
+
+    # department names come from the local directory, filled when the departments were requested
+    scope = await get_user_scope(msg_data.tgid)
+
+    department_id = state_data.get("report:department")
+    branch = state_data.get("report:branch")
+    report_type = state_data.get("report:type")
+    period = state_data.get("report:period")
+
+    key = (scope, department_directory.version(scope), department_id, branch, report_type, period)
+    header = header_cache.get(key)
+    if header is None:
+        department = department_directory.get_name(scope, department_id)
+        header = render_header(department, branch, report_type, period)
+        header_cache[key] = header
+    return header
@@ -1,4 +1,8 @@
 import os
+from asyncio import create_task, sleep
+from collections.abc import Iterable, Iterator
+from datetime import datetime
+from functools import partial
 from io import BytesIO
 import pandas as pd
 from fpdf import FPDF
@@ -7,41 +11,70 @@ from aiogram.fsm.context import FSMContext
 from aiogram.types import Message, InlineKeyboardMarkup as IKM, InlineKeyboardButton as IKB
 from aiogram import Router
 from aiogram.enums.parse_mode import ParseMode
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.utils.text_decorations import html_decoration as html
 
 from .msg_util import set_input_state, make_kb, make_kb_report_menu, back_current_step_btn, add_messages_to_delete
 from ..types.msg_data import MsgData
 from .headers import make_header
+from .department_kb import make_departments_kb
+from .text_pages import TextPages, new_text_pages, paginate, make_text_pages_kb, text_pages_cache
 from ...api import get_reports  # Ensure this function exists in api.py
+from ...prefetch import report_prefetcher
+from ...auth.tokens import TokenExpiredError
 from ...constant.variants import all_departments, all_branches, all_types, all_periods, all_menu_buttons
 from ...constant.text.recommendations import recommendations
 from ..states import AnalyticReportStates
-from ...constant.text.texts import text_functions, TextData
+from ...constant.text.texts import text_sections, TextData
 import config as cf
+from src.util.log import logger
+from src.util.telegram.send_queue import send_queue, send_queue_middleware, Priority
 
 from aiogram import Bot
 
 # Create bot and router instance (Dispatcher not used)
 bot = Bot(token=cf.TOKEN)
+bot.session.middleware(send_queue_middleware)
 router = Router()
 
 
 # msg functions
 async def department_msg(msg_data: MsgData) -> None:
-    await set_input_state(msg_data.state, "report:department")
+    await set_input_state(msg_data.state, "report:department", AnalyticReportStates.department_input)
+    # search results are shown in this message, the search text comes in a separate one
+    await msg_data.state.update_data({"report:departments_query": None, "report:departments_msg_id": msg_data.msg.message_id})
+    await department_page_msg(msg_data, page=0)
 
+
+async def department_page_msg(msg_data: MsgData, page: int) -> None:
     assert msg_data.tgid is not None, "tgid not specified"
     departments = await all_departments(msg_data.tgid)
 
-    print("Полученные подразделения:", departments)  # Отладочный вывод
+    state_data = await msg_data.state.get_data()
+    message_id = state_data.get("report:departments_msg_id") or msg_data.msg.message_id
 
     if not departments:
-        await msg_data.msg.edit_text("Нет доступных подразделений.")
+        await msg_data.msg.bot.edit_message_text(chat_id=msg_data.msg.chat.id, message_id=message_id, text="Нет доступных подразделений.")
         return
 
+    query = state_data.get("report:departments_query")
+    kb, pages = make_departments_kb(departments, page, query)
+
     header = await make_header(msg_data) + "\n\n"
-    text = header + "Выберите подразделение"
-    kb = make_kb(departments)
-    await msg_data.msg.edit_text(text=text, reply_markup=kb)
+    if query:
+        text = header + f"Поиск: <b>{html.quote(query)}</b>\nВыберите подразделение"
+    else:
+        text = header + "Выберите подразделение"
+    if pages > 1 or query:
+        text += "\n\n<i>Для поиска отправьте начало названия</i>"
+    try:
+        # fast page clicks and search messages edit the same message, pending edits are sent once
+        edit = partial(msg_data.msg.bot.edit_message_text, chat_id=msg_data.msg.chat.id, message_id=message_id, text=text, reply_markup=kb)
+        await send_queue.edit(msg_data.msg.chat.id, message_id, edit)
+    except TelegramBadRequest as e:
+        # the same page again (e.g. the only page of the search results)
+        if "message is not modified" not in e.message:
+            raise
 
 
 async def branch_msg(msg_data: MsgData) -> None:
@@ -74,6 +107,10 @@ async def period_msg(msg_data: MsgData, period_indexes: list[int]) -> None:
     kb = make_kb(all_periods, period_indexes)
     await msg_data.msg.edit_text(text=text, reply_markup=kb)
 
+    period_keys = list(all_periods)
+    periods = [period_keys[i] for i in period_indexes]
+    report_prefetcher.start(msg_data.tgid, await msg_data.state.get_data(), periods)
+
 
 async def menu_msg(msg_data: MsgData, buttons_indexes: list[int]) -> None:
     header = await make_header(msg_data) + "\n\n"
@@ -96,11 +133,19 @@ async def test_msg(msg_data: MsgData) -> None:
 
 
 # Menu messages
+def as_of_text(timestamp: float) -> str:
+    as_of = datetime.fromtimestamp(timestamp, tz=cf.TIMEZONE)
+    if as_of.date() == datetime.now(tz=cf.TIMEZONE).date():
+        return f"<i>⚠️ Сервер недоступен, данные на {as_of:%H:%M}</i>"
+    return f"<i>⚠️ Сервер недоступен, данные на {as_of:%d.%m %H:%M}</i>"
+
+
 async def parameters_msg(msg_data: MsgData) -> None:
     state_data = await msg_data.state.get_data()
 
     report_type = state_data.get("report:type")
     period = state_data.get("report:period")
+    report_prefetcher.record_usage(state_data.get("report:department"), report_type, period)
 
     loading_msg = await msg_data.msg.edit_text(text="Загрузка ⏳")
 
@@ -117,10 +162,12 @@ async def parameters_msg(msg_data: MsgData) -> None:
             return
 
         header = await make_header(msg_data)
+        if reports.as_of is not None:
+            header += "\n\n" + as_of_text(reports.as_of)
         header_msg = await msg_data.msg.answer(text=header)
 
-        text_func = text_functions[report_type]
-        text_msg = await msg_data.msg.answer(text=text_func(TextData(reports=reports, period=period)))
+        sections = text_sections[report_type](TextData(reports=reports, period=period))
+        text_msg = await text_report_msg(msg_data, sections)
 
         await add_messages_to_delete(msg_data=msg_data, messages=[header_msg, text_msg])
 
@@ -131,10 +178,63 @@ async def parameters_msg(msg_data: MsgData) -> None:
         # After loading the reports, ask the user to choose the format
         await report_type_selection(msg_data)
 
+    except TokenExpiredError:
+        # re-authorization prompt is sent by the error handler in authorization.py
+        await loading_msg.delete()
+        raise
     except Exception as e:
         await loading_msg.edit_text(text=f"Ошибка: {str(e)}", reply_markup=back_kb)
 
 
+async def text_report_msg(msg_data: MsgData, sections: Iterable[str]) -> Message:
+    # the first page is sent as soon as it is full, the rest are rendered in the background and shown by the buttons
+    token, text_pages = new_text_pages()
+    pages = paginate(sections)
+
+    page, last = next(pages)
+    text_pages.pages.append(page)
+    text_pages.complete = last
+    text_msg = await msg_data.msg.answer(text=page, reply_markup=make_text_pages_kb(token, 0, text_pages))
+    if not last:
+        # the handler goes on, the task is kept by the pages so it is not garbage collected
+        text_pages.task = create_task(render_text_pages(text_msg, token, text_pages, pages))
+    return text_msg
+
+
+async def render_text_pages(text_msg: Message, token: str, text_pages: TextPages, pages: Iterator[tuple[str, bool]]) -> None:
+    try:
+        for page, _last in pages:
+            await text_pages.add_page(page)
+            # let other updates go between the pages of a long report
+            await sleep(0)
+    except Exception as e:
+        logger.msg("ERROR", f"Could not render text report pages: {token=}: {e!r}")
+    finally:
+        # the pages rendered so far stay available if the rest failed
+        await text_pages.finish()
+
+    # the number of pages is known now
+    edit = partial(text_msg.edit_reply_markup, reply_markup=make_text_pages_kb(token, 0, text_pages))
+    send_queue.post(text_msg.chat.id, edit, priority=Priority.INTERACTIVE)
+
+
+async def text_page_msg(msg: Message, token: str, page: int) -> bool:
+    text_pages = text_pages_cache.get(token)
+    if text_pages is None:
+        return False
+
+    await text_pages.wait_page(page)
+    page = min(page, len(text_pages.pages) - 1)
+
+    edit = partial(msg.edit_text, text=text_pages.pages[page], reply_markup=make_text_pages_kb(token, page, text_pages))
+    try:
+        await send_queue.edit(msg.chat.id, msg.message_id, edit)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in e.message:
+            raise
+    return True
+
+
 async def recommendations_msg(msg_data: MsgData) -> None:
     state_data = await msg_data.state.get_data()
 
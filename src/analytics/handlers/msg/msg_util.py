@@ -1,19 +1,29 @@
+from functools import lru_cache
+
 from aiogram.types import Message, InlineKeyboardMarkup as IKM, InlineKeyboardButton as IKB
 from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
 from ..states import AnalyticReportStates
 from ..types.msg_data import MsgData
+import config as cf
 
 
 # util
-def make_kb(all_choices: dict[str, str], indexes: list[int] = []) -> IKM:
+@lru_cache(maxsize=cf.KEYBOARD_CACHE_SIZE)
+def _make_kb(choices: tuple[tuple[str, str], ...], indexes: tuple[int, ...]) -> IKM:
     if indexes:
-        items = list(all_choices.items())
-        all_choices = {items[i][0]: items[i][1] for i in range(len(items)) if i in indexes}
+        indexes = set(indexes)
+        choices = tuple(item for i, item in enumerate(choices) if i in indexes)
 
-    kb = [[IKB(text=_name, callback_data=_id)] for _id, _name in all_choices.items()]
+    kb = [[IKB(text=_name, callback_data=_id)] for _id, _name in choices]
     return IKM(inline_keyboard=kb)
 
 
+def make_kb(all_choices: dict[str, str], indexes: list[int] = []) -> IKM:
+    # keyboards are built once per (choices, indexes) and reused, aiogram does not change them on send
+    return _make_kb(tuple(all_choices.items()), tuple(indexes))
+
+
 def make_kb_report_menu(buttons: list[IKB], indexes: list[int] = []) -> IKM:
     if indexes:
         buttons = [buttons[i] for i in range(len(buttons)) if i in indexes]
@@ -32,8 +42,8 @@ async def add_messages_to_delete(msg_data: MsgData, messages: list) -> None:
 
 
 # state functions
-async def set_input_state(state: FSMContext, input_key: str) -> None:
-    await state.set_state(AnalyticReportStates.value_input)
+async def set_input_state(state: FSMContext, input_key: str, input_state: State = AnalyticReportStates.value_input) -> None:
+    await state.set_state(input_state)
     await state.update_data({"report:input": input_key})
     
        
@@ -0,0 +1,127 @@
+import re
+from asyncio import Condition, Task
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
+from secrets import token_hex
+
+from aiogram.types import InlineKeyboardMarkup as IKM, InlineKeyboardButton as IKB
+from cachetools import TTLCache
+
+import config as cf
+
+
+TEXT_PAGE_PREFIX = "report:text_page:"
+# no-op button with the page number
+TEXT_PAGE_NUMBER = "report:text_page_number"
+
+
+@dataclass(slots=True)
+class TextPages:
+    pages: list[str] = field(default_factory=list)
+    # False while the rest of the report is still rendered
+    complete: bool = False
+    # notified on every new page and when the rendering ends
+    changed: Condition = field(default_factory=Condition)
+    # renders the pages after the first one
+    task: Task | None = None
+
+    async def add_page(self, page: str) -> None:
+        async with self.changed:
+            self.pages.append(page)
+            self.changed.notify_all()
+
+    async def finish(self) -> None:
+        async with self.changed:
+            self.complete = True
+            self.changed.notify_all()
+
+    async def wait_page(self, page: int) -> None:
+        # "next page" of a report that is still rendered waits for the page or for the end of the report
+        async with self.changed:
+            await self.changed.wait_for(lambda: page < len(self.pages) or self.complete)
+
+
+# token from the buttons -> pages of a sent text report
+text_pages_cache: TTLCache = TTLCache(maxsize=cf.TEXT_PAGES_CACHE_SIZE, ttl=cf.TEXT_PAGES_CACHE_TTL)
+
+
+def new_text_pages() -> tuple[str, TextPages]:
+    token = token_hex(4)
+    text_pages = TextPages()
+    text_pages_cache[token] = text_pages
+    return token, text_pages
+
+
+def text_length(text: str) -> int:
+    # telegram counts utf-16 code units
+    return len(text.encode("utf-16-le")) // 2
+
+
+def cut_text(text: str, limit: int) -> Iterator[str]:
+    # parts of at most limit utf-16 code units, characters are never split
+    part = ""
+    length = 0
+    for char in text:
+        char_length = text_length(char)
+        if length + char_length > limit:
+            yield part
+            part = ""
+            length = 0
+        part += char
+        length += char_length
+    if part:
+        yield part
+
+
+def split_section(section: str, limit: int) -> Iterator[str]:
+    # a section longer than a page is split on lines, a line longer than a page on words, a word longer than a page is cut;
+    # paginate joins the parts back into pages of up to limit
+    if text_length(section) <= limit:
+        yield section
+        return
+    for line in section.splitlines(keepends=True):
+        if text_length(line) <= limit:
+            yield line
+            continue
+        # the spaces stay at the end of the words
+        for word in re.split(r"(?<=\s)(?=\S)", line):
+            if text_length(word) <= limit:
+                yield word
+            else:
+                yield from cut_text(word, limit)
+
+
+def paginate(sections: Iterable[str], limit: int = cf.TEXT_PAGE_LIMIT) -> Iterator[tuple[str, bool]]:
+    # (page, is last) as soon as a page is full: the next section does not fit into it
+    parts = []
+    length = 0
+    for section in sections:
+        for part in split_section(section, limit):
+            part_length = text_length(part)
+            if length + part_length > limit and "".join(parts).strip():
+                yield "".join(parts), False
+                parts = []
+                length = 0
+            parts.append(part)
+            length += part_length
+    page = "".join(parts)
+    yield page if page.strip() else "Нет данных", True
+
+
+def make_text_pages_kb(token: str, page: int, text_pages: TextPages) -> IKM | None:
+    pages = len(text_pages.pages)
+    if not text_pages.complete:
+        # the rest is still rendered, only the next page is known to exist
+        return IKM(inline_keyboard=[[IKB(text="Следующая страница ▶️", callback_data=f"{TEXT_PAGE_PREFIX}{token}:{page + 1}")]])
+    if pages == 1:
+        return None
+    return IKM(inline_keyboard=[[
+        IKB(text="◀️", callback_data=f"{TEXT_PAGE_PREFIX}{token}:{(page - 1) % pages}"),
+        IKB(text=f"{page + 1}/{pages}", callback_data=TEXT_PAGE_NUMBER),
+        IKB(text="▶️", callback_data=f"{TEXT_PAGE_PREFIX}{token}:{(page + 1) % pages}"),
+    ]])
+
+
+def parse_text_page(data: str) -> tuple[str, int]:
+    token, _, page = data.removeprefix(TEXT_PAGE_PREFIX).partition(":")
+    return token, int(page)
@@ -4,3 +4,5 @@ from aiogram.fsm.state import State, StatesGroup
 
 class AnalyticReportStates(StatesGroup):
     value_input = State()
+    # value_input of the department, text messages search departments by name
+    department_input = State()
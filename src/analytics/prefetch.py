@@ -0,0 +1,73 @@
+from asyncio import Semaphore, Task, create_task
+from collections import Counter
+from weakref import WeakValueDictionary
+
+from .api import get_reports
+from src.util.log import logger
+import config as cf
+
+
+# department (or "all_departments"), report type
+UsageKey = tuple[str | None, str | None]
+
+
+class ReportPrefetcher:
+    # warms the report cache for the most used periods while the user is still choosing one
+    semaphore: Semaphore
+    periods_count: int
+    usage: dict[UsageKey, Counter]
+    tasks: dict[int, tuple[str, list[Task]]]
+    # tgid -> semaphore of the user's prefetches, they never take the slots of the user's own requests
+    user_semaphores: WeakValueDictionary[int, Semaphore]
+
+    def __init__(self, concurrency: int, periods_count: int) -> None:
+        self.semaphore = Semaphore(concurrency)
+        self.periods_count = periods_count
+        self.usage = {}
+        self.tasks = {}
+        self.user_semaphores = WeakValueDictionary()
+
+    def record_usage(self, department: str | None, report_type: str | None, period: str) -> None:
+        self.usage.setdefault((department, report_type), Counter())[period] += 1
+
+    def likely_periods(self, department: str | None, report_type: str | None, periods: list[str]) -> list[str]:
+        usage = self.usage.get((department, report_type), Counter())
+        # sorted is stable, so periods without usage keep the keyboard order
+        return sorted(periods, key=lambda period: -usage[period])[:self.periods_count]
+
+    def get_user_semaphore(self, tgid: int) -> Semaphore:
+        semaphore = self.user_semaphores.get(tgid)
+        if semaphore is None:
+            semaphore = Semaphore(cf.PREFETCH_REQUESTS_PER_USER)
+            self.user_semaphores[tgid] = semaphore
+        return semaphore
+
+    def start(self, tgid: int, state_data: dict, periods: list[str]) -> None:
+        self.cancel(tgid)
+
+        branch = state_data.get("report:branch")
+        department = state_data.get("report:department")
+        report_type = state_data.get("report:type")
+        tasks = [
+            create_task(self.prefetch(tgid, {**state_data, "report:period": period}))
+            for period in self.likely_periods(department, report_type, periods)
+        ]
+        self.tasks[tgid] = (branch, tasks)
+
+    def cancel(self, tgid: int, keep_branch: str | None = None) -> None:
+        branch, tasks = self.tasks.get(tgid, (None, []))
+        if keep_branch is not None and branch == keep_branch:
+            return
+        for task in tasks:
+            task.cancel()
+        self.tasks.pop(tgid, None)
+
+    async def prefetch(self, tgid: int, state_data: dict) -> None:
+        try:
+            async with self.semaphore:
+                await get_reports(tgid, state_data, semaphore=self.get_user_semaphore(tgid))
+        except Exception as e:
+            logger.debug(f"Prefetch failed: {tgid=}, period={state_data.get('report:period')}: {e!r}")
+
+
+report_prefetcher = ReportPrefetcher(concurrency=cf.PREFETCH_CONCURRENCY, periods_count=cf.PREFETCH_PERIODS)
@@ -0,0 +1,122 @@
+from asyncio import sleep, wait_for
+from collections.abc import Awaitable, Callable
+from random import uniform
+from time import monotonic
+from typing import Any
+
+from aiohttp import ClientError
+
+from src.util.log import logger
+import config as cf
+
+
+class BackendError(Exception):
+    def __init__(self, status: int) -> None:
+        super().__init__(f"Backend responded with status {status}")
+        self.status = status
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    # closed -> open after failure_threshold failures in a row -> one trial request after reset_timeout
+    name: str
+    failure_threshold: int
+    reset_timeout: float
+    failures: int
+    opened_at: float | None
+    trial_in_progress: bool
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self.trial_in_progress or monotonic() - self.opened_at < self.reset_timeout:
+            return False
+        self.trial_in_progress = True
+        return True
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info(f"Circuit breaker closed: {self.name}")
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_progress = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.trial_in_progress or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.msg("WARNING", f"Circuit breaker opened: {self.name}, failures={self.failures}")
+            self.opened_at = monotonic()
+        self.trial_in_progress = False
+
+    async def call(self, func: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit breaker is open: {self.name}")
+        try:
+            result = await func()
+        except Exception:
+            self.record_failure()
+            raise
+        finally:
+            # a cancelled trial is neither a success nor a failure, the next call may try again
+            self.trial_in_progress = False
+        self.record_success()
+        return result
+
+
+async def retry_with_backoff(func: Callable[[], Awaitable[tuple[int, Any]]], attempts: int, base_delay: float, max_delay: float) -> tuple[int, Any]:
+    # retries network errors and 5xx responses, other statuses are returned to the caller
+    if attempts < 1:
+        raise ValueError(f"attempts must be at least 1, got {attempts}")
+    error = None
+    for attempt in range(attempts):
+        try:
+            status, response = await func()
+            if status < 500:
+                return status, response
+            error = BackendError(status)
+        except (ClientError, TimeoutError) as e:
+            error = e
+
+        if attempt + 1 < attempts:
+            # full jitter, so that clients do not retry in sync
+            await sleep(uniform(0, min(max_delay, base_delay * 2 ** attempt)))
+    raise error
+
+
+circuit_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    breaker = circuit_breakers.get(name)
+    if breaker is None:
+        breaker = CircuitBreaker(name, cf.CIRCUIT_BREAKER_FAILURES, cf.CIRCUIT_BREAKER_RESET_TIMEOUT)
+        circuit_breakers[name] = breaker
+    return breaker
+
+
+async def resilient_call(name: str, func: Callable[[], Awaitable[tuple[int, Any]]]) -> tuple[int, Any]:
+    breaker = get_circuit_breaker(name)
+
+    async def call_with_deadline() -> tuple[int, Any]:
+        return await wait_for(
+            retry_with_backoff(func, cf.REPORT_REQUEST_RETRIES, cf.REPORT_RETRY_BASE_DELAY, cf.REPORT_RETRY_MAX_DELAY),
+            timeout=cf.REPORT_REQUEST_DEADLINE,
+        )
+
+    return await breaker.call(call_with_deadline)
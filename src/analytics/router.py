@@ -3,6 +3,7 @@ from aiogram import Router
 from .auth.authorization import router as authorization_router
 from .handlers.begin import router as begin_router
 from .handlers.handlers import router as handlers_router
+from .fsm_snapshot import fsm_snapshot_middleware
 
 analytics_router = Router(name="analytics")
 
@@ -10,4 +11,6 @@ analytics_router.include_routers(
     authorization_router,
     begin_router,
     handlers_router,
-)
\ No newline at end of file
+)
+analytics_router.message.outer_middleware(fsm_snapshot_middleware)
+analytics_router.callback_query.outer_middleware(fsm_snapshot_middleware)
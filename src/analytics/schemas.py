@@ -0,0 +1,172 @@
+from dataclasses import field
+from typing import Generic, TypeVar
+
+from pydantic import TypeAdapter, ValidationError
+from pydantic.dataclasses import dataclass
+
+from src.util.log import logger
+
+
+# backend numbers are validated once on decode, int is kept as int
+Number = int | float | None
+
+
+@dataclass(slots=True)
+class RevenueRow:
+    label: str | None = None
+    revenue: Number = None
+    revenue_week: Number = None
+    revenue_month: Number = None
+    revenue_year: Number = None
+    revenue_dynamics_week: Number = None
+    revenue_dynamics_month: Number = None
+    revenue_dynamics_year: Number = None
+    revenue_forecast: Number = None
+    # only in sum
+    avg_checks: Number = None
+    avg_revenue: Number = None
+    depth: Number = None
+    potential: Number = None
+    share_of_revenue: Number = None
+
+
+@dataclass(slots=True)
+class LossesRow:
+    label: str | None = None
+    avg_price_current_month: Number = None
+    avg_price_last_month: Number = None
+    avg_price_month_before_last: Number = None
+    avg_price_last_week: Number = None
+    avg_price_week_before_last: Number = None
+    losses_current_month_to_last: Number = None
+    losses_last_month_to_month_before_last: Number = None
+    losses_last_week_to_week_before_last: Number = None
+
+
+@dataclass(slots=True)
+class LossForecastRow:
+    label: str | None = None
+    amount_one_month_ago: Number = None
+    amount_two_month_ago: Number = None
+    amount_three_month_ago: Number = None
+    avg_amount: Number = None
+    avg_price_current_week: Number = None
+    avg_price_one_week_ago: Number = None
+    avg_price_two_week_ago: Number = None
+    avg_price_three_week_ago: Number = None
+    avg_price_four_week_ago: Number = None
+    diff_price: Number = None
+    diff_price2: Number = None
+    diff_price3: Number = None
+    diff_price4: Number = None
+    forecast: Number = None
+
+
+@dataclass(slots=True)
+class TurnoverRow:
+    label: str | None = None
+    expense_day: Number = None
+    turnover_in_days: Number = None
+    turnover_in_days_dynamic_week: Number = None
+    turnover_in_days_dynamic_month: Number = None
+    turnover_in_days_dynamic_year: Number = None
+    turnover_in_days_week: Number = None
+    turnover_in_days_month: Number = None
+    turnover_in_days_year: Number = None
+    remainder_end: Number = None
+
+
+@dataclass(slots=True)
+class InventoryRow:
+    label: str | None = None
+    shortage: Number = None
+    shortage_percent: Number = None
+    surplus: Number = None
+    surplus_percent: Number = None
+    cost_price: Number = None
+
+
+@dataclass(slots=True)
+class FoodCostRow:
+    label: str | None = None
+    food_cost: Number = None
+    food_cost_dynamics_week: Number = None
+    food_cost_dynamics_month: Number = None
+    food_cost_dynamics_year: Number = None
+    food_cost_bar: Number = None
+    food_cost_bar_dynamics_week: Number = None
+    food_cost_bar_dynamics_month: Number = None
+    food_cost_bar_dynamics_year: Number = None
+    food_cost_kitchen: Number = None
+    food_cost_kitchen_dynamics_week: Number = None
+    food_cost_kitchen_dynamics_month: Number = None
+    food_cost_kitchen_dynamics_year: Number = None
+    product_cost: Number = None
+    product_cost_dynamic_week: Number = None
+    product_cost_dynamic_month: Number = None
+    product_cost_dynamic_year: Number = None
+    product_cost_bar: Number = None
+    product_cost_bar_dynamic_week: Number = None
+    product_cost_bar_dynamic_month: Number = None
+    product_cost_bar_dynamic_year: Number = None
+    product_cost_kitchen: Number = None
+    product_cost_kitchen_dynamic_week: Number = None
+    product_cost_kitchen_dynamic_month: Number = None
+    product_cost_kitchen_dynamic_year: Number = None
+    dish_discount: Number = None
+    dish_discount_dynamic_week: Number = None
+    dish_discount_dynamic_month: Number = None
+    dish_discount_dynamic_year: Number = None
+    dish_discount_bar: Number = None
+    dish_discount_bar_dynamic_week: Number = None
+    dish_discount_bar_dynamic_month: Number = None
+    dish_discount_bar_dynamic_year: Number = None
+    dish_discount_kitchen: Number = None
+    dish_discount_kitchen_dynamic_week: Number = None
+    dish_discount_kitchen_dynamic_month: Number = None
+    dish_discount_kitchen_dynamic_year: Number = None
+
+
+Row = TypeVar("Row")
+
+
+@dataclass(slots=True)
+class Report(Generic[Row]):
+    data: list[Row] = field(default_factory=list)
+    sum: Row | None = None
+
+
+@dataclass(slots=True)
+class RevenueReport(RevenueRow):
+    # revenue endpoint answers with the totals at the top level, data and sum are kept for network reports
+    data: list[RevenueRow] = field(default_factory=list)
+    sum: RevenueRow | None = None
+
+
+# key - backend url (see urls.py), value - compiled schema
+report_adapters: dict[str, TypeAdapter] = {
+    "revenue": TypeAdapter(RevenueReport),
+    "losses": TypeAdapter(Report[LossesRow]),
+    "loss-forecast": TypeAdapter(Report[LossForecastRow]),
+    "turnover": TypeAdapter(Report[TurnoverRow]),
+    "inventory": TypeAdapter(Report[InventoryRow]),
+    "food-cost": TypeAdapter(Report[FoodCostRow]),
+}
+dict_adapter = TypeAdapter(dict)
+
+
+def decode_report(url: str, raw: bytes) -> object | None:
+    adapter = report_adapters.get(url)
+    try:
+        if adapter is None:
+            # no schema for this report yet, plain dict as before
+            return dict_adapter.validate_json(raw)
+        return adapter.validate_json(raw)
+    except ValidationError as e:
+        logger.msg("ERROR", f"Could not decode report: {url=}: {e}")
+        return None
+
+
+def encode_report(url: str, report: object) -> bytes:
+    adapter = report_adapters.get(url, dict_adapter)
+    return adapter.dump_json(report)
@@ -0,0 +1,42 @@
+import numpy as np
+
+
+def select_top(keys: np.ndarray, n: int, where: np.ndarray | None = None) -> np.ndarray:
+    # indexes of the n rows with the largest keys among `where`, largest first;
+    # np.partition finds the n-th key in O(rows), only the kept rows are sorted
+    candidates = np.flatnonzero(where) if where is not None else np.arange(len(keys))
+    if n <= 0:
+        return candidates[:0]
+    if len(candidates) > n:
+        values = keys[candidates]
+        kth = np.partition(values, len(values) - n)[len(values) - n]
+        # equal keys keep the earlier rows, as a stable sort does
+        above = candidates[values > kth]
+        equal = candidates[values == kth][:n - len(above)]
+        candidates = np.concatenate((above, equal))
+    return candidates[np.lexsort((candidates, -keys[candidates]))]
+
+
+def select_bottom(keys: np.ndarray, n: int, where: np.ndarray | None = None) -> np.ndarray:
+    # the same for the smallest keys, smallest first
+    candidates = np.flatnonzero(where) if where is not None else np.arange(len(keys))
+    if n <= 0:
+        return candidates[:0]
+    if len(candidates) > n:
+        values = keys[candidates]
+        kth = np.partition(values, n - 1)[n - 1]
+        below = candidates[values < kth]
+        equal = candidates[values == kth][:n - len(below)]
+        candidates = np.concatenate((below, equal))
+    return candidates[np.lexsort((candidates, keys[candidates]))]
+
+
+def select_top_bottom(
+    keys: np.ndarray,
+    n: int,
+    top_where: np.ndarray | None = None,
+    bottom_where: np.ndarray | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    # keys is a column of the report (see src/basic/report_model.py), the masks leave out null keys;
+    # a row may get into both lists if both masks allow it
+    return select_top(keys, n, top_where), select_bottom(keys, n, bottom_where)
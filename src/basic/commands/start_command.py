@@ -4,41 +4,36 @@ from aiogram.filters import CommandStart, Command
 from aiogram.fsm.context import FSMContext
 from aiogram.types import Message, CallbackQuery, BufferedInputFile, FSInputFile
 from aiogram.types import InlineKeyboardMarkup as IKM, InlineKeyboardButton as IKB
+from src.util.routing.callback_router import CallbackRouter
 
 import pandas as pd
 from io import BytesIO
 import json
 import os
-import locale
 
 from reportlab import pdfbase
 from reportlab.lib.pagesizes import letter
-from reportlab.lib.utils import ImageReader
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from reportlab import pdfbase
 from reportlab.pdfbase import pdfmetrics
-from reportlab.platypus import TableStyle, Table
-from reportlab.lib import colors
 
-from openpyxl import Workbook
-from openpyxl.styles import Alignment, Font
-
-from src.basic.graphics.graphicsforpdf import create_combined_graph
+from src.basic.graphics.json_report import create_json_report_excel, create_json_report_pdf
 from src.mailing.data.notification.notification_google_sheets_worker import notification_gsworker
 from src.mailing.data.techsupport.techsupport_google_sheets_worker import techsupport_gsworker
 from src.analytics.db.db import user_tokens_db
 from src.util.log import logger
+from src.util.render.service import RenderRejectedError, register_font, render_service
 
 from src.basic.keyboards.keyboards import get_markup, get_report_format_keyboard
 
-router = Router(name=__name__)
+router = CallbackRouter(name=__name__)
 
-pdfmetrics.registerFont(TTFont('FreeSerif', 'resources/fonts/FreeSerif.ttf'))  # Убедитесь, что путь к шрифту правильный
+register_font('FreeSerif', 'resources/fonts/FreeSerif.ttf')  # Убедитесь, что путь к шрифту правильный
 # canvas.setFont
 
-@router.callback_query(F.data == 'start')
+@router.callback('start')
 async def start_callback_handler(query: CallbackQuery, state: FSMContext) -> None:
     await start_handler(query.from_user.id, query.message, state)
     await query.answer()
@@ -55,7 +50,7 @@ async def start_handler(user_id: int, message: types.Message, state: FSMContext)
     msg = await message.answer("Загрузка... ⚙️")
 
     loop = get_event_loop()
-    has_token = user_tokens_db.has_tgid(user_id)
+    has_token = await user_tokens_db.has_tgid(str(user_id))
     kb = await loop.run_in_executor(None, get_markup, user_id, has_token)
 
     await msg.edit_text(
@@ -64,7 +59,7 @@ async def start_handler(user_id: int, message: types.Message, state: FSMContext)
     )
 
 
-@router.callback_query(F.data == 'generate_report')
+@router.callback('generate_report')
 async def generate_report_handler(query: CallbackQuery) -> None:
     print("Generate report callback triggered")  # Debug line
     btn_pdf = [IKB(text='PDF 📄', callback_data='generate_report_pdf')]
@@ -154,7 +149,7 @@ def create_empty_pdf() -> BytesIO:
     return file_bytes
 
 
-@router.callback_query(F.data == 'generate_report_pdf')
+@router.callback('generate_report_pdf')
 async def send_empty_pdf_report(query: CallbackQuery) -> None:
     try:
         pdf_file = create_empty_pdf()
@@ -170,7 +165,7 @@ async def send_empty_pdf_report(query: CallbackQuery) -> None:
 
 
 
-@router.callback_query(F.data == 'generate_report_excel')
+@router.callback('generate_report_excel')
 async def send_empty_excel_report(query: CallbackQuery) -> None:
     try:
         excel_file = create_empty_excel()
@@ -185,94 +180,6 @@ async def send_empty_excel_report(query: CallbackQuery) -> None:
         await query.message.answer(f"Произошла ошибка при создании Excel отчёта: {e}")
 
 
-# Выгрузка отчёта Анализ выручки
-
-def create_json_report_pdf(data: dict) -> BytesIO:
-    file_bytes = BytesIO()
-    try:
-        c = canvas.Canvas(file_bytes, pagesize=letter)
-        width, height = letter
-        margin = 50  # Page margins
-        y_position = height - 50  # Initial text position
-
-        # Title of the report
-        c.setFont("FreeSerif", 16)
-        c.drawString(margin, y_position, "АНАЛИЗ ВЫРУЧКИ")
-        y_position -= 60  # Increased space after the title
-
-        c.setFont("FreeSerif", 7)  # Reduced font size for the table
-        max_text_width = width - 2 * margin  # Maximum text width
-
-        # Processing store data and displaying the table
-        data_table = []
-        headers = ["Магазин", "Выручка", "Динамика (неделя)", "Динамика (месяц)", "Динамика (год)", "Прогноз"]
-        data_table.append(headers)
-
-        # Add rows with formatted numbers
-        for store in data["data"]:
-            row = [
-                store["label"],
-                format_number(store["revenue"]),
-                format_number(store["revenue_dynamics_week"]),
-                format_number(store["revenue_dynamics_month"]),
-                format_number(store["revenue_dynamics_year"]),
-                format_number(store["revenue_forecast"])
-            ]
-            data_table.append(row)
-
-        # Add totals with formatted numbers
-        totals = [
-            data["sum"]["label"],
-            format_number(data["sum"]["revenue"]),
-            format_number(data["sum"]["revenue_dynamics_week"]),
-            format_number(data["sum"]["revenue_dynamics_month"]),
-            format_number(data["sum"]["revenue_dynamics_year"]),
-            format_number(data["sum"]["revenue_forecast"])
-        ]
-        data_table.append(totals)
-
-        # Create the table with the collected data and adjusted column widths
-        table = Table(data_table, colWidths=[140, 80, 80, 80, 80, 80])  # Adjusted column widths
-        table.setStyle(TableStyle([  # Styling the table
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-            ('ALIGN', (1, 1), (-1, -1), 'CENTER'),
-            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-            ('FONTNAME', (0, 0), (-1, 0), "FreeSerif"),
-            ('FONTNAME', (0, 1), (-1, -1), "FreeSerif"),
-            ('FONTSIZE', (0, 0), (-1, -1), 7),  # Reduced font size for table text
-        ]))
-
-        # Add table to PDF
-        table.wrapOn(c, width, height)
-        table.drawOn(c, margin, y_position - len(data_table) * 12)  # Adjust row height to 12
-
-        # Update y_position after the table
-        y_position -= len(data_table) * 12 + 50  # Space after table before graphs
-
-        # Create and add the combined graph (bar + pie chart)
-        combined_graph_bytes = create_combined_graph(data)  # Call the function to generate the combined graph
-        combined_graph_img = ImageReader(combined_graph_bytes)
-
-        # Adjust width and position for a wider graph
-        graph_width = width - 100  # Wider graph
-        graph_height = 400  # Adjusted graph height
-        graph_y_position = y_position - graph_height  # Adjusted y position to place the graph below the table
-
-        # Draw the image (graph) on the canvas
-        c.drawImage(combined_graph_img, 50, graph_y_position, graph_width, graph_height)  # Wider graph
-
-        c.showPage()  # End the page
-        c.save()
-
-        file_bytes.seek(0)
-
-    except Exception as e:
-        raise Exception(f"Ошибка при создании PDF: {e}")
-
-    return file_bytes
-
-
 # Пример данных для отчёта
 report_data = {
     "1 Гостепоток и средний чек": [
@@ -335,7 +242,7 @@ excel_file = create_report_excel(report_data_excel)
 
 
 
-@router.callback_query(F.data == 'generate_sample_report')
+@router.callback('generate_sample_report')
 async def generate_sample_report_handler(query: CallbackQuery) -> None:
     # Логика для отображения кнопок выбора формата отчёта
     btn_pdf = [IKB(text='PDF 📄', callback_data='generate_sample_report_pdf')]
@@ -349,7 +256,7 @@ async def generate_sample_report_handler(query: CallbackQuery) -> None:
     )
     await query.answer()
 
-@router.callback_query(F.data == 'generate_sample_report_pdf')
+@router.callback('generate_sample_report_pdf')
 async def generate_sample_report_pdf_handler(query: CallbackQuery) -> None:
     try:
         # Генерация примерного отчёта в PDF
@@ -365,7 +272,7 @@ async def generate_sample_report_pdf_handler(query: CallbackQuery) -> None:
         await query.message.answer(f"Произошла ошибка при создании примерного PDF отчёта: {e}")
 
 
-@router.callback_query(F.data == 'generate_sample_report_excel')
+@router.callback('generate_sample_report_excel')
 async def generate_sample_report_excel_handler(query: CallbackQuery) -> None:
     try:
         # Генерация примерного отчёта в Excel
@@ -408,7 +315,7 @@ async def load_data_handler(message: Message, state: FSMContext):
         reply_markup=get_report_format_keyboard()
     )
 
-@router.callback_query(F.data == 'generate_json_report')
+@router.callback('generate_json_report')
 async def generate_json_report_handler(query: CallbackQuery, state: FSMContext):
     # Загружаем данные из example.json
     json_data = load_json_from_file()
@@ -469,63 +376,7 @@ async def process_json_file(message: Message, state: FSMContext):
     await message.answer("Выберите формат отчёта:", reply_markup=kb)
 
 
-def format_number(value):
-    """Helper function to format numbers"""
-    return f"{value:,.2f}"
-
-
-def create_report_excel(data: dict) -> BytesIO:
-    # Create a new workbook and sheet
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Отчёт"
-
-    # Define the headers
-    headers = ["Магазин", "Выручка", "Динамика (неделя)", "Динамика (месяц)", "Динамика (год)", "Прогноз"]
-
-    # Add headers to the first row and format them
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_num, value=header)
-        cell.font = Font(bold=True)  # Bold headers
-        cell.alignment = Alignment(horizontal="center", vertical="center")  # Center alignment
-
-    # Adding store data rows
-    row_num = 2  # Start from the second row (after the header)
-    for store in data["data"]:
-        row = [
-            store["label"],
-            format_number(store["revenue"]),
-            format_number(store["revenue_dynamics_week"]),
-            format_number(store["revenue_dynamics_month"]),
-            format_number(store["revenue_dynamics_year"]),
-            format_number(store["revenue_forecast"])
-        ]
-        for col_num, value in enumerate(row, 1):
-            cell = ws.cell(row=row_num, column=col_num, value=value)
-            cell.alignment = Alignment(horizontal="center", vertical="center")  # Center alignment
-        row_num += 1
-
-    # Add the totals row
-    totals = [
-        data["sum"]["label"],
-        format_number(data["sum"]["revenue"]),
-        format_number(data["sum"]["revenue_dynamics_week"]),
-        format_number(data["sum"]["revenue_dynamics_month"]),
-        format_number(data["sum"]["revenue_dynamics_year"]),
-        format_number(data["sum"]["revenue_forecast"])
-    ]
-    for col_num, value in enumerate(totals, 1):
-        cell = ws.cell(row=row_num, column=col_num, value=value)
-        cell.alignment = Alignment(horizontal="center", vertical="center")  # Center alignment
-
-    # Save the workbook to a BytesIO object to send as a document
-    excel_file = BytesIO()
-    wb.save(excel_file)
-    excel_file.seek(0)  # Reset the pointer to the beginning of the file
-    return excel_file
-
-
-@router.callback_query(F.data == 'generate_json_report_excel')
+@router.callback('generate_json_report_excel')
 async def generate_json_report_excel_handler(query: CallbackQuery, state: FSMContext):
     try:
         # Получаем данные из состояния
@@ -536,29 +387,22 @@ async def generate_json_report_excel_handler(query: CallbackQuery, state: FSMCon
             await query.message.answer("Нет данных для генерации отчёта. Пожалуйста, загрузите данные.")
             return
 
-        # Генерация Excel отчёта
-        excel_file = create_report_excel(json_data)
-        input_file = BufferedInputFile(excel_file.getvalue(), filename="анализ_выручки.xlsx")  # Название файла
+        # Генерация Excel отчёта в процессе рендеринга
+        excel_bytes = await render_service.render(query.from_user.id, create_json_report_excel, json_data)
+        input_file = BufferedInputFile(excel_bytes, filename="анализ_выручки.xlsx")  # Название файла
 
         # Отправляем Excel отчёт
         await query.message.answer_document(
             document=input_file,
             caption="Отчёт в формате Excel готов!"
         )
+    except RenderRejectedError as e:
+        await query.message.answer(str(e))
     except Exception as e:
         await query.message.answer(f"Ошибка при создании Excel отчёта: {e}")
 
 
-locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
-
-def format_number(number):
-    # Format the number with thousand separators (dot as thousands separator)
-    try:
-        return locale.format_string("%d", number, grouping=True)
-    except Exception:
-        return str(number)
-
-@router.callback_query(F.data == 'generate_json_report_pdf')
+@router.callback('generate_json_report_pdf')
 async def generate_json_report_pdf_handler(query: CallbackQuery, state: FSMContext):
     try:
         # Получаем данные из состояния
@@ -569,15 +413,17 @@ async def generate_json_report_pdf_handler(query: CallbackQuery, state: FSMConte
             await query.message.answer("Нет данных для генерации отчёта. Пожалуйста, загрузите данные.")
             return
 
-        # Генерация PDF отчёта
-        pdf_file = create_json_report_pdf(json_data)
-        input_file = BufferedInputFile(pdf_file.getvalue(), filename="json_report.pdf")
+        # Генерация PDF отчёта в процессе рендеринга
+        pdf_bytes = await render_service.render(query.from_user.id, create_json_report_pdf, json_data)
+        input_file = BufferedInputFile(pdf_bytes, filename="json_report.pdf")
 
         # Отправляем PDF отчёт
         await query.message.answer_document(
             document=input_file,
             caption="Отчёт по данным JSON в формате PDF готов!"
         )
+    except RenderRejectedError as e:
+        await query.message.answer(str(e))
     except Exception as e:
         await query.message.answer(f"Ошибка при создании PDF отчёта: {e}")
 
@@ -5,7 +5,8 @@ import os
 from aiogram.filters import Command
 
 from aiogram import Router, types, F
-from aiogram.types import FSInputFile
+from aiogram.types import BufferedInputFile, FSInputFile
+from src.util.routing.callback_router import CallbackRouter
 from reportlab.lib.pagesizes import letter, landscape, inch
 from reportlab.lib import colors
 from reportlab.pdfbase import pdfmetrics
@@ -15,55 +16,20 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from io import BytesIO
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-import pandas as pd
+import numpy as np
 
-foodcost_of_products_storehouse_pdf_router = Router()
+from src.basic.metrics import STOREHOUSE_PERIODS, food_cost_dynamics, food_cost_rows
+from src.basic.report_model import ColumnarReport, as_report, load_report
+from src.util.render.service import RenderRejectedError, register_font, render_service
 
-# Helper functions (no change from previous code)
-def get_first_non_null(*values):
-    for value in values:
-        if value is not None:
-            return value
-    return "-"
+foodcost_of_products_storehouse_pdf_router = CallbackRouter()
 
-def calculate_percentage_change(old_value, new_value):
-    if isinstance(old_value, (int, float)) and isinstance(new_value, (int, float)) and old_value != 0:
-        return round(((new_value - old_value) / old_value) * 100, 2)
-    return None
-
-def calculate_monthly_differences(store):
-    diff_price = store.get("food_cost_dynamics_day")
-    diff_price2 = store.get("food_cost_dynamics_week")
-    diff_price3 = store.get("food_cost_dynamics_month")
-
-    diff_price_1 = get_first_non_null(diff_price, diff_price2, diff_price3)
-
-    if isinstance(diff_price2, (int, float)) and isinstance(diff_price, (int, float)):
-        diff_price_1_day = calculate_percentage_change(diff_price, diff_price2)
-    else:
-        diff_price_1_day = "-"
-
-    if isinstance(diff_price3, (int, float)) and isinstance(diff_price2, (int, float)):
-        diff_price_2_week = calculate_percentage_change(diff_price2, diff_price3)
-    else:
-        diff_price_2_week = "-"
-
-    return diff_price_1, diff_price_1_day, diff_price_2_week
-
-def safe_format(value):
-    if value is None:
-        return "-"
-    if isinstance(value, (int, float)):
-        return f"{value:,.2f}%"  # Add percentage formatting
-    return str(value)
-
-def create_pdf_report(data, output_file="food_cost_server_report.pdf"):
+def create_pdf_report(data: ColumnarReport | dict, output_file: str | BytesIO = "food_cost_server_report.pdf"):
     # Create PDF document with landscape (horizontal) orientation
     doc = SimpleDocTemplate(output_file, pagesize=landscape(letter))
     elements = []
 
-    pdfmetrics.registerFont(TTFont('DejaVuSans',
-                                   r"C:\\WORK\\sova_rest_bot\\sova_rest_bot-master\\src\\basic\\revenue_analysis\\DejaVuSans.ttf"))
+    register_font('DejaVuSans', r"C:\\WORK\\sova_rest_bot\\sova_rest_bot-master\\src\\basic\\revenue_analysis\\DejaVuSans.ttf")
 
     # Title of the report
     styles = getSampleStyleSheet()
@@ -86,19 +52,8 @@ def create_pdf_report(data, output_file="food_cost_server_report.pdf"):
     ]
 
     # Prepare table data
-    table_data = [headers]
-
-    for product in data["data"]:
-        food_cost_1, food_cost_1_day, food_cost_2_week = calculate_monthly_differences(product)
-
-        row = [
-            product["label"],
-            safe_format(product['food_cost']),
-            safe_format(food_cost_1_day),
-            safe_format(food_cost_1),
-            safe_format(food_cost_2_week),
-        ]
-        table_data.append(row)
+    report = as_report(data)
+    table_data = [headers] + food_cost_rows(report, STOREHOUSE_PERIODS)
 
     # Set fixed column widths in inches
     col_widths = [2 * inch, 1.3 * inch, 1.3 * inch, 1.2 * inch, 1.2 * inch]  # Example: Fixed width for each column in inches
@@ -122,34 +77,19 @@ def create_pdf_report(data, output_file="food_cost_server_report.pdf"):
 
     elements.append(table)
 
-    # Prepare the data for the bar chart
-    labels = []
-    values_day = []
-    values_week = []
-    values_month = []
-
-    for product in data["data"]:
-        food_cost_1, food_cost_1_day, food_cost_2_week = calculate_monthly_differences(product)
-
-        labels.append(product["label"])
-        values_day.append(food_cost_1_day if isinstance(food_cost_1_day, (int, float)) else 0)
-        values_week.append(food_cost_2_week if isinstance(food_cost_2_week, (int, float)) else 0)
-        values_month.append(food_cost_1 if isinstance(food_cost_1, (int, float)) else 0)
-
-    # Create the bar chart with Seaborn
-    df = pd.DataFrame({
-        'Product': labels,
-        'Day': values_day,
-        'Week': values_week,
-        'Month': values_month
-    })
-
-    # Reshape data for seaborn
-    df_melted = df.melt(id_vars='Product', value_vars=['Day', 'Week', 'Month'],
-                        var_name='Time Period', value_name='Price Change')
+    # Prepare the data for the bar chart: the same dynamics as in the table, missing ones are 0
+    dynamics = food_cost_dynamics(report, STOREHOUSE_PERIODS)
+    periods = ['Day', 'Week', 'Month']
+    values = [dynamics.change_1.filled(), dynamics.change_2.filled(), dynamics.first.filled()]
 
+    # Long format for seaborn: every product once per time period
     plt.figure(figsize=(10, 6))
-    sns.barplot(x='Product', y='Price Change', hue='Time Period', data=df_melted)
+    sns.barplot(
+        x=np.tile(report.labels, len(periods)),
+        y=np.concatenate(values),
+        hue=np.repeat(periods, report.size),
+    )
+    plt.legend(title='Time Period')
 
     # Customize the plot with Russian labels
     plt.xticks(rotation=90)
@@ -178,17 +118,14 @@ def create_pdf_report(data, output_file="food_cost_server_report.pdf"):
     return output_file  # Return the file path here
 
 
-def load_revenue_data(filepath: str) -> dict:
-    """Загружает данные из JSON-файла."""
-    try:
-        with open(filepath, 'r', encoding='utf-8') as file:
-            return json.load(file)
-    except Exception as e:
-        logging.error(f"Ошибка при чтении файла {filepath}: {e}")
-        return {}
+def render_pdf_report(data: ColumnarReport | dict) -> bytes:
+    # Build the PDF in memory, runs in a render worker
+    pdf_buffer = BytesIO()
+    create_pdf_report(data, pdf_buffer)
+    return pdf_buffer.getvalue()
 
 
-@foodcost_of_products_storehouse_pdf_router.callback_query(F.data =="format_pdf_food_cost_dynamics")
+@foodcost_of_products_storehouse_pdf_router.callback("format_pdf_food_cost_dynamics")
 async def generate_report(callback_query: types.CallbackQuery):
     """Обработчик для кнопки 'Сформировать PDF отчёт'."""
     # Отвечаем на callback_query, чтобы убрать "часики" у кнопки
@@ -199,16 +136,21 @@ async def generate_report(callback_query: types.CallbackQuery):
 
     # Читаем данные из JSON-файла
     file_path = r'C:\\WORK\\sova_rest_bot\\sova_rest_bot-master\\files\\jsons_for_reports\\food-cost-dish_server_data_example.json'
-    revenue_data = load_revenue_data(file_path)
+    revenue_data = load_report(file_path)
 
     if not revenue_data:
         await callback_query.message.answer("Ошибка при загрузке данных для отчёта.")
         return
 
-    # Создание PDF и получение пути к файлу
+    # computed in the bot process, see ColumnarReport.derived
+    food_cost_dynamics(revenue_data, STOREHOUSE_PERIODS)
+
+    # Создание PDF
     try:
-        pdf_file = create_pdf_report(revenue_data)  # Now returns the PDF file path
-        logging.info(f"PDF файл создан по пути: {pdf_file}")
+        pdf_bytes = await render_service.render(callback_query.from_user.id, render_pdf_report, revenue_data)
+    except RenderRejectedError as e:
+        await callback_query.message.answer(str(e))
+        return
     except Exception as e:
         logging.error(f"Ошибка при создании PDF: {e}")
         await callback_query.message.answer("Ошибка при создании PDF-отчёта.")
@@ -216,15 +158,8 @@ async def generate_report(callback_query: types.CallbackQuery):
 
     # Отправка PDF пользователю
     try:
-        # Проверка, что путь к файлу существует
-        if not os.path.exists(pdf_file):
-            logging.error(f"PDF файл не найден по пути: {pdf_file}")
-            await callback_query.message.answer("Ошибка: PDF файл не найден.")
-            return
-
-        # Отправляем PDF-файл
         await callback_query.message.answer_document(
-            document=FSInputFile(pdf_file),
+            document=BufferedInputFile(pdf_bytes, filename=f"food_cost_server_{report_type}.pdf"),
             caption=f"Ваш отчёт по (тип: {report_type}):"
         )
     except Exception as e:
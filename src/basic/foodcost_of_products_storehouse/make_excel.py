@@ -12,57 +12,17 @@ import json
 from openpyxl import Workbook
 from openpyxl.styles import Alignment, Font, PatternFill
 import os
+from io import BytesIO
 
 from aiogram.filters import Command
+from src.util.routing.callback_router import CallbackRouter
+from src.basic.metrics import STOREHOUSE_PERIODS, food_cost_rows, food_cost_dynamics
+from src.basic.report_model import ColumnarReport, as_report, load_report
+from src.util.render.service import RenderRejectedError, render_service
 
-# Helper functions (no change from previous code)
-def get_first_non_null(*values):
-    for value in values:
-        if value is not None:
-            return value
-    return "-"
-
-foodcost_of_products_storehouse_excel_router = Router()
-
-# Helper functions (your previously provided functions)
-def get_first_non_null(*values):
-    for value in values:
-        if value is not None:
-            return value
-    return "-"
-
-def calculate_percentage_change(old_value, new_value):
-    if isinstance(old_value, (int, float)) and isinstance(new_value, (int, float)) and old_value != 0:
-        return round(((new_value - old_value) / old_value) * 100, 2)
-    return None
-
-def calculate_monthly_differences(store):
-    diff_price = store.get("food_cost_dynamics_day")
-    diff_price2 = store.get("food_cost_dynamics_week")
-    diff_price3 = store.get("food_cost_dynamics_month")
-
-    diff_price_1 = get_first_non_null(diff_price, diff_price2, diff_price3)
-
-    if isinstance(diff_price2, (int, float)) and isinstance(diff_price, (int, float)):
-        diff_price_1_day = calculate_percentage_change(diff_price, diff_price2)
-    else:
-        diff_price_1_day = "-"
-
-    if isinstance(diff_price3, (int, float)) and isinstance(diff_price2, (int, float)):
-        diff_price_2_week = calculate_percentage_change(diff_price2, diff_price3)
-    else:
-        diff_price_2_week = "-"
-
-    return diff_price_1, diff_price_1_day, diff_price_2_week
-
-def safe_format(value):
-    if value is None:
-        return "-"
-    if isinstance(value, (int, float)):
-        return f"{value:,.2f}%"  # Add percentage formatting
-    return str(value)
-
-def create_excel_report(data, output_file="food_cost_server_report.xlsx"):
+foodcost_of_products_storehouse_excel_router = CallbackRouter()
+
+def create_excel_report(data: ColumnarReport | dict, output_file: str | BytesIO = "food_cost_server_report.xlsx"):
     # Create a new Workbook
     wb = Workbook()
     ws = wb.active
@@ -79,17 +39,7 @@ def create_excel_report(data, output_file="food_cost_server_report.xlsx"):
         cell.fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
 
     # Prepare table data
-    table_data = []
-    for product in data["data"]:
-        food_cost_1, food_cost_1_day, food_cost_2_week = calculate_monthly_differences(product)
-        row = [
-            product["label"],
-            safe_format(product['food_cost']),
-            safe_format(food_cost_1_day),
-            safe_format(food_cost_1),
-            safe_format(food_cost_2_week),
-        ]
-        table_data.append(row)
+    table_data = food_cost_rows(as_report(data), STOREHOUSE_PERIODS)
 
     # Write data to the Excel sheet
     for row_num, row_data in enumerate(table_data, 2):
@@ -106,17 +56,15 @@ def create_excel_report(data, output_file="food_cost_server_report.xlsx"):
     wb.save(output_file)
     print(f"Excel-файл успешно сохранен: {output_file}")
 
-def load_json_data(file_path):
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-            return data
-    except Exception as e:
-        print(f"Ошибка загрузки данных JSON из {file_path}: {e}")
-        return None
+
+# Создаёт Excel-файл в памяти, выполняется в процессе рендеринга
+def render_excel_report(data: ColumnarReport | dict) -> bytes:
+    buffer = BytesIO()
+    create_excel_report(data, buffer)
+    return buffer.getvalue()
 
 
-@foodcost_of_products_storehouse_excel_router.callback_query(F.data == "format_excel_food_cost_dynamics")
+@foodcost_of_products_storehouse_excel_router.callback("format_excel_food_cost_dynamics")
 async def generate_excel_report_callback(callback_query: types.CallbackQuery, state: FSMContext):
     await callback_query.answer("Формирую Excel отчёт по себестоимости продуктов на складе...")
 
@@ -125,16 +73,21 @@ async def generate_excel_report_callback(callback_query: types.CallbackQuery, st
 
     # Загрузка данных из JSON-файла
     filepath = r"C:\WORK\sova_rest_bot\sova_rest_bot-master\files\jsons_for_reports\food-cost-dish_server_data_example.json"
-    foodcost_data = load_json_data(filepath)  # Используем функцию для загрузки данных
+    foodcost_data = load_report(filepath)
 
     if not foodcost_data:
         await callback_query.message.answer("Ошибка при загрузке данных для отчёта.")
         return
 
+    # computed in the bot process, see ColumnarReport.derived
+    food_cost_dynamics(foodcost_data, STOREHOUSE_PERIODS)
+
     # Генерация Excel
     try:
-        filename = f"foodcost_storehouse_{report_type}.xlsx"
-        create_excel_report(foodcost_data, filename)  # Используем функцию для создания Excel
+        file_data = await render_service.render(callback_query.from_user.id, render_excel_report, foodcost_data)
+    except RenderRejectedError as e:
+        await callback_query.message.answer(str(e))
+        return
     except Exception as e:
         logging.error(f"Ошибка при создании Excel-файла: {e}")
         await callback_query.message.answer(f"Ошибка при создании Excel-файла: {e}")
@@ -142,9 +95,6 @@ async def generate_excel_report_callback(callback_query: types.CallbackQuery, st
 
     # Отправка Excel файла
     try:
-        with open(filename, "rb") as file:
-            file_data = file.read()
-
         input_file = BufferedInputFile(file_data, filename=f"foodcost_storehouse_{report_type}.xlsx")
         await callback_query.message.answer_document(
             input_file,
@@ -153,7 +103,3 @@ async def generate_excel_report_callback(callback_query: types.CallbackQuery, st
     except Exception as e:
         logging.error(f"Ошибка при отправке Excel-файла: {e}")
         await callback_query.message.answer("Ошибка при отправке отчёта.")
-    finally:
-        # Удаляем временный файл после отправки
-        if os.path.exists(filename):
-            os.remove(filename)
\ No newline at end of file
@@ -11,70 +11,24 @@ from reportlab.pdfbase.ttfonts import TTFont
 from io import BytesIO
 from aiogram import Router, F
 from aiogram.types import CallbackQuery, BufferedInputFile, FSInputFile
+from src.util.routing.callback_router import CallbackRouter
+from src.basic.metrics import loss_forecast_rows, loss_forecast_differences
+from src.basic.report_model import ColumnarReport, load_report
+from src.util.render.service import RenderRejectedError, register_font, render_service
 
-forecasting_losses_pdf_router = Router()
+forecasting_losses_pdf_router = CallbackRouter()
 
-def check_font_path(font_path):
-    if not os.path.exists(font_path):
-        raise FileNotFoundError(f"Шрифт не найден по пути: {font_path}")
-
-
-def get_first_non_null(*values):
-    for value in values:
-        if value is not None:
-            return value
-    return "-"
-
-
-def get_first_non_null(*args):
-    # Ваша реализация функции для получения первого не-null значения
-    for arg in args:
-        if arg is not None:
-            return arg
-    return "-"
-
-def calculate_monthly_differences(store):
-    """
-    Вычисляет разницы между месяцами для магазина.
-    Возвращает кортеж: (diff_price_1, diff_price_1_month, diff_price_2_month)
-    """
-    # Получаем значения разниц цен
-    diff_price = store.get("diff_price")
-    diff_price2 = store.get("diff_price2")
-    diff_price3 = store.get("diff_price3")
-    diff_price4 = store.get("diff_price4")
-
-    # Первое изменение цены (первое не-null значение)
-    diff_price_1 = get_first_non_null(diff_price, diff_price2, diff_price3, diff_price4)
-
-    # Разница между 1 и 2 месяцами (diff_price3 - diff_price2)
-    if isinstance(diff_price2, (int, float)) and isinstance(diff_price3, (int, float)):
-        diff_price_1_month = round(diff_price3 - diff_price2, 2)
-    else:
-        diff_price_1_month = "-"
-
-    # Разница между 2 и 3 месяцами (diff_price4 - diff_price3)
-    if isinstance(diff_price3, (int, float)) and isinstance(diff_price4, (int, float)):
-        diff_price_2_month = round(diff_price4 - diff_price3, 2)
-    else:
-        diff_price_2_month = "-"
-
-    return diff_price_1, diff_price_1_month, diff_price_2_month
-
-
-def create_pdf_with_table(data):
+def create_pdf_with_table(data: ColumnarReport | dict):
     pdf_buffer = BytesIO()
     doc = SimpleDocTemplate(pdf_buffer, pagesize=A4)
 
+    # В процессе рендеринга шрифт зарегистрирован при старте
     try:
-        check_font_path(r"C:\\WORK\\sova_rest_bot\\sova_rest_bot-master\\src\\basic\\revenue_analysis\\DejaVuSans.ttf")
-    except FileNotFoundError as e:
+        register_font('DejaVuSans', r"C:\\WORK\\sova_rest_bot\\sova_rest_bot-master\\src\\basic\\revenue_analysis\\DejaVuSans.ttf")
+    except Exception as e:
         print(e)
         return None
 
-    pdfmetrics.registerFont(TTFont('DejaVuSans',
-                                   r"C:\\WORK\\sova_rest_bot\\sova_rest_bot-master\\src\\basic\\revenue_analysis\\DejaVuSans.ttf"))
-
     elements = []
     title_style = ParagraphStyle(name='TitleStyle', fontName='DejaVuSans', fontSize=16, alignment=1)
     title = Paragraph("Прогнозирование потерь", title_style)
@@ -84,27 +38,8 @@ def create_pdf_with_table(data):
     # Заголовок таблицы
     table_data = [["Магазин", "Прогноз", "Первое изменение цены", "Изменение (1 месяц)", "Изменение (2 месяца)"]]
 
-    # Сортировка магазинов по убыванию прогноза
-    sorted_data = sorted(data["data"], key=lambda store: store.get("forecast", 0), reverse=True)
-
-    for store in sorted_data:
-        forecast = store.get("forecast", "-")
-
-        # Вычисляем разницы между месяцами
-        diff_price_1, diff_price_1_month, diff_price_2_month = calculate_monthly_differences(store)
-
-        # Пропускаем магазин, если нет данных о разнице цен
-        if diff_price_1 == "-" and diff_price_1_month == "-" and diff_price_2_month == "-":
-            continue
-
-        # Добавляем строку в таблицу
-        table_data.append([
-            store["label"],
-            f"{forecast:,.2f}" if isinstance(forecast, (int, float)) else forecast,
-            f"{diff_price_1:,.2f}" if isinstance(diff_price_1, (int, float)) else "-",
-            f"{diff_price_1_month:,.2f}" if isinstance(diff_price_1_month, (int, float)) else "-",
-            f"{diff_price_2_month:,.2f}" if isinstance(diff_price_2_month, (int, float)) else "-"
-        ])
+    # Магазины по убыванию прогноза, без магазинов без данных о разнице цен
+    table_data += loss_forecast_rows(data)
 
     # Создаем таблицу
     table = Table(table_data, colWidths=[2.5 * inch, 0.7 * inch, 1.7 * inch, 1.4 * inch, 1.4 * inch])
@@ -135,27 +70,7 @@ def save_pdf(pdf_buffer):
         print(f"Ошибка при сохранении PDF: {e}")
 
 
-def load_json_data(file_path):
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-            return data
-    except Exception as e:
-        print(f"Ошибка загрузки данных JSON из {file_path}: {e}")
-        return None
-
-
-def load_revenue_data(filepath: str) -> dict:
-    """Загружает данные из JSON-файла."""
-    try:
-        with open(filepath, 'r', encoding='utf-8') as file:
-            return json.load(file)
-    except Exception as e:
-        logging.error(f"Ошибка при чтении файла {filepath}: {e}")
-        return {}
-
-
-@forecasting_losses_pdf_router.callback_query(F.data == "format_pdf_loss_forecast")
+@forecasting_losses_pdf_router.callback("format_pdf_loss_forecast")
 async def handle_forecasting_losses_pdf(callback_query: CallbackQuery):
     """Обработчик для кнопки 'Сформировать PDF отчёт по прогнозированию потерь'."""
     # Отвечаем на callback_query, чтобы убрать "часики" у кнопки
@@ -166,15 +81,21 @@ async def handle_forecasting_losses_pdf(callback_query: CallbackQuery):
 
     # Загрузка данных из JSON-файла
     filepath = r"C:\WORK\sova_rest_bot\sova_rest_bot-master\files\jsons_for_reports\loss-forecast_data_example.json"
-    loss_forecast_data = load_revenue_data(filepath)  # Используем ту же функцию для загрузки данных
+    loss_forecast_data = load_report(filepath)
 
     if not loss_forecast_data:
         await callback_query.message.answer("Ошибка при загрузке данных для отчёта.")
         return
 
+    # computed in the bot process, see ColumnarReport.derived
+    loss_forecast_differences(loss_forecast_data)
+
     # Создание PDF
     try:
-        pdf_buffer = create_pdf_with_table(loss_forecast_data)  # Используем существующую функцию
+        pdf_bytes = await render_service.render(callback_query.from_user.id, create_pdf_with_table, loss_forecast_data)
+    except RenderRejectedError as e:
+        await callback_query.message.answer(str(e))
+        return
     except Exception as e:
         logging.error(f"Ошибка при создании PDF: {e}")
         await callback_query.message.answer("Ошибка при создании PDF-отчёта.")
@@ -183,7 +104,7 @@ async def handle_forecasting_losses_pdf(callback_query: CallbackQuery):
     # Отправка PDF пользователю
     try:
         # Создаём объект BufferedInputFile для отправки PDF
-        input_file = BufferedInputFile(pdf_buffer.getvalue(), filename=f"loss_forecast_{report_type}.pdf")
+        input_file = BufferedInputFile(pdf_bytes, filename=f"loss_forecast_{report_type}.pdf")
 
         # Отправляем документ пользователю
         await callback_query.message.answer_document(
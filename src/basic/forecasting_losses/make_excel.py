@@ -1,6 +1,7 @@
 import json
 import logging
 import os
+from io import BytesIO
 
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery, BufferedInputFile, FSInputFile
@@ -12,11 +13,15 @@ import logging
 import os
 from aiogram import Router, F
 from aiogram.types import CallbackQuery, BufferedInputFile
+from src.util.routing.callback_router import CallbackRouter
+from src.basic.metrics import loss_forecast_rows, loss_forecast_differences
+from src.basic.report_model import ColumnarReport, load_report
+from src.util.render.service import RenderRejectedError, render_service
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
 
 # Initialize router
-forecasting_losses_excel_router = Router()
+forecasting_losses_excel_router = CallbackRouter()
 
 # Path to the JSON file containing the data
 json_file_path = r'C:\\WORK\\sova_rest_bot\\sova_rest_bot-master\\files\\jsons_for_reports\\loss-forecast_data_example.json'
@@ -27,53 +32,7 @@ def check_font_path(font_path):
         raise FileNotFoundError(f"Шрифт не найден по пути: {font_path}")
 
 
-def get_first_non_null(*values):
-    for value in values:
-        if value is not None:
-            return value
-    return "-"
-
-
-def calculate_monthly_differences(store):
-    """
-    Вычисляет разницы между месяцами для магазина.
-    Возвращает кортеж: (diff_price_1, diff_price_1_month, diff_price_2_month)
-    """
-    # Получаем значения разниц цен
-    diff_price = store.get("diff_price")
-    diff_price2 = store.get("diff_price2")
-    diff_price3 = store.get("diff_price3")
-    diff_price4 = store.get("diff_price4")
-
-    # Первое изменение цены (первое не-null значение)
-    diff_price_1 = get_first_non_null(diff_price, diff_price2, diff_price3, diff_price4)
-
-    # Разница между 1 и 2 месяцами (diff_price3 - diff_price2)
-    if isinstance(diff_price2, (int, float)) and isinstance(diff_price3, (int, float)):
-        diff_price_1_month = round(diff_price3 - diff_price2, 2)
-    else:
-        diff_price_1_month = "-"
-
-    # Разница между 2 и 3 месяцами (diff_price4 - diff_price3)
-    if isinstance(diff_price3, (int, float)) and isinstance(diff_price4, (int, float)):
-        diff_price_2_month = round(diff_price4 - diff_price3, 2)
-    else:
-        diff_price_2_month = "-"
-
-    return diff_price_1, diff_price_1_month, diff_price_2_month
-
-
-def load_json_data(file_path):
-    try:
-        with open(file_path, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-            return data
-    except Exception as e:
-        print(f"Ошибка загрузки данных JSON из {file_path}: {e}")
-        return None
-
-
-def create_excel_with_table(data, output_file="loss_forecast_report.xlsx"):
+def create_excel_with_table(data: ColumnarReport | dict, output_file: str | BytesIO = "loss_forecast_report.xlsx"):
     # Создаем новую книгу Excel
     wb = Workbook()
     ws = wb.active
@@ -98,27 +57,8 @@ def create_excel_with_table(data, output_file="loss_forecast_report.xlsx"):
         cell.alignment = header_alignment
         cell.border = thin_border
 
-    # Сортировка магазинов по убыванию прогноза
-    sorted_data = sorted(data["data"], key=lambda store: store.get("forecast", 0), reverse=True)
-
-    for store in sorted_data:
-        forecast = store.get("forecast", "-")
-
-        # Вычисляем разницы между месяцами
-        diff_price_1, diff_price_1_month, diff_price_2_month = calculate_monthly_differences(store)
-
-        # Пропускаем магазин, если нет данных о разнице цен
-        if diff_price_1 == "-" and diff_price_1_month == "-" and diff_price_2_month == "-":
-            continue
-
-        # Добавляем строку в таблицу
-        row = [
-            store["label"],
-            f"{forecast:,.2f}" if isinstance(forecast, (int, float)) else forecast,
-            f"{diff_price_1:,.2f}" if isinstance(diff_price_1, (int, float)) else "-",
-            f"{diff_price_1_month:,.2f}" if isinstance(diff_price_1_month, (int, float)) else "-",
-            f"{diff_price_2_month:,.2f}" if isinstance(diff_price_2_month, (int, float)) else "-"
-        ]
+    # Магазины по убыванию прогноза, без магазинов без данных о разнице цен
+    for row in loss_forecast_rows(data):
         ws.append(row)
 
     # Применяем стили к данным
@@ -145,33 +85,35 @@ def create_excel_with_table(data, output_file="loss_forecast_report.xlsx"):
     print(f"Excel-файл успешно сохранен: {output_file}")
 
 
-# Загрузка данных из JSON
-def load_json_data(filepath: str) -> dict:
-    try:
-        with open(filepath, 'r', encoding='utf-8') as file:
-            return json.load(file)
-    except Exception as e:
-        logging.error(f"Ошибка при чтении файла {filepath}: {e}")
-        return {}
+# Создаёт Excel-файл в памяти, выполняется в процессе рендеринга
+def render_excel_report(data: ColumnarReport | dict) -> bytes:
+    buffer = BytesIO()
+    create_excel_with_table(data, buffer)
+    return buffer.getvalue()
 
 
-@forecasting_losses_excel_router.callback_query(F.data == "format_excel_loss_forecast")
+@forecasting_losses_excel_router.callback("format_excel_loss_forecast")
 async def handle_forecasting_losses_excel(callback_query: types.CallbackQuery, state: FSMContext):
     """Обработчик для кнопки 'Сформировать Excel отчёт по прогнозированию потерь'."""
     await callback_query.answer("Формирую Excel отчёт по прогнозированию потерь...")
 
     # Загрузка данных из JSON-файла
     filepath = r"C:\WORK\sova_rest_bot\sova_rest_bot-master\files\jsons_for_reports\loss_forecast.json"
-    loss_data = load_json_data(filepath)  # Используем функцию для загрузки данных
+    loss_data = load_report(filepath)
 
     if not loss_data:
         await callback_query.message.answer("Ошибка при загрузке данных для отчёта.")
         return
 
+    # computed in the bot process, see ColumnarReport.derived
+    loss_forecast_differences(loss_data)
+
     # Генерация Excel
     try:
-        filename = "loss_forecast_report.xlsx"
-        create_excel_with_table(loss_data, filename)  # Используем функцию для создания Excel
+        file_data = await render_service.render(callback_query.from_user.id, render_excel_report, loss_data)
+    except RenderRejectedError as e:
+        await callback_query.message.answer(str(e))
+        return
     except Exception as e:
         logging.error(f"Ошибка при создании Excel-файла: {e}")
         await callback_query.message.answer(f"Ошибка при создании Excel-файла: {e}")
@@ -179,9 +121,6 @@ async def handle_forecasting_losses_excel(callback_query: types.CallbackQuery, s
 
     # Отправка Excel файла
     try:
-        with open(filename, "rb") as file:
-            file_data = file.read()
-
         input_file = BufferedInputFile(file_data, filename="loss_forecast_report.xlsx")
         await callback_query.message.answer_document(
             input_file,
@@ -190,7 +129,3 @@ async def handle_forecasting_losses_excel(callback_query: types.CallbackQuery, s
     except Exception as e:
         logging.error(f"Ошибка при отправке Excel-файла: {e}")
         await callback_query.message.answer("Ошибка при отправке отчёта.")
-    finally:
-        # Удаляем временный файл после отправки
-        if os.path.exists(filename):
-            os.remove(filename)
\ No newline at end of file
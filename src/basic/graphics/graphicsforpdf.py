@@ -3,12 +3,14 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import json
 
-def create_combined_graph(data):
-    # Extract information from JSON
-    labels = [store["label"] for store in data["data"]]
-    revenue_week = [store["revenue_week"] for store in data["data"]]
-    revenue_month = [store["revenue_month"] for store in data["data"]]
-    revenue_year = [store["revenue_year"] for store in data["data"]]
+from src.basic.report_model import ColumnarReport, as_report
+
+def create_combined_graph(data: ColumnarReport | dict):
+    report = as_report(data)
+    labels = report.labels
+    revenue_week = report.column("revenue_week").filled()
+    revenue_month = report.column("revenue_month").filled()
+    revenue_year = report.column("revenue_year").filled()
 
     # Define custom colors
     week_color = (255 / 255, 226 / 255, 13 / 255)  # RGB (255,226,13) -> Yellow
@@ -38,11 +40,11 @@ def create_combined_graph(data):
     ax0.grid(True, axis='y')
 
     # Второй и третий ряды: круговые диаграммы
-    num_stores = len(data["data"])
+    num_stores = report.size
     stores_per_row = 2  # 2 магазина в ряду, чтобы они не сливались
 
-    for i, store in enumerate(data["data"]):
-        sizes = [store["revenue_week"], store["revenue_month"], store["revenue_year"]]
+    for i in range(num_stores):
+        sizes = [revenue_week[i], revenue_month[i], revenue_year[i]]
         labels_pie = ["Выручка за неделю", "Выручка за месяц", "Выручка за год"]
 
         # Определяем, в каком ряду и столбце будет диаграмма
@@ -53,7 +55,7 @@ def create_combined_graph(data):
         ax = fig.add_subplot(gs[row, col])  # Разделяем на два столбца
         ax.pie(sizes, labels=labels_pie, autopct='%1.1f%%', startangle=90,
                colors=[week_color, month_color, year_color])
-        ax.set_title(f"{store['label']}")
+        ax.set_title(f"{labels[i]}")
         ax.axis('equal')  # Чтобы круговая диаграмма была круглой
 
     # Убираем пустые подграфики, если количество магазинов нечетное
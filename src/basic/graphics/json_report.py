@@ -0,0 +1,167 @@
+# Отчёт Анализ выручки из json: render jobs of src/basic/commands/start_command.py.
+# The render workers import this module to unpickle the jobs, so it imports only the renderers, no bot code.
+import locale
+from io import BytesIO
+
+from openpyxl import Workbook
+from openpyxl.styles import Alignment, Font
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfgen import canvas
+from reportlab.platypus import TableStyle, Table
+
+from src.basic.graphics.graphicsforpdf import create_combined_graph
+from src.util.log import logger
+
+
+try:
+    locale.setlocale(locale.LC_ALL, 'en_US.UTF-8')
+except locale.Error as e:
+    # the fork server preloads this module, an error here would stop it; the numbers go without separators then
+    logger.msg("WARNING", f"Locale en_US.UTF-8 is not set: {e}")
+
+
+def format_number(number):
+    # Format the number with thousand separators (dot as thousands separator)
+    try:
+        return locale.format_string("%d", number, grouping=True)
+    except Exception:
+        return str(number)
+
+
+def create_json_report_pdf(data: dict) -> BytesIO:
+    file_bytes = BytesIO()
+    try:
+        c = canvas.Canvas(file_bytes, pagesize=letter)
+        width, height = letter
+        margin = 50  # Page margins
+        y_position = height - 50  # Initial text position
+
+        # Title of the report
+        c.setFont("FreeSerif", 16)
+        c.drawString(margin, y_position, "АНАЛИЗ ВЫРУЧКИ")
+        y_position -= 60  # Increased space after the title
+
+        c.setFont("FreeSerif", 7)  # Reduced font size for the table
+        max_text_width = width - 2 * margin  # Maximum text width
+
+        # Processing store data and displaying the table
+        data_table = []
+        headers = ["Магазин", "Выручка", "Динамика (неделя)", "Динамика (месяц)", "Динамика (год)", "Прогноз"]
+        data_table.append(headers)
+
+        # Add rows with formatted numbers
+        for store in data["data"]:
+            row = [
+                store["label"],
+                format_number(store["revenue"]),
+                format_number(store["revenue_dynamics_week"]),
+                format_number(store["revenue_dynamics_month"]),
+                format_number(store["revenue_dynamics_year"]),
+                format_number(store["revenue_forecast"])
+            ]
+            data_table.append(row)
+
+        # Add totals with formatted numbers
+        totals = [
+            data["sum"]["label"],
+            format_number(data["sum"]["revenue"]),
+            format_number(data["sum"]["revenue_dynamics_week"]),
+            format_number(data["sum"]["revenue_dynamics_month"]),
+            format_number(data["sum"]["revenue_dynamics_year"]),
+            format_number(data["sum"]["revenue_forecast"])
+        ]
+        data_table.append(totals)
+
+        # Create the table with the collected data and adjusted column widths
+        table = Table(data_table, colWidths=[140, 80, 80, 80, 80, 80])  # Adjusted column widths
+        table.setStyle(TableStyle([  # Styling the table
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('ALIGN', (1, 1), (-1, -1), 'CENTER'),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+            ('FONTNAME', (0, 0), (-1, 0), "FreeSerif"),
+            ('FONTNAME', (0, 1), (-1, -1), "FreeSerif"),
+            ('FONTSIZE', (0, 0), (-1, -1), 7),  # Reduced font size for table text
+        ]))
+
+        # Add table to PDF
+        table.wrapOn(c, width, height)
+        table.drawOn(c, margin, y_position - len(data_table) * 12)  # Adjust row height to 12
+
+        # Update y_position after the table
+        y_position -= len(data_table) * 12 + 50  # Space after table before graphs
+
+        # Create and add the combined graph (bar + pie chart)
+        combined_graph_bytes = create_combined_graph(data)  # Call the function to generate the combined graph
+        combined_graph_img = ImageReader(combined_graph_bytes)
+
+        # Adjust width and position for a wider graph
+        graph_width = width - 100  # Wider graph
+        graph_height = 400  # Adjusted graph height
+        graph_y_position = y_position - graph_height  # Adjusted y position to place the graph below the table
+
+        # Draw the image (graph) on the canvas
+        c.drawImage(combined_graph_img, 50, graph_y_position, graph_width, graph_height)  # Wider graph
+
+        c.showPage()  # End the page
+        c.save()
+
+        file_bytes.seek(0)
+
+    except Exception as e:
+        raise Exception(f"Ошибка при создании PDF: {e}")
+
+    return file_bytes
+
+
+def create_json_report_excel(data: dict) -> BytesIO:
+    # Create a new workbook and sheet
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Отчёт"
+
+    # Define the headers
+    headers = ["Магазин", "Выручка", "Динамика (неделя)", "Динамика (месяц)", "Динамика (год)", "Прогноз"]
+
+    # Add headers to the first row and format them
+    for col_num, header in enumerate(headers, 1):
+        cell = ws.cell(row=1, column=col_num, value=header)
+        cell.font = Font(bold=True)  # Bold headers
+        cell.alignment = Alignment(horizontal="center", vertical="center")  # Center alignment
+
+    # Adding store data rows
+    row_num = 2  # Start from the second row (after the header)
+    for store in data["data"]:
+        row = [
+            store["label"],
+            format_number(store["revenue"]),
+            format_number(store["revenue_dynamics_week"]),
+            format_number(store["revenue_dynamics_month"]),
+            format_number(store["revenue_dynamics_year"]),
+            format_number(store["revenue_forecast"])
+        ]
+        for col_num, value in enumerate(row, 1):
+            cell = ws.cell(row=row_num, column=col_num, value=value)
+            cell.alignment = Alignment(horizontal="center", vertical="center")  # Center alignment
+        row_num += 1
+
+    # Add the totals row
+    totals = [
+        data["sum"]["label"],
+        format_number(data["sum"]["revenue"]),
+        format_number(data["sum"]["revenue_dynamics_week"]),
+        format_number(data["sum"]["revenue_dynamics_month"]),
+        format_number(data["sum"]["revenue_dynamics_year"]),
+        format_number(data["sum"]["revenue_forecast"])
+    ]
+    for col_num, value in enumerate(totals, 1):
+        cell = ws.cell(row=row_num, column=col_num, value=value)
+        cell.alignment = Alignment(horizontal="center", vertical="center")  # Center alignment
+
+    # Save the workbook to a BytesIO object to send as a document
+    excel_file = BytesIO()
+    wb.save(excel_file)
+    excel_file.seek(0)  # Reset the pointer to the beginning of the file
+    return excel_file
@@ -12,24 +12,21 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.pdfbase.ttfonts import TTFont
 from aiogram import Router, F
+from src.util.routing.callback_router import CallbackRouter
+from src.basic.report_model import ColumnarReport, as_report, load_report
+from src.util.render.service import RenderRejectedError, register_font, render_service
 
-inventory_pdf_router = Router()
+inventory_pdf_router = CallbackRouter()
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 
-# Function to safely convert values to float
-def safe_float(value):
-    try:
-        return float(value) if value else 0
-    except ValueError:
-        return 0
-
 # Function to generate combined graph
-def create_combined_graph(data):
-    labels = [store["label"] for store in data["data"]]
-    shortage = [safe_float(store.get("shortage", 0)) for store in data["data"]]
-    surplus = [safe_float(store.get("surplus", 0)) for store in data["data"]]
+def create_combined_graph(data: ColumnarReport | dict):
+    report = as_report(data)
+    labels = report.labels
+    shortage = report.column("shortage").filled()
+    surplus = report.column("surplus").filled()
 
     fig = plt.figure(figsize=(16, 8))
     ax = fig.add_subplot(111)
@@ -49,12 +46,11 @@ def create_combined_graph(data):
     return img_bytes
 
 # Function to generate PDF with table and graphs
-def create_pdf_with_table_and_graphs(data, graph_bytes):
+def create_pdf_with_table_and_graphs(data: ColumnarReport | dict, graph_bytes):
     pdf_buffer = BytesIO()
     doc = SimpleDocTemplate(pdf_buffer, pagesize=A4)
 
-    pdfmetrics.registerFont(
-        TTFont('FreeSerif', r"C:\WORK\sova_rest_bot\sova_rest_bot-master\src\basic\trade_turnover\FreeSerif.ttf"))
+    register_font('FreeSerif', r"C:\WORK\sova_rest_bot\sova_rest_bot-master\src\basic\trade_turnover\FreeSerif.ttf")
 
     elements = []
     styles = getSampleStyleSheet()
@@ -65,14 +61,10 @@ def create_pdf_with_table_and_graphs(data, graph_bytes):
     elements.append(Spacer(1, 12))
 
     table_data = [["Магазин", "Недостача", "Недостача (%)", "Излишки", "Излишки (%)", "Себестоимость"]]
-    for store in data["data"]:
-        shortage = safe_float(store.get('shortage', 0))
-        shortage_percent = safe_float(store.get('shortage_percent', 0))
-        surplus = safe_float(store.get('surplus', 0))
-        surplus_percent = safe_float(store.get('surplus_percent', 0))
-        cost_price = safe_float(store.get('cost_price', 0))
-
-        table_data.append([store["label"],
+    report = as_report(data)
+    rows = report.rows("shortage", "shortage_percent", "surplus", "surplus_percent", "cost_price", null=0)
+    for label, shortage, shortage_percent, surplus, surplus_percent, cost_price in rows:
+        table_data.append([label,
                            f"{shortage:,.2f}",
                            f"{shortage_percent:,.2f}%",
                            f"{surplus:,.2f}",
@@ -92,15 +84,12 @@ def create_pdf_with_table_and_graphs(data, graph_bytes):
         ('GRID', (0, 0), (-1, -1), 1, colors.black)
     ]
 
-    for i, store in enumerate(data["data"], start=1):
-        shortage_percent = safe_float(store.get('shortage_percent', 0))
-        surplus_percent = safe_float(store.get('surplus_percent', 0))
-
-        if shortage_percent > 2:
-            table_style.append(('TEXTCOLOR', (2, i), (2, i), colors.red))
+    # строки таблицы начинаются с 1, после заголовка
+    for i in (report.column("shortage_percent").filled() > 2).nonzero()[0].tolist():
+        table_style.append(('TEXTCOLOR', (2, i + 1), (2, i + 1), colors.red))
 
-        if surplus_percent > 3:
-            table_style.append(('TEXTCOLOR', (4, i), (4, i), colors.green))
+    for i in (report.column("surplus_percent").filled() > 3).nonzero()[0].tolist():
+        table_style.append(('TEXTCOLOR', (4, i + 1), (4, i + 1), colors.green))
 
     table.setStyle(TableStyle(table_style))
     elements.append(table)
@@ -114,18 +103,12 @@ def create_pdf_with_table_and_graphs(data, graph_bytes):
     pdf_buffer.seek(0)
     return pdf_buffer
 
-def load_revenue_data(filepath: str) -> dict:
-    """Загружает данные из JSON-файла."""
-    try:
-        with open(filepath, 'r', encoding='utf-8') as file:
-            return json.load(file)
-    except Exception as e:
-        logging.error(f"Ошибка при чтении файла {filepath}: {e}")
-        return {}
-
+# Function to render the whole PDF in a render worker
+def render_pdf_report(data: ColumnarReport | dict) -> bytes:
+    return create_pdf_with_table_and_graphs(data, create_combined_graph(data)).getvalue()
 
 # Function to handle report generation
-@inventory_pdf_router.callback_query(F.data =="inventory_pdf")
+@inventory_pdf_router.callback("inventory_pdf")
 async def generate_report(callback_query: types.CallbackQuery):
     """Обработчик для кнопки 'Сформировать PDF отчёт'."""
     # Отвечаем на callback_query, чтобы убрать "часики" у кнопки
@@ -136,23 +119,18 @@ async def generate_report(callback_query: types.CallbackQuery):
 
     # Читаем данные из JSON-файла
     file_path = r"C:\WORK\sova_rest_bot\sova_rest_bot-master\files\jsons_for_reports\inventory_store_example.json"
-    revenue_data = load_revenue_data(file_path)
+    revenue_data = load_report(file_path)
 
     if not revenue_data:
         await callback_query.message.answer("Ошибка при загрузке данных для отчёта.")
         return
 
-    # Генерация графика
+    # Генерация графика и PDF
     try:
-        graph_bytes = create_combined_graph(revenue_data)
-    except Exception as e:
-        logging.error(f"Ошибка при создании графика: {e}")
-        await callback_query.message.answer("Ошибка при создании графика для отчёта.")
+        pdf_bytes = await render_service.render(callback_query.from_user.id, render_pdf_report, revenue_data)
+    except RenderRejectedError as e:
+        await callback_query.message.answer(str(e))
         return
-
-    # Создание PDF
-    try:
-        pdf_buffer = create_pdf_with_table_and_graphs(revenue_data, graph_bytes)
     except Exception as e:
         logging.error(f"Ошибка при создании PDF: {e}")
         await callback_query.message.answer("Ошибка при создании PDF-отчёта.")
@@ -161,7 +139,7 @@ async def generate_report(callback_query: types.CallbackQuery):
     # Отправка PDF пользователю
     try:
         # Создаём объект BufferedInputFile для отправки PDF
-        input_file = BufferedInputFile(pdf_buffer.getvalue(), filename=f"inventory{report_type}.pdf")
+        input_file = BufferedInputFile(pdf_bytes, filename=f"inventory{report_type}.pdf")
 
         # Отправляем документ пользователю
         await callback_query.message.answer_document(
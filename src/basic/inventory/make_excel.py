@@ -10,18 +10,13 @@ import json
 from aiogram import types, F
 from aiogram import Router
 from aiogram.types import FSInputFile, BufferedInputFile
-
-
-# Define safe_float function
-def safe_float(value):
-    try:
-        return float(value) if value else 0
-    except (ValueError, TypeError):
-        return 0
+from src.util.routing.callback_router import CallbackRouter
+from src.basic.report_model import ColumnarReport, as_report, load_report
+from src.util.render.service import RenderRejectedError, render_service
 
 
 # Define the function that generates the Excel report
-def create_excel_report(data):
+def create_excel_report(data: ColumnarReport | dict):
     wb = openpyxl.Workbook()
     ws = wb.active
     ws.title = "Инвентаризация товаров"
@@ -41,13 +36,8 @@ def create_excel_report(data):
         cell.font = font_bold
         cell.fill = PatternFill(start_color="D3D3D3", end_color="D3D3D3", fill_type="solid")
 
-    for i, store in enumerate(data["data"], start=2):
-        store_name = store["label"]
-        shortage = safe_float(store.get('shortage', 0))
-        shortage_percent = safe_float(store.get('shortage_percent', 0))
-        surplus = safe_float(store.get('surplus', 0))
-        surplus_percent = safe_float(store.get('surplus_percent', 0))
-        cost_price = safe_float(store.get('cost_price', 0))
+    rows = as_report(data).rows("shortage", "shortage_percent", "surplus", "surplus_percent", "cost_price", null=0)
+    for i, (store_name, shortage, shortage_percent, surplus, surplus_percent, cost_price) in enumerate(rows, start=2):
 
         ws.append([
             store_name,
@@ -78,26 +68,16 @@ def create_excel_report(data):
 
 
 # Create the router for handling inventory Excel report
-inventory_excel_router = Router()
-
+inventory_excel_router = CallbackRouter()
 
-# Загрузка данных
-def load_json_data(filepath: str) -> dict:
-    try:
-        with open(filepath, 'r', encoding='utf-8') as file:
-            return json.load(file)
-    except Exception as e:
-        logging.error(f"Ошибка при чтении файла {filepath}: {e}")
-        return {}
 
-
-@inventory_excel_router.callback_query(F.data == 'inventory_excel')
+@inventory_excel_router.callback('inventory_excel')
 async def generate_inventory_report_callback(callback_query: types.CallbackQuery, state: FSMContext):
     await callback_query.answer("Формирую Excel отчёт по инвентаризации...")
 
     # Загрузка данных из JSON-файла
     filepath = r"C:\WORK\sova_rest_bot\sova_rest_bot-master\files\jsons_for_reports\inventory_store_example.json"
-    inventory_data = load_json_data(filepath)  # Используем функцию для загрузки данных
+    inventory_data = load_report(filepath)
 
     if not inventory_data:
         await callback_query.message.answer("Ошибка при загрузке данных для отчёта.")
@@ -105,7 +85,10 @@ async def generate_inventory_report_callback(callback_query: types.CallbackQuery
 
     # Генерация Excel
     try:
-        excel_buffer = create_excel_report(inventory_data)  # Получаем BytesIO объект
+        file_data = await render_service.render(callback_query.from_user.id, create_excel_report, inventory_data)
+    except RenderRejectedError as e:
+        await callback_query.message.answer(str(e))
+        return
     except Exception as e:
         logging.error(f"Ошибка при создании Excel-файла: {e}")
         await callback_query.message.answer(f"Ошибка при создании Excel-файла: {e}")
@@ -113,8 +96,7 @@ async def generate_inventory_report_callback(callback_query: types.CallbackQuery
 
     # Отправка Excel файла
     try:
-        # Используем данные из BytesIO для создания BufferedInputFile
-        input_file = BufferedInputFile(excel_buffer.getvalue(), filename="inventory_store_report.xlsx")
+        input_file = BufferedInputFile(file_data, filename="inventory_store_report.xlsx")
         await callback_query.message.answer_document(
             input_file,
             caption="Ваш отчёт по инвентаризации готов!"
@@ -122,6 +104,3 @@ async def generate_inventory_report_callback(callback_query: types.CallbackQuery
     except Exception as e:
         logging.error(f"Ошибка при отправке Excel-файла: {e}")
         await callback_query.message.answer("Ошибка при отправке отчёта.")
-    finally:
-        # Закрываем BytesIO объект
-        excel_buffer.close()
\ No newline at end of file
@@ -0,0 +1,111 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.basic.report_model import Column, ColumnarReport, as_report
+
+
+# vectorized metrics over report columns, null rows stay null instead of being checked one by one
+def coalesce(*columns: Column) -> Column:
+    # the first non-null value of every row
+    values = columns[-1].values
+    mask = columns[-1].mask
+    for column in reversed(columns[:-1]):
+        values = np.where(column.mask, values, column.values)
+        mask = column.mask & mask
+    return Column(values, mask)
+
+
+def round_values(values: np.ndarray, decimals: int) -> np.ndarray:
+    # python round, as the reports did row by row: np.round scales by 10**decimals and differs at the .005 halves
+    return np.fromiter((round(value, decimals) for value in values.tolist()), dtype=values.dtype, count=len(values))
+
+
+def difference(old: Column, new: Column, decimals: int = 2) -> Column:
+    return Column(round_values(new.values - old.values, decimals), old.mask | new.mask)
+
+
+def percent_change(old: Column, new: Column, decimals: int = 2) -> Column:
+    # null where a value is missing or the old one is 0
+    mask = old.mask | new.mask | (old.values == 0)
+    old_values = np.where(mask, 1, old.values)
+    return Column(round_values((new.values - old_values) / old_values * 100, decimals), mask)
+
+
+def format_column(column: Column, spec: str = ",.2f", suffix: str = "", null: str = "-") -> list[str]:
+    return [null if value is None else f"{value:{spec}}{suffix}" for value in column.tolist()]
+
+
+# food cost dynamics columns of the reports, from the shortest period
+DISH_PERIODS = ("food_cost_dynamics_week", "food_cost_dynamics_month", "food_cost_dynamics_year")
+STOREHOUSE_PERIODS = ("food_cost_dynamics_day", "food_cost_dynamics_week", "food_cost_dynamics_month")
+
+
+@dataclass(slots=True)
+class FoodCostDynamics:
+    # the first known dynamics and the changes between the periods, in %
+    first: Column
+    change_1: Column
+    change_2: Column
+
+
+def food_cost_dynamics(report: ColumnarReport, periods: tuple[str, str, str]) -> FoodCostDynamics:
+    def compute(report: ColumnarReport) -> FoodCostDynamics:
+        first, second, third = (report.column(name) for name in periods)
+        return FoodCostDynamics(
+            first=coalesce(first, second, third),
+            change_1=percent_change(first, second),
+            change_2=percent_change(second, third),
+        )
+    return report.derive(("food_cost_dynamics", periods), compute)
+
+
+@dataclass(slots=True)
+class LossForecastDifferences:
+    # the first known price difference and the changes between the months
+    first: Column
+    month_1: Column
+    month_2: Column
+    # rows with at least one of them
+    known: np.ndarray
+
+
+def loss_forecast_differences(report: ColumnarReport) -> LossForecastDifferences:
+    def compute(report: ColumnarReport) -> LossForecastDifferences:
+        diff_price, diff_price2, diff_price3, diff_price4 = (
+            report.column(name) for name in ("diff_price", "diff_price2", "diff_price3", "diff_price4")
+        )
+        first = coalesce(diff_price, diff_price2, diff_price3, diff_price4)
+        month_1 = difference(diff_price2, diff_price3)
+        month_2 = difference(diff_price3, diff_price4)
+        return LossForecastDifferences(
+            first=first,
+            month_1=month_1,
+            month_2=month_2,
+            known=~(first.mask & month_1.mask & month_2.mask),
+        )
+    return report.derive("loss_forecast_differences", compute)
+
+
+def food_cost_rows(report: ColumnarReport, periods: tuple[str, str, str], order: np.ndarray | None = None) -> list[list[str]]:
+    # table rows: name, food cost, change 1, first dynamics, change 2
+    dynamics = food_cost_dynamics(report, periods)
+    columns = [report.column("food_cost"), dynamics.change_1, dynamics.first, dynamics.change_2]
+    labels = report.labels
+    if order is not None:
+        columns = [column.take(order) for column in columns]
+        labels = [labels[i] for i in order.tolist()]
+    formatted = [format_column(column, suffix="%") for column in columns]
+    return [list(row) for row in zip(labels, *formatted)]
+
+
+def loss_forecast_rows(data: ColumnarReport | dict) -> list[list[str]]:
+    # table rows by forecast descending: store, forecast, first price difference, changes in 1 and 2 months;
+    # stores without price differences are skipped
+    report = as_report(data)
+    differences = loss_forecast_differences(report)
+    order = report.order("forecast", reverse=True)
+    order = order[differences.known[order]]
+    columns = [report.column("forecast"), differences.first, differences.month_1, differences.month_2]
+    formatted = [format_column(column.take(order)) for column in columns]
+    return [list(row) for row in zip((report.labels[i] for i in order.tolist()), *formatted)]
@@ -0,0 +1,162 @@
+import json
+import os
+from collections.abc import Callable
+from dataclasses import asdict, fields
+from sys import intern
+from typing import Any
+
+import numpy as np
+from cachetools import LRUCache
+
+from src.util.log import logger
+import config as cf
+
+
+def to_number(value: Any) -> int | float | None:
+    # numbers as they are, numeric strings are parsed, anything else is null
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+
+class Column:
+    # int64 if every value is an int, float64 otherwise; nulls hold 0
+    values: np.ndarray
+    # True where the value is null: None, missing key, not a number
+    mask: np.ndarray
+
+    def __init__(self, values: np.ndarray, mask: np.ndarray) -> None:
+        self.values = values
+        self.mask = mask
+
+    @classmethod
+    def from_values(cls, raw: list) -> "Column":
+        numbers = [to_number(value) for value in raw]
+        mask = np.fromiter((number is None for number in numbers), dtype=bool, count=len(numbers))
+        dtype = np.int64 if all(isinstance(number, int) for number in numbers if number is not None) else np.float64
+        values = np.fromiter((0 if number is None else number for number in numbers), dtype=dtype, count=len(numbers))
+        return cls(values, mask)
+
+    @classmethod
+    def empty(cls, size: int) -> "Column":
+        return cls(np.zeros(size, dtype=np.int64), np.ones(size, dtype=bool))
+
+    def filled(self, value: int | float = 0) -> np.ndarray:
+        if not self.mask.any():
+            return self.values
+        return np.where(self.mask, value, self.values)
+
+    def tolist(self, null: Any = None) -> list:
+        # python numbers for formatting and for openpyxl, nulls replaced by `null`
+        values = self.values.tolist()
+        for i in np.flatnonzero(self.mask).tolist():
+            values[i] = null
+        return values
+
+    def take(self, indexes: np.ndarray) -> "Column":
+        return Column(self.values[indexes], self.mask[indexes])
+
+
+class ColumnarReport:
+    # one report as columns: built once from the json rows, then every renderer reads the same arrays
+    labels: list[str]
+    columns: dict[str, Column]
+    # the "sum" row as it came, a single row needs no columns
+    total: dict
+    size: int
+    # key -> columns computed from this report, the pdf and excel renderers compute them once;
+    # render jobs get a pickled copy, so the handlers derive them in the bot process before submitting a job
+    derived: dict[Any, Any]
+
+    def __init__(self, labels: list[str], columns: dict[str, Column], total: dict) -> None:
+        self.labels = labels
+        self.columns = columns
+        self.total = total
+        self.size = len(labels)
+        self.derived = {}
+
+    @classmethod
+    def from_json(cls, data: dict) -> "ColumnarReport":
+        rows = data.get("data") or []
+        # the same store and product names repeat in every report, interned they are kept once
+        labels = [intern(str(row.get("label", ""))) for row in rows]
+        names = dict.fromkeys(name for row in rows for name in row if name != "label")
+        columns = {name: Column.from_values([row.get(name) for row in rows]) for name in names}
+        return cls(labels, columns, data.get("sum") or {})
+
+    @classmethod
+    def from_report(cls, report: Any, *names: str) -> "ColumnarReport":
+        # a report decoded by src/analytics/schemas.py: the columns are read from the row attributes,
+        # only `names` if given (the text renderers need two or three of them)
+        rows = report.data
+        if not names:
+            names = tuple(field.name for field in fields(rows[0]) if field.name != "label") if rows else ()
+        labels = [intern(str(row.label)) for row in rows]
+        columns = {name: Column.from_values([getattr(row, name, None) for row in rows]) for name in names}
+        total = report.sum
+        return cls(labels, columns, asdict(total) if total is not None else {})
+
+    def column(self, name: str) -> Column:
+        column = self.columns.get(name)
+        return column if column is not None else Column.empty(self.size)
+
+    def rows(self, *names: str, null: Any = None) -> list[list]:
+        # [label, values of names...] for every row, for tables
+        columns = [self.column(name).tolist(null) for name in names]
+        return [list(row) for row in zip(self.labels, *columns)]
+
+    def total_row(self, *names: str, null: Any = None) -> list:
+        values = [self.total.get(name) for name in names]
+        return [self.total.get("label", "Всего"), *(null if value is None else value for value in values)]
+
+    def take(self, indexes: np.ndarray) -> "ColumnarReport":
+        labels = [self.labels[i] for i in indexes.tolist()]
+        columns = {name: column.take(indexes) for name, column in self.columns.items()}
+        return ColumnarReport(labels, columns, self.total)
+
+    def order(self, name: str, reverse: bool = False) -> np.ndarray:
+        # row indexes, stable as sorted(), nulls go last
+        column = self.column(name)
+        values = column.values.astype(np.float64)
+        return np.lexsort((-values if reverse else values, column.mask))
+
+    def sorted_by(self, name: str, reverse: bool = False) -> "ColumnarReport":
+        return self.take(self.order(name, reverse))
+
+    def derive(self, key: Any, compute: Callable[["ColumnarReport"], Any]) -> Any:
+        if key not in self.derived:
+            self.derived[key] = compute(self)
+        return self.derived[key]
+
+
+def as_report(data: "ColumnarReport | dict") -> ColumnarReport:
+    # renderers accept the raw json as well
+    return data if isinstance(data, ColumnarReport) else ColumnarReport.from_json(data)
+
+
+# (path, mtime) -> report, the pdf and excel of one report are built from the same columns
+reports_cache: LRUCache = LRUCache(maxsize=cf.REPORT_MODEL_CACHE_SIZE)
+
+
+def load_report(filepath: str) -> ColumnarReport | None:
+    try:
+        key = (filepath, os.stat(filepath).st_mtime_ns)
+        report = reports_cache.get(key)
+        if report is None:
+            with open(filepath, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if not data:
+                return None
+            report = ColumnarReport.from_json(data)
+            reports_cache[key] = report
+        return report
+    except Exception as e:
+        logger.msg("ERROR", f"Error while reading report {filepath}: {e}")
+        return None
@@ -6,24 +6,26 @@ import matplotlib.pyplot as plt
 from aiogram import F
 from aiogram import Router
 from aiogram.types import CallbackQuery, BufferedInputFile
+from src.util.routing.callback_router import CallbackRouter
 from reportlab.lib.pagesizes import A4
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Image
 from reportlab.lib.units import inch
 
+from src.basic.report_model import ColumnarReport, as_report, load_report
+from src.util.render.service import RenderRejectedError, register_font, render_service
 
-analys_revenue_pdf_router = Router()
 
+analys_revenue_pdf_router = CallbackRouter()
 
-def create_combined_graph(data):
-    # Extract information from JSON
-    labels = [store["label"] for store in data["data"]]
-    revenue_week = [store["revenue_week"] for store in data["data"]]
-    revenue_month = [store["revenue_month"] for store in data["data"]]
-    revenue_year = [store["revenue_year"] for store in data["data"]]
+
+def create_combined_graph(data: ColumnarReport | dict):
+    report = as_report(data)
+    labels = report.labels
+    revenue_week = report.column("revenue_week").filled()
+    revenue_month = report.column("revenue_month").filled()
+    revenue_year = report.column("revenue_year").filled()
 
     # Define custom colors
     week_color = (255 / 255, 226 / 255, 13 / 255)  # RGB (255,226,13) -> Yellow
@@ -53,11 +55,11 @@ def create_combined_graph(data):
     ax0.grid(True, axis='y')
 
     # Второй и третий ряды: круговые диаграммы
-    num_stores = len(data["data"])
+    num_stores = report.size
     stores_per_row = 2  # 2 магазина в ряду, чтобы они не сливались
 
-    for i, store in enumerate(data["data"]):
-        sizes = [store["revenue_week"], store["revenue_month"], store["revenue_year"]]
+    for i in range(num_stores):
+        sizes = [revenue_week[i], revenue_month[i], revenue_year[i]]
         labels_pie = ["Выручка за неделю", "Выручка за месяц", "Выручка за год"]
 
         # Определяем, в каком ряду и столбце будет диаграмма
@@ -68,7 +70,7 @@ def create_combined_graph(data):
         ax = fig.add_subplot(gs[row, col])  # Разделяем на два столбца
         ax.pie(sizes, labels=labels_pie, autopct='%1.1f%%', startangle=90,
                colors=[week_color, month_color, year_color])
-        ax.set_title(f"{store['label']}")
+        ax.set_title(f"{labels[i]}")
         ax.axis('equal')  # Чтобы круговая диаграмма была круглой
 
     # Убираем пустые подграфики, если количество магазинов нечетное
@@ -86,9 +88,9 @@ def create_combined_graph(data):
     img_bytes.seek(0)
     return img_bytes
 
-def create_pdf_with_table_and_graphs(data, graph_bytes):
+def create_pdf_with_table_and_graphs(data: ColumnarReport | dict, graph_bytes):
     try:
-        pdfmetrics.registerFont(TTFont('DejaVuSans', r"C:\WORK\sova_rest_bot\sova_rest_bot-master\src\basic\revenue_analysis\DejaVuSans.ttf"))
+        register_font('DejaVuSans', r"C:\WORK\sova_rest_bot\sova_rest_bot-master\src\basic\revenue_analysis\DejaVuSans.ttf")
         print("Шрифт FreeSerif успешно зарегистрирован!")
     except Exception as e:
         print(f"Ошибка при регистрации шрифта: {e}")
@@ -109,13 +111,8 @@ def create_pdf_with_table_and_graphs(data, graph_bytes):
     table_data = [
         ["Магазин", "Выручка за неделю", "Выручка за месяц", "Выручка за год"]
     ]
-    for store in data["data"]:
-        table_data.append([
-            store["label"],
-            f"{store['revenue_week']:,}",
-            f"{store['revenue_month']:,}",
-            f"{store['revenue_year']:,}"
-        ])
+    for label, revenue_week, revenue_month, revenue_year in as_report(data).rows("revenue_week", "revenue_month", "revenue_year", null=0):
+        table_data.append([label, f"{revenue_week:,}", f"{revenue_month:,}", f"{revenue_year:,}"])
 
     # Создаём объект таблицы
     table = Table(table_data, colWidths=[2 * inch, 1.5 * inch, 1.5 * inch, 1.5 * inch])  # Уменьшаем ширину столбцов
@@ -141,6 +138,11 @@ def create_pdf_with_table_and_graphs(data, graph_bytes):
     return pdf_buffer
 
 
+def render_pdf_report(data: ColumnarReport | dict) -> bytes:
+    """Строит график и PDF, выполняется в процессе рендеринга."""
+    return create_pdf_with_table_and_graphs(data, create_combined_graph(data)).getvalue()
+
+
 def load_revenue_data(filepath: str) -> dict:
     """Загружает данные из JSON-файла."""
     try:
@@ -151,7 +153,7 @@ def load_revenue_data(filepath: str) -> dict:
         return {}
 
 
-@analys_revenue_pdf_router.callback_query(F.data == "revenue_analysis_pdf")
+@analys_revenue_pdf_router.callback("revenue_analysis_pdf")
 async def handle_format_pdf(callback_query: CallbackQuery):
     """Обработчик для кнопки 'Сформировать PDF отчёт'."""
     # Отвечаем на callback_query, чтобы убрать "часики" у кнопки
@@ -162,23 +164,18 @@ async def handle_format_pdf(callback_query: CallbackQuery):
 
     # Загрузка данных из JSON-файла
     filepath = r"C:\WORK\sova_rest_bot\sova_rest_bot-master\files\jsons_for_reports\revenue analys.json"
-    revenue_data = load_revenue_data(filepath)
+    revenue_data = load_report(filepath)
 
     if not revenue_data:
         await callback_query.message.answer("Ошибка при загрузке данных для отчёта.")
         return
 
-    # Генерация графика
+    # Генерация графика и PDF
     try:
-        graph_bytes = create_combined_graph(revenue_data)
-    except Exception as e:
-        logging.error(f"Ошибка при создании графика: {e}")
-        await callback_query.message.answer("Ошибка при создании графика для отчёта.")
+        pdf_bytes = await render_service.render(callback_query.from_user.id, render_pdf_report, revenue_data)
+    except RenderRejectedError as e:
+        await callback_query.message.answer(str(e))
         return
-
-    # Создание PDF
-    try:
-        pdf_buffer = create_pdf_with_table_and_graphs(revenue_data, graph_bytes)
     except Exception as e:
         logging.error(f"Ошибка при создании PDF: {e}")
         await callback_query.message.answer("Ошибка при создании PDF-отчёта.")
@@ -187,7 +184,7 @@ async def handle_format_pdf(callback_query: CallbackQuery):
     # Отправка PDF пользователю
     try:
         # Создаём объект BufferedInputFile для отправки PDF
-        input_file = BufferedInputFile(pdf_buffer.getvalue(), filename=f"revenue_analysis_{report_type}.pdf")
+        input_file = BufferedInputFile(pdf_bytes, filename=f"revenue_analysis_{report_type}.pdf")
 
         # Отправляем документ пользователю
         await callback_query.message.answer_document(
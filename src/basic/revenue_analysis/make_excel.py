@@ -1,17 +1,20 @@
 import json
 import logging
 import os
+from io import BytesIO
 from aiogram.types import CallbackQuery, BufferedInputFile, FSInputFile
 from openpyxl import Workbook
 from openpyxl.styles import Font, NamedStyle
 from aiogram import Router, F
-from src.basic.revenue_analysis.graphics_for_pdf import load_revenue_data
+from src.util.routing.callback_router import CallbackRouter
+from src.basic.report_model import ColumnarReport, as_report, load_report
+from src.util.render.service import RenderRejectedError, render_service
 
 # Initialize the routers
-analys_revenue_excel_router = Router()
+analys_revenue_excel_router = CallbackRouter()
 
 # Function to create the revenue excel file
-def create_revenue_excel(data: dict, filename: str):
+def create_revenue_excel(data: ColumnarReport | dict, filename: str | BytesIO):
     """Creates an Excel file with revenue analysis"""
     wb = Workbook()
     ws = wb.active
@@ -34,34 +37,19 @@ def create_revenue_excel(data: dict, filename: str):
     for cell in ws[1]:
         cell.font = Font(bold=True)
 
+    columns = (
+        "revenue", "revenue_week", "revenue_month", "revenue_year",
+        "revenue_dynamics_week", "revenue_dynamics_month", "revenue_dynamics_year",
+        "revenue_forecast"
+    )
+    report = as_report(data)
+
     # Fill data
-    for item in data["data"]:
-        row = [
-            item["label"],
-            item["revenue"],
-            item["revenue_week"],
-            item["revenue_month"],
-            item["revenue_year"],
-            item["revenue_dynamics_week"],
-            item["revenue_dynamics_month"],
-            item["revenue_dynamics_year"],
-            item["revenue_forecast"]
-        ]
+    for row in report.rows(*columns):
         ws.append(row)
 
     # Add total row
-    total_row = [
-        data["sum"]["label"],
-        data["sum"]["revenue"],
-        data["sum"]["revenue_week"],
-        data["sum"]["revenue_month"],
-        data["sum"]["revenue_year"],
-        data["sum"]["revenue_dynamics_week"],
-        data["sum"]["revenue_dynamics_month"],
-        data["sum"]["revenue_dynamics_year"],
-        data["sum"]["revenue_forecast"]
-    ]
-    ws.append(total_row)
+    ws.append(report.total_row(*columns))
 
     # Apply number formatting
     for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=2, max_col=9):
@@ -73,7 +61,14 @@ def create_revenue_excel(data: dict, filename: str):
     return filename
 
 
-@analys_revenue_excel_router.callback_query(F.data == "revenue_analysis_excel")
+def render_excel_report(data: ColumnarReport | dict) -> bytes:
+    """Creates the Excel file in memory, runs in a render worker"""
+    buffer = BytesIO()
+    create_revenue_excel(data, buffer)
+    return buffer.getvalue()
+
+
+@analys_revenue_excel_router.callback("revenue_analysis_excel")
 async def handle_format_excel(callback_query: CallbackQuery):
     """Обработчик для кнопки 'Сформировать Excel отчёт'."""
     # Отвечаем на callback_query, чтобы убрать "часики" у кнопки
@@ -84,7 +79,7 @@ async def handle_format_excel(callback_query: CallbackQuery):
 
     # Загрузка данных из JSON-файла
     filepath = r"C:\WORK\sova_rest_bot\sova_rest_bot-master\files\jsons_for_reports\revenue analys.json"
-    revenue_data = load_revenue_data(filepath)
+    revenue_data = load_report(filepath)
 
     if not revenue_data:
         await callback_query.message.answer("Ошибка при загрузке данных для отчёта.")
@@ -92,7 +87,10 @@ async def handle_format_excel(callback_query: CallbackQuery):
 
     # Генерация Excel
     try:
-        filename = create_revenue_excel(revenue_data, filename=f"revenue_analysis_{report_type}.xlsx")
+        file_data = await render_service.render(callback_query.from_user.id, render_excel_report, revenue_data)
+    except RenderRejectedError as e:
+        await callback_query.message.answer(str(e))
+        return
     except Exception as e:
         logging.error(f"Ошибка при создании Excel-файла: {e}")
         await callback_query.message.answer(f"Ошибка при создании Excel-файла: {e}")
@@ -100,13 +98,8 @@ async def handle_format_excel(callback_query: CallbackQuery):
 
     # Отправка Excel файла
     try:
-        with open(filename, "rb") as file:
-            file_data = file.read()
-
         input_file = BufferedInputFile(file_data, filename=f"revenue_analysis_{report_type}.xlsx")
         await callback_query.message.answer_document(input_file, caption=f"Ваш отчёт по анализу выручки (тип: {report_type}):")
     except Exception as e:
         logging.error(f"Ошибка при отправке Excel-файла: {e}")
         await callback_query.message.answer("Ошибка при отправке отчёта.")
-
-
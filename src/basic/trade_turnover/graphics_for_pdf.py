@@ -9,6 +9,7 @@ from aiogram import Router, types, F
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.types import InputFile, BufferedInputFile
+from src.util.routing.callback_router import CallbackRouter
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfbase import pdfmetrics
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Image, Spacer
@@ -19,15 +20,19 @@ from reportlab.pdfbase.ttfonts import TTFont
 from reportlab import pdfbase
 from sympy.parsing.sympy_parser import null
 
+from src.basic.report_model import ColumnarReport, as_report, load_report
+from src.util.render.service import RenderRejectedError, register_font, render_service
 
-trade_turnover_pdf_router = Router()
 
-def create_combined_graph(data):
-    # Извлекаем информацию из данных с правильными ключами, заменяя None на 0
-    labels = [store["label"] for store in data["data"]]
-    turnover_week = [store.get("turnover_in_days_week", 0) or 0 for store in data["data"]]
-    turnover_month = [store.get("turnover_in_days_month", 0) or 0 for store in data["data"]]
-    turnover_year = [store.get("turnover_in_days_year", 0) or 0 for store in data["data"]]
+trade_turnover_pdf_router = CallbackRouter()
+
+def create_combined_graph(data: ColumnarReport | dict):
+    # Колонки отчёта, None заменяется на 0
+    report = as_report(data)
+    labels = report.labels
+    turnover_week = report.column("turnover_in_days_week").filled()
+    turnover_month = report.column("turnover_in_days_month").filled()
+    turnover_year = report.column("turnover_in_days_year").filled()
 
     # Определяем цвета для каждого периода
     week_color = (255 / 255, 226 / 255, 13 / 255)  # RGB (255,226,13) -> Yellow
@@ -55,7 +60,7 @@ def create_combined_graph(data):
     ax0.grid(True, axis='y')
 
     # Второй и третий ряды: круговые диаграммы
-    num_stores = len(data["data"])
+    num_stores = report.size
     stores_per_row = 2  # 2 магазина в ряду, чтобы они не сливались
 
     for i in range(num_stores):
@@ -88,14 +93,13 @@ def create_combined_graph(data):
     return img_bytes
 
 
-def create_pdf_with_table_and_graphs(data, graph_bytes):
+def create_pdf_with_table_and_graphs(data: ColumnarReport | dict, graph_bytes):
     # Создаём PDF-документ
     pdf_buffer = BytesIO()
     doc = SimpleDocTemplate(pdf_buffer, pagesize=A4)
 
     # Регистрируем шрифт
-    pdfmetrics.registerFont(
-        TTFont('FreeSerif', r"C:\WORK\sova_rest_bot\sova_rest_bot-master\src\basic\revenue_analysis\FreeSerif.ttf"))
+    register_font('FreeSerif', r"C:\WORK\sova_rest_bot\sova_rest_bot-master\src\basic\revenue_analysis\FreeSerif.ttf")
 
     elements = []
 
@@ -110,13 +114,10 @@ def create_pdf_with_table_and_graphs(data, graph_bytes):
 
     # Создаём таблицу
     table_data = [["Магазин", "Выручка за неделю", "Выручка за месяц", "Выручка за год"]]
-    for store in data["data"]:
-        turnover_week = store.get('turnover_in_days_week', 0) or 0
-        turnover_month = store.get('turnover_in_days_month', 0) or 0
-        turnover_year = store.get('turnover_in_days_year', 0) or 0
-
+    rows = as_report(data).rows("turnover_in_days_week", "turnover_in_days_month", "turnover_in_days_year", null=0)
+    for label, turnover_week, turnover_month, turnover_year in rows:
         # Форматирование чисел с разделением по запятым
-        table_data.append([store["label"], f"{turnover_week:,.2f}", f"{turnover_month:,.2f}", f"{turnover_year:,.2f}"])
+        table_data.append([label, f"{turnover_week:,.2f}", f"{turnover_month:,.2f}", f"{turnover_year:,.2f}"])
 
     table = Table(table_data, colWidths=[2.5 * inch, 1.8 * inch, 1.8 * inch, 1.8 * inch])  # Увеличили ширину столбцов
     table.setStyle(TableStyle([
@@ -144,17 +145,12 @@ def create_pdf_with_table_and_graphs(data, graph_bytes):
     return pdf_buffer
 
 
-# Функция загрузки данных из JSON
-def load_revenue_data(filepath: str) -> dict:
-    try:
-        with open(filepath, 'r', encoding='utf-8') as file:
-            return json.load(file)
-    except Exception as e:
-        logging.error(f"Ошибка при чтении файла {filepath}: {e}")
-        return {}
+def render_pdf_report(data: ColumnarReport | dict) -> bytes:
+    """Строит график и PDF, выполняется в процессе рендеринга."""
+    return create_pdf_with_table_and_graphs(data, create_combined_graph(data)).getvalue()
 
 
-@trade_turnover_pdf_router.callback_query(F.data == "format_pdf_turnover")
+@trade_turnover_pdf_router.callback("format_pdf_turnover")
 async def generate_report(callback_query: types.CallbackQuery, state: FSMContext):
     """Обработчик для кнопки 'Сформировать PDF отчёт по товарообороту'."""
     # Отвечаем на callback_query, чтобы убрать "часики" у кнопки
@@ -165,23 +161,18 @@ async def generate_report(callback_query: types.CallbackQuery, state: FSMContext
 
     # Загрузка данных из JSON-файла
     filepath = r"C:\WORK\sova_rest_bot\sova_rest_bot-master\files\jsons_for_reports\turnover-store_example.json"
-    turnover_data = load_revenue_data(filepath)  # Используем ту же функцию для загрузки данных
+    turnover_data = load_report(filepath)
 
     if not turnover_data:
         await callback_query.message.answer("Ошибка при загрузке данных для отчёта.")
         return
 
-    # Генерация графика
+    # Генерация графика и PDF
     try:
-        graph_bytes = create_combined_graph(turnover_data)
-    except Exception as e:
-        logging.error(f"Ошибка при создании графика: {e}")
-        await callback_query.message.answer("Ошибка при создании графика для отчёта.")
+        pdf_bytes = await render_service.render(callback_query.from_user.id, render_pdf_report, turnover_data)
+    except RenderRejectedError as e:
+        await callback_query.message.answer(str(e))
         return
-
-    # Создание PDF
-    try:
-        pdf_buffer = create_pdf_with_table_and_graphs(turnover_data, graph_bytes)
     except Exception as e:
         logging.error(f"Ошибка при создании PDF: {e}")
         await callback_query.message.answer("Ошибка при создании PDF-отчёта.")
@@ -190,7 +181,7 @@ async def generate_report(callback_query: types.CallbackQuery, state: FSMContext
     # Отправка PDF пользователю
     try:
         # Создаём объект BufferedInputFile для отправки PDF
-        input_file = BufferedInputFile(pdf_buffer.getvalue(), filename=f"trade_turnover_{report_type}.pdf")
+        input_file = BufferedInputFile(pdf_bytes, filename=f"trade_turnover_{report_type}.pdf")
 
         # Отправляем документ пользователю
         await callback_query.message.answer_document(
@@ -1,14 +1,18 @@
 import json
 import logging
 import os
+from io import BytesIO
 from aiogram.types import CallbackQuery, BufferedInputFile
 from openpyxl import Workbook
 from openpyxl.styles import Font, NamedStyle
 from aiogram import Router, F
+from src.util.routing.callback_router import CallbackRouter
+from src.basic.report_model import ColumnarReport, as_report, load_report
+from src.util.render.service import RenderRejectedError, render_service
 
-trade_turnover_excel_report_router = Router()
+trade_turnover_excel_report_router = CallbackRouter()
 
-def create_excel_report(data: dict, filename: str):
+def create_excel_report(data: ColumnarReport | dict, filename: str | BytesIO):
     """Создаёт Excel-файл с анализом"""
     wb = Workbook()
     ws = wb.active
@@ -28,24 +32,18 @@ def create_excel_report(data: dict, filename: str):
     for cell in ws[1]:
         cell.font = Font(bold=True)
 
-    for item in data["data"]:
-        row = [
-            item["label"], item["expense_day"], item["turnover_in_days"],
-            item["turnover_in_days_dynamic_week"], item["turnover_in_days_dynamic_month"],
-            item["turnover_in_days_dynamic_year"], item["turnover_in_days_week"],
-            item["turnover_in_days_month"], item["turnover_in_days_year"],
-            item["remainder_end"]
-        ]
+    columns = (
+        "expense_day", "turnover_in_days",
+        "turnover_in_days_dynamic_week", "turnover_in_days_dynamic_month", "turnover_in_days_dynamic_year",
+        "turnover_in_days_week", "turnover_in_days_month", "turnover_in_days_year",
+        "remainder_end"
+    )
+    report = as_report(data)
+
+    for row in report.rows(*columns):
         ws.append(row)
 
-    total_row = [
-        data["sum"]["label"], data["sum"]["expense_day"], data["sum"]["turnover_in_days"],
-        data["sum"]["turnover_in_days_dynamic_week"], data["sum"]["turnover_in_days_dynamic_month"],
-        data["sum"]["turnover_in_days_dynamic_year"], data["sum"]["turnover_in_days_week"],
-        data["sum"]["turnover_in_days_month"], data["sum"]["turnover_in_days_year"],
-        data["sum"]["remainder_end"]
-    ]
-    ws.append(total_row)
+    ws.append(report.total_row(*columns))
 
     for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=2, max_col=10):
         for cell in row:
@@ -54,16 +52,14 @@ def create_excel_report(data: dict, filename: str):
     wb.save(filename)
     return filename
 
-def load_revenue_data(filepath: str) -> dict:
-    """Загружает данные из JSON-файла."""
-    try:
-        with open(filepath, 'r', encoding='utf-8') as file:
-            return json.load(file)
-    except Exception as e:
-        logging.error(f"Ошибка при чтении файла {filepath}: {e}")
-        return {}
 
-@trade_turnover_excel_report_router.callback_query(F.data == "format_excel_turnover")
+def render_excel_report(data: ColumnarReport | dict) -> bytes:
+    """Создаёт Excel-файл в памяти, выполняется в процессе рендеринга"""
+    buffer = BytesIO()
+    create_excel_report(data, buffer)
+    return buffer.getvalue()
+
+@trade_turnover_excel_report_router.callback("format_excel_turnover")
 async def handle_excel_request(callback_query: CallbackQuery):
     """Обработчик для кнопки 'Сформировать Excel отчёт по товарообороту'."""
     # Отвечаем на callback_query, чтобы убрать "часики" у кнопки
@@ -74,7 +70,7 @@ async def handle_excel_request(callback_query: CallbackQuery):
 
     # Загрузка данных из JSON-файла
     filepath = r"C:\WORK\sova_rest_bot\sova_rest_bot-master\files\jsons_for_reports\turnover-store_example.json"
-    turnover_data = load_revenue_data(filepath)  # Используем ту же функцию для загрузки данных
+    turnover_data = load_report(filepath)
 
     if not turnover_data:
         await callback_query.message.answer("Ошибка при загрузке данных для отчёта.")
@@ -82,7 +78,10 @@ async def handle_excel_request(callback_query: CallbackQuery):
 
     # Генерация Excel
     try:
-        filename = create_excel_report(turnover_data, filename=f"turnover_{report_type}.xlsx")
+        file_data = await render_service.render(callback_query.from_user.id, render_excel_report, turnover_data)
+    except RenderRejectedError as e:
+        await callback_query.message.answer(str(e))
+        return
     except Exception as e:
         logging.error(f"Ошибка при создании Excel-файла: {e}")
         await callback_query.message.answer(f"Ошибка при создании Excel-файла: {e}")
@@ -90,15 +89,8 @@ async def handle_excel_request(callback_query: CallbackQuery):
 
     # Отправка Excel файла
     try:
-        with open(filename, "rb") as file:
-            file_data = file.read()
-
         input_file = BufferedInputFile(file_data, filename=f"turnover_{report_type}.xlsx")
         await callback_query.message.answer_document(input_file, caption=f"Ваш отчёт по товарообороту (тип: {report_type}):")
     except Exception as e:
         logging.error(f"Ошибка при отправке Excel-файла: {e}")
         await callback_query.message.answer("Ошибка при отправке отчёта.")
-    finally:
-        # Удаляем временный файл после отправки
-        if os.path.exists(filename):
-            os.remove(filename)
\ No newline at end of file
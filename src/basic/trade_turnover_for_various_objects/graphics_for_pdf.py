@@ -15,24 +15,15 @@ from sympy.parsing.sympy_parser import null
 import logging
 from aiogram import Router, types, F
 from aiogram.types import FSInputFile, BufferedInputFile, CallbackQuery
+from src.util.routing.callback_router import CallbackRouter
+from src.basic.report_model import ColumnarReport, as_report, load_report
+from src.util.render.service import RenderRejectedError, register_font, render_service
 
-trade_turnover_for_various_objects_pdf_router = Router()
+trade_turnover_for_various_objects_pdf_router = CallbackRouter()
 
-# Функция загрузки данных из JSON
-def load_revenue_data(filepath: str) -> dict:
-    """Загружает данные из JSON-файла."""
-    try:
-        with open(filepath, 'r', encoding='utf-8') as file:
-            return json.load(file)
-    except Exception as e:
-        logging.error(f"Ошибка при чтении файла {filepath}: {e}")
-        return {}
-
-
-def create_pdf_with_narrow_table_and_graphs(data: dict, graph_bytes: BytesIO) -> BytesIO:
+def create_pdf_with_narrow_table_and_graphs(data: ColumnarReport | dict, graph_bytes: BytesIO) -> BytesIO:
     """Создает PDF с узкой таблицей и графиком."""
-    pdfmetrics.registerFont(
-        TTFont('FreeSerif', r"C:\WORK\sova_rest_bot\sova_rest_bot-master\src\basic\revenue_analysis\FreeSerif.ttf"))
+    register_font('FreeSerif', r"C:\WORK\sova_rest_bot\sova_rest_bot-master\src\basic\revenue_analysis\FreeSerif.ttf")
 
     title_style = ParagraphStyle(name='TitleStyle', fontName='FreeSerif', fontSize=10, alignment=1)  # Adjusted title size
     table_style = TableStyle([
@@ -73,32 +64,18 @@ def create_pdf_with_narrow_table_and_graphs(data: dict, graph_bytes: BytesIO) ->
         "Оборачиваемость за год", "Остаток на конец периода"
     ]
 
-    data_for_table = []
-    for item in data["data"]:
-        row = [
-            item["label"], item["expense_day"], item.get("turnover_in_days", ""),
-            item.get("turnover_in_days_dynamic_week", ""),
-            item.get("turnover_in_days_dynamic_month", ""),
-            item.get("turnover_in_days_dynamic_year", ""),
-            item.get("turnover_in_days_week", ""),
-            item.get("turnover_in_days_month", ""),
-            item.get("turnover_in_days_year", ""),
-            item["remainder_end"]
-        ]
-        data_for_table.append(row)
+    columns = (
+        "expense_day", "turnover_in_days",
+        "turnover_in_days_dynamic_week", "turnover_in_days_dynamic_month", "turnover_in_days_dynamic_year",
+        "turnover_in_days_week", "turnover_in_days_month", "turnover_in_days_year",
+        "remainder_end"
+    )
+    report = as_report(data)
+
+    data_for_table = report.rows(*columns, null="")
 
     # Adding totals
-    total_row = [
-        data["sum"]["label"], data["sum"]["expense_day"], data["sum"].get("turnover_in_days", ""),
-        data["sum"].get("turnover_in_days_dynamic_week", ""),
-        data["sum"].get("turnover_in_days_dynamic_month", ""),
-        data["sum"].get("turnover_in_days_dynamic_year", ""),
-        data["sum"].get("turnover_in_days_week", ""),
-        data["sum"].get("turnover_in_days_month", ""),
-        data["sum"].get("turnover_in_days_year", ""),
-        data["sum"]["remainder_end"]
-    ]
-    data_for_table.append(total_row)
+    data_for_table.append(report.total_row(*columns, null=""))
 
     # Create table with narrow columns
     table = Table([headers] + data_for_table, colWidths=col_widths)
@@ -123,20 +100,13 @@ def create_pdf_with_narrow_table_and_graphs(data: dict, graph_bytes: BytesIO) ->
 
 
 # Функция для создания комбинированного графика
-def create_combined_graph(data: dict) -> BytesIO:
+def create_combined_graph(data: ColumnarReport | dict) -> BytesIO:
     """Создает комбинированный график с динамикой товарооборота."""
-    # Подготовка данных для графика
-    labels = [item["label"] for item in data["data"]]
-
-    # Преобразуем данные в числовые значения, если необходимо
-    turnover_week = [
-        float(item["turnover_in_days_week"]) if item["turnover_in_days_week"] not in [None, ''] else 0
-        for item in data["data"]
-    ]
-    turnover_month = [
-        float(item["turnover_in_days_month"]) if item["turnover_in_days_month"] not in [None, ''] else 0
-        for item in data["data"]
-    ]
+    # Подготовка данных для графика, пустые значения заменяются на 0
+    report = as_report(data)
+    labels = report.labels
+    turnover_week = report.column("turnover_in_days_week").filled()
+    turnover_month = report.column("turnover_in_days_month").filled()
 
     # Создание графика
     fig, ax = plt.subplots(figsize=(10, 6))
@@ -157,7 +127,12 @@ def create_combined_graph(data: dict) -> BytesIO:
     return buf
 
 
-@trade_turnover_for_various_objects_pdf_router.callback_query(F.data == "format_pdf_turnover_by_objects")
+def render_pdf_report(data: ColumnarReport | dict) -> bytes:
+    """Строит график и PDF, выполняется в процессе рендеринга."""
+    return create_pdf_with_narrow_table_and_graphs(data, create_combined_graph(data)).getvalue()
+
+
+@trade_turnover_for_various_objects_pdf_router.callback("format_pdf_turnover_by_objects")
 async def handle_format_pdf_turnover_by_objects(callback_query: CallbackQuery):
     """Обработчик для кнопки 'Сформировать PDF отчёт по товарообороту для различных объектов'."""
     # Отвечаем на callback_query, чтобы убрать "часики" у кнопки
@@ -168,23 +143,18 @@ async def handle_format_pdf_turnover_by_objects(callback_query: CallbackQuery):
 
     # Загрузка данных из JSON-файла
     filepath = r"C:\WORK\sova_rest_bot\sova_rest_bot-master\files\jsons_for_reports\turnouver-product_example.json"
-    turnover_data = load_revenue_data(filepath)  # Используем ту же функцию для загрузки данных
+    turnover_data = load_report(filepath)
 
     if not turnover_data:
         await callback_query.message.answer("Ошибка при загрузке данных для отчёта.")
         return
 
-    # Генерация графика
+    # Генерация графика и PDF
     try:
-        graph_bytes = create_combined_graph(turnover_data)
-    except Exception as e:
-        logging.error(f"Ошибка при создании графика: {e}")
-        await callback_query.message.answer("Ошибка при создании графика для отчёта.")
+        pdf_bytes = await render_service.render(callback_query.from_user.id, render_pdf_report, turnover_data)
+    except RenderRejectedError as e:
+        await callback_query.message.answer(str(e))
         return
-
-    # Создание PDF
-    try:
-        pdf_buffer = create_pdf_with_narrow_table_and_graphs(turnover_data, graph_bytes)
     except Exception as e:
         logging.error(f"Ошибка при создании PDF: {e}")
         await callback_query.message.answer("Ошибка при создании PDF-отчёта.")
@@ -193,7 +163,7 @@ async def handle_format_pdf_turnover_by_objects(callback_query: CallbackQuery):
     # Отправка PDF пользователю
     try:
         # Создаём объект BufferedInputFile для отправки PDF
-        input_file = BufferedInputFile(pdf_buffer.getvalue(), filename=f"turnover_by_objects_{report_type}.pdf")
+        input_file = BufferedInputFile(pdf_bytes, filename=f"turnover_by_objects_{report_type}.pdf")
 
         # Отправляем документ пользователю
         await callback_query.message.answer_document(
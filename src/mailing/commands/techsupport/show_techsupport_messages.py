@@ -1,3 +1,6 @@
+from asyncio import gather
+from functools import partial
+
 from aiogram import Router, F
 from aiogram.types import CallbackQuery
 from aiogram.fsm.context import FSMContext
@@ -10,6 +13,7 @@ from .text_and_kb import get_ts_text, get_answer_ts_kb
 from ...data.techsupport.techsupport_google_sheets_worker import techsupport_gsworker, TechSupportMessage, Const
 
 from src.util.log import logger
+from src.util.telegram.send_queue import send_queue
 
 router = Router(name=__name__)
 
@@ -25,21 +29,20 @@ async def show_techsupport_messages_handler(query: CallbackQuery, state: FSMCont
         await query.answer()
         return
 
+    # tickets are queued at once and sent in order at the chat rate
+    sends = []
     for ts in tslist:
-        try:
-            if ts.photo_id == Const.NO_DATA or ts.photo_id == "":
-                await query.message.answer(
-                    text=get_ts_text(ts),
-                    reply_markup=get_answer_ts_kb(ts)
-                )
-            else:
-                await query.message.answer_photo(
-                    photo=ts.photo_id,
-                    caption=get_ts_text(ts),
-                    reply_markup=get_answer_ts_kb(ts)
-                )
-        except TelegramBadRequest as e:
-            logger.msg("ERROR", e.message, Fore.RED)
+        if ts.photo_id == Const.NO_DATA or ts.photo_id == "":
+            send = partial(query.message.answer, text=get_ts_text(ts), reply_markup=get_answer_ts_kb(ts))
+        else:
+            send = partial(query.message.answer_photo, photo=ts.photo_id, caption=get_ts_text(ts), reply_markup=get_answer_ts_kb(ts))
+        sends.append(send_queue.send(query.message.chat.id, send))
+
+    for result in await gather(*sends, return_exceptions=True):
+        if isinstance(result, TelegramBadRequest):
+            logger.msg("ERROR", result.message, Fore.RED)
+        elif isinstance(result, Exception):
+            raise result
 
     await query.answer()
 
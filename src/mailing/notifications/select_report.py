@@ -2,6 +2,7 @@ import logging
 from aiogram import Router, F, types
 from aiogram.fsm.context import FSMContext
 from aiogram.types import CallbackQuery
+from src.util.routing.callback_router import CallbackRouter
 
 from src.basic.revenue_analysis.graphics_for_pdf import analys_revenue_pdf_router
 from src.basic.revenue_analysis.make_excel import analys_revenue_excel_router
@@ -28,10 +29,10 @@ from src.mailing.notifications.keyboards import get_action_report_markup, get_re
 
 
 
-subscribe_notifications = Router()
+subscribe_notifications = CallbackRouter()
 
 
-@subscribe_notifications.callback_query(F.data == 'generate_report')
+@subscribe_notifications.callback('generate_report')
 async def handle_generate_report(callback_query: CallbackQuery):
     """Обработчик для кнопки 'Сформировать отчёт'"""
     logging.info("Обработчик generate_report вызван")
@@ -42,7 +43,7 @@ async def handle_generate_report(callback_query: CallbackQuery):
     )
 
 
-@subscribe_notifications.callback_query(F.data.startswith('report_'))
+@subscribe_notifications.callback_prefix('report_')
 async def handle_report_selection(callback_query: CallbackQuery):
     """Обработчик для выбора типа отчёта"""
     # Убираем "report_" из callback_data, чтобы получить чистое имя отчёта
@@ -65,13 +66,13 @@ TEXT_REPORT_TYPES = {
     "text_report_food_cost", "text_report_turnover", "text_report_antitheft"
 }
 
-@subscribe_notifications.callback_query(F.data.startswith(tuple(TEXT_REPORT_TYPES)))
+@subscribe_notifications.callback(*TEXT_REPORT_TYPES)
 async def report_handler(callback: CallbackQuery):
     """Обработчик для текстовых и файловых отчётов, отправляет заглушку 'В процессе'"""
     await callback.message.answer("В процессе...")
     await callback.answer()  # Закрываем всплывающее уведомление
 
-@subscribe_notifications.callback_query(F.data.startswith('generate_now_'))
+@subscribe_notifications.callback_prefix('generate_now_')
 async def handle_generate_now(callback_query: CallbackQuery):
     """Обработчик для выбора 'Сформировать отчёт сейчас'"""
     report_type = callback_query.data.replace("generate_now_", "", 1)
@@ -87,7 +88,7 @@ async def handle_generate_now(callback_query: CallbackQuery):
     )
 
 
-@subscribe_notifications.callback_query(F.data.startswith('subscribe_'))
+@subscribe_notifications.callback_prefix('subscribe_')
 async def handle_subscribe(callback_query: CallbackQuery, state: FSMContext):
     """Обработчик для выбора 'Подписаться на рассылку'"""
     # Извлекаем тип отчёта из callback_data
@@ -110,7 +111,7 @@ async def handle_subscribe(callback_query: CallbackQuery, state: FSMContext):
     await callback_query.message.answer("Выберите периодичность рассылки:", reply_markup=keyboard)
 
 
-@subscribe_notifications.callback_query(F.data == 'report_revenue_analysis')
+@subscribe_notifications.callback('report_revenue_analysis')
 async def handle_revenue_analysis(callback_query: CallbackQuery):
     """Обработчик для отчета по анализу выручки"""
     await callback_query.answer("Вы выбрали отчет по анализу выручки.")
@@ -120,7 +121,7 @@ async def handle_revenue_analysis(callback_query: CallbackQuery):
     )
 
 
-@subscribe_notifications.callback_query(F.data == 'report_turnover')
+@subscribe_notifications.callback('report_turnover')
 async def handle_turnover(callback_query: CallbackQuery):
     """Обработчик для отчета по товарообороту"""
     await callback_query.answer("Вы выбрали отчет по товарообороту.")
@@ -130,7 +131,7 @@ async def handle_turnover(callback_query: CallbackQuery):
     )
 
 
-@subscribe_notifications.callback_query(F.data == 'report_turnover_by_objects')
+@subscribe_notifications.callback('report_turnover_by_objects')
 async def handle_turnover_by_objects(callback_query: CallbackQuery):
     """Обработчик для отчета по товарообороту для различных объектов"""
     await callback_query.answer("Вы выбрали отчет по товарообороту для различных объектов.")
@@ -140,7 +141,7 @@ async def handle_turnover_by_objects(callback_query: CallbackQuery):
     )
 
 
-@subscribe_notifications.callback_query(F.data == 'report_loss_forecast')
+@subscribe_notifications.callback('report_loss_forecast')
 async def handle_loss_forecast(callback_query: CallbackQuery):
     """Обработчик для отчета по прогнозированию потерь для товаров"""
     await callback_query.answer("Вы выбрали отчет по прогнозированию потерь для товаров.")
@@ -150,7 +151,7 @@ async def handle_loss_forecast(callback_query: CallbackQuery):
     )
 
 
-@subscribe_notifications.callback_query(F.data == 'report_inventory')
+@subscribe_notifications.callback('report_inventory')
 async def handle_inventory(callback_query: CallbackQuery):
     """Обработчик для отчета по инвентаризации на складе"""
     await callback_query.answer("Вы выбрали отчет по инвентаризации на складе.")
@@ -160,7 +161,7 @@ async def handle_inventory(callback_query: CallbackQuery):
     )
 
 
-@subscribe_notifications.callback_query(F.data == 'report_food_cost')
+@subscribe_notifications.callback('report_food_cost')
 async def handle_food_cost(callback_query: CallbackQuery):
     """Обработчик для отчета по себестоимости продуктов"""
     await callback_query.answer("Вы выбрали отчет по себестоимости продуктов.")
@@ -170,7 +171,7 @@ async def handle_food_cost(callback_query: CallbackQuery):
     )
 
 
-@subscribe_notifications.callback_query(F.data == 'report_food_cost_dynamics')
+@subscribe_notifications.callback('report_food_cost_dynamics')
 async def handle_food_cost_dynamics(callback_query: CallbackQuery):
     """Обработчик для отчета по себестоимости продуктов с изменениями"""
     await callback_query.answer("Вы выбрали отчет по себестоимости продуктов с изменениями.")
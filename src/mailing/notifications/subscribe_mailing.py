@@ -6,7 +6,9 @@ from aiogram import Dispatcher, Router, F, types
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKeyboardMarkup
+from src.util.routing.callback_router import CallbackRouter
 import asyncpg
+from src.util.db.postgres import pg_pool
 from datetime import datetime, time
 
 import config as cf
@@ -16,7 +18,7 @@ from src.mailing.notifications.select_report import subscribe_notifications, set
 from src.sound_and_text_ai.ai_answers import ai_answer
 
 
-subcsribe_mailing_router = Router()
+subcsribe_mailing_router = CallbackRouter()
 
 
 # Класс состояний для FSM
@@ -48,8 +50,7 @@ logging.basicConfig(level=logging.INFO)
 
 
 async def init_db_pool():
-    db_link = cf.DB_LINK
-    return await asyncpg.create_pool(db_link)
+    return await pg_pool.get_pool()
 
 
 db_pool = None
@@ -76,14 +77,14 @@ class NotificationGoogleSheetsWorker:
             logging.info(f"User {user_id} removed from subscription list.")
 
 
-@subcsribe_mailing_router.callback_query(F.data == 'register_mailing')
+@subcsribe_mailing_router.callback('register_mailing')
 async def subscribe_to_mailing(callback_query: CallbackQuery, state: FSMContext):
     logging.info(f"User {callback_query.from_user.id} started subscription process.")
     keyboard = periodicity_kb
     await callback_query.message.answer("Выберите периодичность рассылки:", reply_markup=keyboard)
 
 
-@subcsribe_mailing_router.callback_query(F.data.startswith("sub_"))
+@subcsribe_mailing_router.callback_prefix("sub_")
 async def choose_subscription_type(callback_query: CallbackQuery, state: FSMContext):
     sub_type = callback_query.data.split("_")[1]
     logging.info(f"User {callback_query.from_user.id} selected subscription type: {sub_type}")
@@ -104,7 +105,7 @@ async def choose_subscription_type(callback_query: CallbackQuery, state: FSMCont
     await callback_query.message.answer("Выберите ваш часовой пояс:", reply_markup=timezone_kb)
 
 
-@subcsribe_mailing_router.callback_query(F.data.startswith("tz_"))
+@subcsribe_mailing_router.callback_prefix("tz_")
 async def choose_timezone(callback_query: CallbackQuery, state: FSMContext):
     timezone_offset = int(callback_query.data.split("_")[1])
     logging.info(f"User {callback_query.from_user.id} selected timezone offset: {timezone_offset}")
@@ -211,10 +212,10 @@ async def save_time(message: Message, state: FSMContext):
         await message.answer("Неверный формат времени. Пожалуйста, используйте формат HH:MM.")
 
 
-@subcsribe_mailing_router.callback_query(F.data == 'show_subscriptions')
+@subcsribe_mailing_router.callback('show_subscriptions')
 async def show_subscriptions(callback_query: CallbackQuery):
     logging.info(f"User {callback_query.from_user.id} requested to show subscriptions.")
-    conn = await asyncpg.connect(**DB_CONFIG)
+    conn = await pg_pool.acquire()
     try:
         subscriptions = await conn.fetch(''' 
             SELECT subscription_type, periodicity, weekday, day_of_month, time
@@ -247,21 +248,21 @@ async def show_subscriptions(callback_query: CallbackQuery):
         logging.error(f"Error fetching subscriptions for user {callback_query.from_user.id}: {e}")
         await callback_query.message.answer("Произошла ошибка при извлечении подписок. Попробуйте позже.")
     finally:
-        await conn.close()
+        await pg_pool.release(conn)
 
 
 async def execute_db_query(query: str, *args):
-    conn = await asyncpg.connect(**DB_CONFIG)
+    conn = await pg_pool.acquire()
     try:
         return await conn.fetch(query, *args)
     except Exception as e:
         logging.error(f"DB error: {e}")
         return None
     finally:
-        await conn.close()
+        await pg_pool.release(conn)
 
 
-@subcsribe_mailing_router.callback_query(F.data.startswith("unsubscribe_"))
+@subcsribe_mailing_router.callback_prefix("unsubscribe_")
 async def unsubscribe(callback_query: CallbackQuery):
     subscription_data = callback_query.data.split("_")
 
@@ -283,7 +284,7 @@ async def unsubscribe(callback_query: CallbackQuery):
         await callback_query.message.answer(f"Некорректное время для подписки: {time_str}. Ожидаемый формат - HH:MM.")
         return
 
-    conn = await asyncpg.connect(**DB_CONFIG)
+    conn = await pg_pool.acquire()
     try:
         await conn.execute(''' 
             DELETE FROM subscriptions 
@@ -295,11 +296,11 @@ async def unsubscribe(callback_query: CallbackQuery):
         logging.error(f"Ошибка при удалении подписки: {e}")
         await callback_query.message.answer("Произошла ошибка при удалении подписки. Попробуйте позже.")
     finally:
-        await conn.close()
+        await pg_pool.release(conn)
 
 
 # Обработчик нажатия на кнопку подписки
-@subcsribe_mailing_router.callback_query(F.data.startswith("subscription_"))
+@subcsribe_mailing_router.callback_prefix("subscription_")
 async def manage_subscription(callback_query: CallbackQuery):
     subscription_data = callback_query.data.split("_")
     subscription_type = subscription_data[1]
@@ -316,9 +317,9 @@ async def manage_subscription(callback_query: CallbackQuery):
     await callback_query.message.answer("Что вы хотите сделать с этой подпиской?", reply_markup=keyboard)
 
 
-@subcsribe_mailing_router.callback_query(F.data == "back_to_subscriptions")
+@subcsribe_mailing_router.callback("back_to_subscriptions")
 async def back_to_subscriptions(callback_query: CallbackQuery):
-    conn = await asyncpg.connect(**DB_CONFIG)
+    conn = await pg_pool.acquire()
     try:
         subscriptions = await conn.fetch(''' 
             SELECT subscription_type, periodicity, weekday, day_of_month, time
@@ -356,34 +357,7 @@ async def back_to_subscriptions(callback_query: CallbackQuery):
         logging.error(f"Error fetching subscriptions: {e}")
         await callback_query.message.answer("Произошла ошибка при извлечении подписок. Попробуйте позже.")
     finally:
-        await conn.close()
-
-
-@subcsribe_mailing_router.callback_query(F.data.startswith("unsubscribe_"))
-async def unsubscribe(callback_query: CallbackQuery):
-    subscription_data = callback_query.data.split("_")
-    subscription_type = subscription_data[1]
-    time_str = subscription_data[2]
-
-    try:
-        time_obj = datetime.strptime(time_str, '%H:%M').time()  # Используем формат без секунд
-    except ValueError:
-        await callback_query.message.answer("Некорректное время для подписки.")
-        return
-
-    conn = await asyncpg.connect(**DB_CONFIG)
-    try:
-        await conn.execute(''' 
-            DELETE FROM subscriptions 
-            WHERE user_id = $1 AND subscription_type = $2 AND time = $3
-        ''', callback_query.from_user.id, subscription_type, time_obj)
-
-        await callback_query.message.answer(f"Вы успешно отменили подписку на {subscription_type} в {time_str}.")
-    except Exception as e:
-        logging.error(f"Failed to unsubscribe: {e}")
-        await callback_query.message.answer("Произошла ошибка при удалении подписки. Попробуйте позже.")
-    finally:
-        await conn.close()
+        await pg_pool.release(conn)
 
 
 @subcsribe_mailing_router.message(SubscriptionState.choosing_time)
@@ -452,7 +426,7 @@ async def save_subscription(user_id, sub_type, periodicity, weekday, day_of_mont
     logging.info(f"  - Time: {time_obj}")
     logging.info(f"  - Timezone offset: {timezone_offset}")
 
-    conn = await asyncpg.connect(**DB_CONFIG)
+    conn = await pg_pool.acquire()
     try:
         logging.info("Executing SQL query to save subscription.")
         await conn.execute(''' 
@@ -464,4 +438,4 @@ async def save_subscription(user_id, sub_type, periodicity, weekday, day_of_mont
     except Exception as e:
         logging.error(f"Failed to save subscription: {e}")
     finally:
-        await conn.close()
+        await pg_pool.release(conn)
@@ -0,0 +1,53 @@
+from asyncio import Lock
+
+import asyncpg
+
+import config as cf
+from src.util.log import logger
+
+
+class PostgresPool:
+    # one pool per process, created at startup (or by the first acquire) and shared by all handlers
+    dsn: str
+    pool: asyncpg.Pool | None
+    lock: Lock
+
+    def __init__(self, dsn: str) -> None:
+        self.dsn = dsn
+        self.pool = None
+        self.lock = Lock()
+
+    async def start(self) -> asyncpg.Pool:
+        async with self.lock:
+            if self.pool is None:
+                self.pool = await asyncpg.create_pool(
+                    self.dsn,
+                    min_size=cf.PG_POOL_MIN_SIZE,
+                    max_size=cf.PG_POOL_MAX_SIZE,
+                    # prepared statements are cached per connection, so repeated queries skip parsing
+                    statement_cache_size=cf.PG_STATEMENT_CACHE_SIZE,
+                    max_inactive_connection_lifetime=cf.PG_POOL_MAX_INACTIVE_LIFETIME,
+                )
+                logger.info(f"Postgres pool created: min_size={cf.PG_POOL_MIN_SIZE}, max_size={cf.PG_POOL_MAX_SIZE}")
+        return self.pool
+
+    async def close(self) -> None:
+        async with self.lock:
+            if self.pool is not None:
+                await self.pool.close()
+                self.pool = None
+
+    async def get_pool(self) -> asyncpg.Pool:
+        if self.pool is None:
+            return await self.start()
+        return self.pool
+
+    async def acquire(self) -> asyncpg.Connection:
+        pool = await self.get_pool()
+        return await pool.acquire()
+
+    async def release(self, conn: asyncpg.Connection) -> None:
+        await self.pool.release(conn)
+
+
+pg_pool = PostgresPool(cf.DB_LINK)
@@ -0,0 +1,347 @@
+import json
+import sqlite3
+import zlib
+from asyncio import create_task, wrap_future
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from time import time
+from typing import Any, Callable
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from cachetools import LRUCache
+
+import config as cf
+from src.util.db.postgres import PostgresPool, pg_pool
+from src.util.log import logger
+
+
+# serialized values start with a format byte
+RAW = b"\x00"
+ZLIB = b"\x01"
+# in the data a blob is replaced by {BLOB_REF: sha256 of its serialized value}
+BLOB_REF = "__blob__"
+
+
+def dumps(value: Any) -> bytes:
+    raw = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+    if len(raw) < cf.FSM_COMPRESS_MIN_SIZE:
+        return RAW + raw
+    return ZLIB + zlib.compress(raw)
+
+
+def loads(raw: bytes) -> Any:
+    if raw[:1] == ZLIB:
+        return json.loads(zlib.decompress(raw[1:]))
+    return json.loads(raw[1:])
+
+
+class SQLiteFSMBackend:
+    # one connection in a dedicated thread, processes on the same host share the file (WAL)
+    executor: ThreadPoolExecutor
+    conn: sqlite3.Connection | None
+    path: str
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.conn = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm_storage")
+
+    def _connect(self) -> None:
+        self.conn = sqlite3.connect(self.path, cached_statements=32)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        # other bot processes may hold the write lock for a moment
+        self.conn.execute('PRAGMA busy_timeout=5000')
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS FSMStates (
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data BLOB,
+        updated_at REAL NOT NULL
+        )
+        ''')
+        self.conn.execute('''
+        CREATE TABLE IF NOT EXISTS FSMBlobs (
+        hash TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        updated_at REAL NOT NULL
+        )
+        ''')
+        self.conn.commit()
+
+    def _run(self, func: Callable, *args) -> Any:
+        if self.conn is None:
+            self._connect()
+        return func(self.conn, *args)
+
+    async def run(self, func: Callable, *args) -> Any:
+        return await wrap_future(self.executor.submit(self._run, func, *args))
+
+    async def get_state(self, key: str, expired_before: float) -> str | None:
+        return await self.run(_sqlite_get_state, key, expired_before)
+
+    async def get_data(self, key: str, expired_before: float) -> bytes | None:
+        return await self.run(_sqlite_get_data, key, expired_before)
+
+    async def set_state(self, key: str, state: str | None) -> None:
+        await self.run(_sqlite_set_state, key, state, time())
+
+    async def set_data(self, key: str, data: bytes, blobs: dict[str, bytes]) -> None:
+        await self.run(_sqlite_set_data, key, data, blobs, time())
+
+    async def get_blobs(self, hashes: list[str]) -> dict[str, bytes]:
+        return await self.run(_sqlite_get_blobs, hashes, time())
+
+    async def sweep(self, expired_before: float) -> int:
+        return await self.run(_sqlite_sweep, expired_before)
+
+    async def close(self) -> None:
+        await self.run(lambda conn: conn.close())
+        self.executor.shutdown(wait=False)
+
+
+# statements, executed in the db thread
+def _sqlite_get_state(conn: sqlite3.Connection, key: str, expired_before: float) -> str | None:
+    # the state filters read the state of every update, the data is not loaded for them
+    result = conn.execute('''
+    SELECT state FROM FSMStates WHERE key == ? AND updated_at >= ?
+    ''', (key, expired_before)).fetchone()
+    return None if result is None else result[0]
+
+
+def _sqlite_get_data(conn: sqlite3.Connection, key: str, expired_before: float) -> bytes | None:
+    result = conn.execute('''
+    SELECT data FROM FSMStates WHERE key == ? AND updated_at >= ?
+    ''', (key, expired_before)).fetchone()
+    return None if result is None else result[0]
+
+
+def _sqlite_set_state(conn: sqlite3.Connection, key: str, state: str | None, now: float) -> None:
+    # state and data are separate columns, so a state write never overwrites the data and vice versa
+    conn.execute('''
+    INSERT INTO FSMStates (key, state, updated_at) VALUES (?, ?, ?)
+    ON CONFLICT (key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+    ''', (key, state, now))
+    conn.commit()
+
+
+def _sqlite_set_data(conn: sqlite3.Connection, key: str, data: bytes, blobs: dict[str, bytes], now: float) -> None:
+    conn.executemany('''
+    INSERT INTO FSMBlobs (hash, value, updated_at) VALUES (?, ?, ?)
+    ON CONFLICT (hash) DO UPDATE SET updated_at = excluded.updated_at
+    ''', [(blob_hash, value, now) for blob_hash, value in blobs.items()])
+    conn.execute('''
+    INSERT INTO FSMStates (key, data, updated_at) VALUES (?, ?, ?)
+    ON CONFLICT (key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+    ''', (key, data, now))
+    conn.commit()
+
+
+def _sqlite_get_blobs(conn: sqlite3.Connection, hashes: list[str], now: float) -> dict[str, bytes]:
+    placeholders = ", ".join("?" * len(hashes))
+    rows = conn.execute(f'''
+    SELECT hash, value FROM FSMBlobs WHERE hash IN ({placeholders})
+    ''', hashes).fetchall()
+    # blobs in use are kept alive as long as their states
+    conn.execute(f'''
+    UPDATE FSMBlobs SET updated_at = ? WHERE hash IN ({placeholders})
+    ''', (now, *hashes))
+    conn.commit()
+    return dict(rows)
+
+
+def _sqlite_sweep(conn: sqlite3.Connection, expired_before: float) -> int:
+    deleted = conn.execute('''DELETE FROM FSMStates WHERE updated_at < ?''', (expired_before,)).rowcount
+    conn.execute('''DELETE FROM FSMBlobs WHERE updated_at < ?''', (expired_before,))
+    conn.commit()
+    return deleted
+
+
+class PostgresFSMBackend:
+    # shared by bot processes on different hosts
+    pool: PostgresPool
+    table_created: bool
+
+    def __init__(self, pool: PostgresPool) -> None:
+        self.pool = pool
+        self.table_created = False
+
+    async def acquire(self):
+        conn = await self.pool.acquire()
+        if not self.table_created:
+            await conn.execute('''
+            CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data BYTEA,
+            updated_at DOUBLE PRECISION NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS fsm_blobs (
+            hash TEXT PRIMARY KEY,
+            value BYTEA NOT NULL,
+            updated_at DOUBLE PRECISION NOT NULL
+            );
+            ''')
+            self.table_created = True
+        return conn
+
+    async def get_state(self, key: str, expired_before: float) -> str | None:
+        conn = await self.acquire()
+        try:
+            return await conn.fetchval('''
+            SELECT state FROM fsm_states WHERE key = $1 AND updated_at >= $2
+            ''', key, expired_before)
+        finally:
+            await self.pool.release(conn)
+
+    async def get_data(self, key: str, expired_before: float) -> bytes | None:
+        conn = await self.acquire()
+        try:
+            return await conn.fetchval('''
+            SELECT data FROM fsm_states WHERE key = $1 AND updated_at >= $2
+            ''', key, expired_before)
+        finally:
+            await self.pool.release(conn)
+
+    async def set_state(self, key: str, state: str | None) -> None:
+        conn = await self.acquire()
+        try:
+            await conn.execute('''
+            INSERT INTO fsm_states (key, state, updated_at) VALUES ($1, $2, $3)
+            ON CONFLICT (key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+            ''', key, state, time())
+        finally:
+            await self.pool.release(conn)
+
+    async def set_data(self, key: str, data: bytes, blobs: dict[str, bytes]) -> None:
+        now = time()
+        conn = await self.acquire()
+        try:
+            async with conn.transaction():
+                if blobs:
+                    await conn.executemany('''
+                    INSERT INTO fsm_blobs (hash, value, updated_at) VALUES ($1, $2, $3)
+                    ON CONFLICT (hash) DO UPDATE SET updated_at = excluded.updated_at
+                    ''', [(blob_hash, value, now) for blob_hash, value in blobs.items()])
+                await conn.execute('''
+                INSERT INTO fsm_states (key, data, updated_at) VALUES ($1, $2, $3)
+                ON CONFLICT (key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+                ''', key, data, now)
+        finally:
+            await self.pool.release(conn)
+
+    async def get_blobs(self, hashes: list[str]) -> dict[str, bytes]:
+        conn = await self.acquire()
+        try:
+            rows = await conn.fetch('''
+            UPDATE fsm_blobs SET updated_at = $2 WHERE hash = ANY($1) RETURNING hash, value
+            ''', hashes, time())
+        finally:
+            await self.pool.release(conn)
+        return {row["hash"]: row["value"] for row in rows}
+
+    async def sweep(self, expired_before: float) -> int:
+        conn = await self.acquire()
+        try:
+            deleted = await conn.fetchval('''
+            WITH deleted AS (DELETE FROM fsm_states WHERE updated_at < $1 RETURNING 1) SELECT count(*) FROM deleted
+            ''', expired_before)
+            await conn.execute('''DELETE FROM fsm_blobs WHERE updated_at < $1''', expired_before)
+        finally:
+            await self.pool.release(conn)
+        return deleted
+
+    async def close(self) -> None:
+        # the pool is shared and closed by its owner
+        pass
+
+
+class PersistentStorage(BaseStorage):
+    # aiogram FSM storage over SQLite or Postgres: idle states expire after ttl, large values are stored once by hash
+    backend: SQLiteFSMBackend | PostgresFSMBackend
+    key_builder: DefaultKeyBuilder
+    ttl: int
+    blob_min_size: int
+    # blobs are immutable (content addressed), so any worker may cache them
+    blob_cache: LRUCache
+    last_sweep: float
+
+    def __init__(self, backend: SQLiteFSMBackend | PostgresFSMBackend, ttl: int, blob_min_size: int) -> None:
+        self.backend = backend
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.ttl = ttl
+        self.blob_min_size = blob_min_size
+        self.blob_cache = LRUCache(maxsize=cf.FSM_BLOB_CACHE_SIZE)
+        self.last_sweep = time()
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state = state.state if isinstance(state, State) else state
+        await self.backend.set_state(self.key_builder.build(key), state)
+        self.maybe_sweep()
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return await self.backend.get_state(self.key_builder.build(key), time() - self.ttl)
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        values = {}
+        blobs = {}
+        for name, value in data.items():
+            raw = dumps(value)
+            if len(raw) < self.blob_min_size:
+                values[name] = value
+                continue
+            blob_hash = sha256(raw).hexdigest()
+            blobs[blob_hash] = raw
+            self.blob_cache[blob_hash] = raw
+            values[name] = {BLOB_REF: blob_hash}
+        await self.backend.set_data(self.key_builder.build(key), dumps(values), blobs)
+        self.maybe_sweep()
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        raw = await self.backend.get_data(self.key_builder.build(key), time() - self.ttl)
+        if raw is None:
+            return {}
+        data = loads(raw)
+
+        refs = {name: value[BLOB_REF] for name, value in data.items() if isinstance(value, dict) and BLOB_REF in value}
+        if not refs:
+            return data
+        missing = [blob_hash for blob_hash in set(refs.values()) if blob_hash not in self.blob_cache]
+        if missing:
+            self.blob_cache.update(await self.backend.get_blobs(missing))
+        for name, blob_hash in refs.items():
+            blob = self.blob_cache.get(blob_hash)
+            if blob is None:
+                logger.msg("ERROR", f"FSM blob is missing: {name=}, {blob_hash=}")
+                data[name] = None
+            else:
+                data[name] = loads(blob)
+        return data
+
+    def maybe_sweep(self) -> None:
+        if time() - self.last_sweep < cf.FSM_SWEEP_INTERVAL:
+            return
+        self.last_sweep = time()
+        create_task(self.sweep())
+
+    async def sweep(self) -> None:
+        try:
+            deleted = await self.backend.sweep(time() - self.ttl)
+            logger.debug(f"FSM: expired states deleted: {deleted}")
+        except Exception as e:
+            logger.msg("ERROR", f"Could not delete expired FSM states: {e}")
+
+    async def close(self) -> None:
+        await self.backend.close()
+
+
+def create_fsm_storage() -> BaseStorage:
+    if cf.FSM_STORAGE == "sqlite":
+        backend = SQLiteFSMBackend(cf.FSM_STORAGE_DB_PATH)
+    elif cf.FSM_STORAGE == "postgres":
+        backend = PostgresFSMBackend(pg_pool)
+    else:
+        return MemoryStorage()
+    return PersistentStorage(backend, ttl=cf.FSM_STATE_TTL, blob_min_size=cf.FSM_BLOB_MIN_SIZE)
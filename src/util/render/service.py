@@ -0,0 +1,158 @@
+import multiprocessing
+import signal
+from asyncio import Semaphore, gather, get_running_loop
+from collections import Counter
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from os import getpid
+from typing import Any
+
+import matplotlib.pyplot as plt
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+
+from src.util.log import logger
+import config as cf
+
+
+class RenderRejectedError(Exception):
+    # the message is shown to the user as is
+    pass
+
+
+class RenderBusyError(RenderRejectedError):
+    def __init__(self) -> None:
+        super().__init__("Сейчас формируется слишком много отчётов, попробуйте через минуту.")
+
+
+class RenderUserLimitError(RenderRejectedError):
+    def __init__(self) -> None:
+        super().__init__("Дождитесь, пока сформируется предыдущий отчёт.")
+
+
+def register_font(name: str, path: str) -> None:
+    # TTFont parses the whole file, workers register the fonts once at start
+    if name in pdfmetrics.getRegisteredFontNames():
+        return
+    pdfmetrics.registerFont(TTFont(name, path))
+
+
+def init_worker(fonts: dict[str, str]) -> None:
+    # ctrl+c goes to the whole process group, the bot shuts the pool down itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    plt.switch_backend("Agg")
+    for name, path in fonts.items():
+        try:
+            register_font(name, path)
+        except Exception as e:
+            logger.msg("WARNING", f"Render worker {getpid()}: font {name} is not registered: {e}")
+
+
+def warm_up() -> int:
+    return getpid()
+
+
+def to_bytes(result: bytes | BytesIO) -> bytes:
+    if isinstance(result, BytesIO):
+        return result.getvalue()
+    if isinstance(result, bytes):
+        return result
+    # e.g. None from a renderer that failed and only printed the error
+    raise TypeError(f"Render job returned {type(result).__name__}, not bytes")
+
+
+def run_job(func: Callable[..., bytes | BytesIO], args: tuple) -> bytes:
+    # runs in a worker: only bytes are sent back to the bot
+    return to_bytes(func(*args))
+
+
+# imported once by the fork server, its workers start warm; job modules here must not import bot code
+WORKER_PRELOAD = [
+    "matplotlib.pyplot",
+    "openpyxl",
+    "seaborn",
+    "reportlab.platypus",
+    "src.util.render.service",
+    "src.basic.graphics.json_report",
+]
+
+
+def get_mp_context() -> multiprocessing.context.BaseContext:
+    # no fork of the bot process: it runs the event loop and the db threads, a forked child may inherit held locks
+    start_method = cf.RENDER_MP_START if cf.RENDER_MP_START in multiprocessing.get_all_start_methods() else "spawn"
+    context = multiprocessing.get_context(start_method)
+    if start_method == "forkserver":
+        context.set_forkserver_preload(WORKER_PRELOAD)
+    return context
+
+
+class RenderService:
+    # matplotlib, reportlab and openpyxl jobs run in worker processes, not in the event loop
+    workers: int
+    executor: ProcessPoolExecutor | None
+    # jobs in the workers, the rest wait here instead of the unbounded executor queue
+    running: Semaphore
+    # accepted jobs: running and waiting
+    pending: int
+    user_jobs: Counter
+
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+        self.executor = None
+        self.running = Semaphore(workers)
+        self.pending = 0
+        self.user_jobs = Counter()
+
+    def get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=get_mp_context(),
+                initializer=init_worker,
+                initargs=(cf.RENDER_FONTS,),
+            )
+        return self.executor
+
+    async def start(self) -> None:
+        # one job per worker so every process is started and initialized before the first report
+        loop = get_running_loop()
+        executor = self.get_executor()
+        pids = await gather(*(loop.run_in_executor(executor, warm_up) for _ in range(self.workers)))
+        logger.info(f"Render workers started: {sorted(set(pids))}")
+
+    async def close(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    async def render(self, user_id: int, func: Callable[..., bytes | BytesIO], *args: Any) -> bytes:
+        # func and args are pickled to a worker: func has to be a module-level function
+        if self.user_jobs[user_id] >= cf.RENDER_USER_JOBS:
+            raise RenderUserLimitError()
+        if self.pending >= cf.RENDER_QUEUE_SIZE:
+            logger.msg("WARNING", f"Render queue is full: {self.pending} jobs")
+            raise RenderBusyError()
+
+        self.pending += 1
+        self.user_jobs[user_id] += 1
+        try:
+            async with self.running:
+                executor = self.get_executor()
+                logger.debug(f"Render {func.__module__}.{func.__name__} for {user_id}")
+                return await get_running_loop().run_in_executor(executor, run_job, func, args)
+        except BrokenProcessPool:
+            # a worker died (e.g. out of memory), the next job starts a new pool
+            logger.msg("ERROR", "Render pool is broken, restarting it")
+            if self.executor is executor:
+                self.executor = None
+            raise
+        finally:
+            self.pending -= 1
+            self.user_jobs[user_id] -= 1
+            if self.user_jobs[user_id] <= 0:
+                del self.user_jobs[user_id]
+
+
+render_service = RenderService(cf.RENDER_WORKERS)
@@ -0,0 +1,169 @@
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Any
+
+from aiogram import Router
+from aiogram.dispatcher.event.handler import CallableObject
+from aiogram.types import CallbackQuery
+
+from src.util.log import logger
+
+
+@dataclass(slots=True, frozen=True)
+class Callback:
+    # "namespace:action:arg1:arg2" or the older "namespace_rest" (then action is the rest and there are no args)
+    namespace: str
+    action: str
+    args: tuple[str, ...] = ()
+
+
+def get_separator(data: str) -> str:
+    # the first separator decides: "unsubscribe_daily_10:00" is an older one with a time in it
+    colon = data.find(":")
+    underscore = data.find("_")
+    if colon != -1 and (underscore == -1 or colon < underscore):
+        return ":"
+    return "_"
+
+
+def split_callback_data(data: str) -> tuple[str, str]:
+    namespace, _, rest = data.partition(get_separator(data))
+    return namespace, rest
+
+
+def parse_callback(data: str) -> Callback:
+    namespace, rest = split_callback_data(data)
+    if get_separator(data) == "_":
+        return Callback(namespace=namespace, action=rest)
+    action, *args = rest.split(":")
+    return Callback(namespace=namespace, action=action, args=tuple(args))
+
+
+@dataclass(slots=True)
+class CallbackRoute:
+    # exact callback data or a prefix of it
+    data: str
+    is_prefix: bool
+    handler: CallableObject
+    # registration order, the first registered route wins
+    rank: int = 0
+
+    @property
+    def name(self) -> str:
+        callback = self.handler.callback
+        return f"{callback.__module__}.{callback.__qualname__}"
+
+    def describe(self) -> str:
+        return f"{self.data}{'*' if self.is_prefix else ''} -> {self.name}"
+
+
+class CallbackRouter(Router):
+    # callback_data is parsed once and the handler is found by a dict lookup instead of checking every filter in turn;
+    # every router dispatches only its own routes, so the middlewares and filters of included routers still apply
+    routes: dict[str, CallbackRoute]
+    # namespace -> prefix routes in this namespace, usually one
+    prefix_routes: dict[str, list[CallbackRoute]]
+    # every registered route, duplicates included, for the debug view
+    all_routes: list[CallbackRoute]
+    dispatcher_registered: bool
+
+    def __init__(self, *, name: str | None = None) -> None:
+        super().__init__(name=name)
+        self.routes = {}
+        self.prefix_routes = {}
+        self.all_routes = []
+        self.dispatcher_registered = False
+        self.startup.register(self.register_dispatcher)
+        self.startup.register(self.log_routes)
+
+    async def register_dispatcher(self) -> None:
+        # on startup, after the module registered all its handlers: plain callback_query handlers keep running first
+        if not self.dispatcher_registered:
+            self.callback_query.register(self.dispatch_callback, self.match_callback)
+            self.dispatcher_registered = True
+
+    def add_route(self, route: CallbackRoute) -> None:
+        self.all_routes.append(route)
+        if not route.is_prefix:
+            current = self.routes.get(route.data)
+            if current is None or route.rank < current.rank:
+                self.routes[route.data] = route
+            return
+
+        namespace, _rest = split_callback_data(route.data)
+        if namespace == route.data:
+            raise ValueError(f"Callback prefix must contain the namespace separator: {route.data!r}")
+        routes = self.prefix_routes.setdefault(namespace, [])
+        routes.append(route)
+        routes.sort(key=lambda item: item.rank)
+
+    def register_callback(self, handler: Callable, data: tuple[str, ...], is_prefix: bool) -> Callable:
+        callable_object = CallableObject(callback=handler)
+        for item in data:
+            self.add_route(CallbackRoute(data=item, is_prefix=is_prefix, handler=callable_object, rank=len(self.all_routes)))
+        return handler
+
+    def callback(self, *data: str) -> Callable[[Callable], Callable]:
+        # @router.callback("show_subscriptions") instead of @router.callback_query(F.data == "show_subscriptions")
+        def decorator(handler: Callable) -> Callable:
+            return self.register_callback(handler, data, is_prefix=False)
+        return decorator
+
+    def callback_prefix(self, *prefixes: str) -> Callable[[Callable], Callable]:
+        # @router.callback_prefix("unsubscribe_") instead of @router.callback_query(F.data.startswith("unsubscribe_"))
+        def decorator(handler: Callable) -> Callable:
+            return self.register_callback(handler, prefixes, is_prefix=True)
+        return decorator
+
+    def resolve(self, data: str) -> CallbackRoute | None:
+        route = self.routes.get(data)
+        namespace, _rest = split_callback_data(data)
+        for prefix_route in self.prefix_routes.get(namespace, ()):
+            if route is not None and route.rank < prefix_route.rank:
+                break
+            if data.startswith(prefix_route.data):
+                return prefix_route
+        return route
+
+    def match_callback(self, query: CallbackQuery) -> dict[str, Any] | bool:
+        if query.data is None:
+            return False
+        route = self.resolve(query.data)
+        if route is None:
+            return False
+        return {"callback_route": route, "parsed_callback": parse_callback(query.data)}
+
+    async def dispatch_callback(self, query: CallbackQuery, callback_route: CallbackRoute, **kwargs: Any) -> Any:
+        # the handler gets only the arguments it declares, as with a regular registration
+        return await callback_route.handler.call(query, **kwargs)
+
+    def conflicts(self) -> list[str]:
+        conflicts = []
+        for route in self.all_routes:
+            winner = self.resolve(route.data)
+            if winner is route:
+                continue
+            if winner.data == route.data and winner.is_prefix == route.is_prefix:
+                conflicts.append(f"duplicate: {route.describe()} never runs, {winner.describe()} does")
+            elif not route.is_prefix:
+                conflicts.append(f"shadowed: {route.describe()} never runs, {winner.describe()} does")
+            elif winner.is_prefix and route.data.startswith(winner.data):
+                conflicts.append(f"shadowed: {route.describe()} never runs, {winner.describe()} does")
+        return conflicts
+
+    def describe(self) -> str:
+        lines = [f"Callback routes of {self.name}:"]
+        lines += [f"  {route.describe()}" for route in self.all_routes]
+        conflicts = self.conflicts()
+        if conflicts:
+            lines.append("Conflicts:")
+            lines += [f"  {conflict}" for conflict in conflicts]
+        return "\n".join(lines)
+
+    async def log_routes(self) -> None:
+        # conflicts are found within one router, routers are checked in aiogram order anyway
+        if not self.all_routes:
+            return
+        logger.debug(self.describe())
+        for conflict in self.conflicts():
+            logger.msg("WARNING", f"Callback route {conflict}")
@@ -0,0 +1,282 @@
+from asyncio import Event, Future, Task, create_task, get_running_loop, sleep, wait_for
+from collections.abc import Awaitable, Callable, Hashable
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import IntEnum
+from functools import partial
+from heapq import heappop, heappush
+from itertools import count
+from time import monotonic
+from typing import Any
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageText, Response, TelegramMethod
+from cachetools import TTLCache
+
+from src.util.log import logger
+import config as cf
+
+
+class Priority(IntEnum):
+    # lower goes first
+    INTERACTIVE = 0  # replies to the user who is waiting
+    BROADCAST = 1  # mailing, notifications
+    BACKGROUND = 2  # cleanup: deleting old wizard messages
+
+
+# set while the queue runs a job: its Bot API calls are not queued again
+in_send_queue: ContextVar[bool] = ContextVar("in_send_queue", default=False)
+# priority of the calls queued by the middleware, a mailing job sets BROADCAST for its task
+send_priority: ContextVar[Priority] = ContextVar("send_priority", default=Priority.INTERACTIVE)
+
+
+def is_group_chat(chat_id: int | str) -> bool:
+    # group and channel ids are negative, "@username" is a public channel or supergroup
+    if isinstance(chat_id, str) and not chat_id.lstrip("-").isdigit():
+        return True
+    return int(chat_id) < 0
+
+
+class TokenBucket:
+    rate: float
+    capacity: float
+    tokens: float
+    updated_at: float
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def delay(self, now: float) -> float:
+        # seconds until one token is available
+        self.refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self.refill(now)
+        self.tokens -= 1
+
+
+@dataclass(order=True, slots=True)
+class SendJob:
+    priority: int
+    seq: int
+    factory: Callable[[], Awaitable[Any]] = field(compare=False)
+    future: Future = field(compare=False)
+    coalesce_key: Hashable | None = field(default=None, compare=False)
+    retries: int = field(default=0, compare=False)
+
+
+class SendQueue:
+    # all outgoing Bot API calls wait here for a global token and a token of their chat (groups have a slower bucket),
+    # the next call is the one of highest priority among chats that have a token; calls to one chat run one at a time
+    global_bucket: TokenBucket
+    # chat_id -> bucket, a bucket idle for its refill time is full again and can be forgotten
+    chat_buckets: TTLCache
+    # chat_id -> its pending jobs (heap by priority, then order of submission)
+    jobs: dict[int, list[SendJob]]
+    # (priority, seq, chat_id) of chats that can send now, entries not matching `scheduled` are outdated
+    ready: list[tuple[int, int, int]]
+    # (time, seq, chat_id) of chats waiting for their bucket
+    delayed: list[tuple[float, int, int]]
+    # chat_id -> key of its entry in ready, or DELAYED
+    scheduled: dict[int, tuple[int, int] | str]
+    # chats with a call in flight
+    busy: set[int]
+    # coalesce_key -> job that has not started yet
+    coalescing: dict[Hashable, SendJob]
+    paused_until: float
+    counter: count
+    wakeup: Event | None
+    worker: Task | None
+
+    DELAYED = "delayed"
+
+    def __init__(self) -> None:
+        self.global_bucket = TokenBucket(rate=cf.SEND_GLOBAL_RATE, capacity=cf.SEND_GLOBAL_RATE)
+        self.chat_buckets = TTLCache(maxsize=cf.SEND_CHAT_BUCKETS_SIZE, ttl=max(cf.SEND_CHAT_BURST / cf.SEND_CHAT_RATE, cf.SEND_GROUP_BURST / cf.SEND_GROUP_RATE))
+        self.jobs = {}
+        self.ready = []
+        self.delayed = []
+        self.scheduled = {}
+        self.busy = set()
+        self.coalescing = {}
+        self.paused_until = 0.0
+        self.counter = count()
+        self.wakeup = None
+        self.worker = None
+
+    def get_chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            if is_group_chat(chat_id):
+                bucket = TokenBucket(rate=cf.SEND_GROUP_RATE, capacity=cf.SEND_GROUP_BURST)
+            else:
+                bucket = TokenBucket(rate=cf.SEND_CHAT_RATE, capacity=cf.SEND_CHAT_BURST)
+        # set again to prolong the ttl
+        self.chat_buckets[chat_id] = bucket
+        return bucket
+
+    def start(self) -> None:
+        if self.worker is None or self.worker.done():
+            self.wakeup = Event()
+            self.worker = create_task(self.run())
+
+    async def close(self) -> None:
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker = None
+
+    def submit(self, chat_id: int | str, factory: Callable[[], Awaitable[Any]], priority: Priority = Priority.INTERACTIVE, coalesce_key: Hashable | None = None) -> Future:
+        self.start()
+
+        if coalesce_key is not None:
+            job = self.coalescing.get(coalesce_key)
+            if job is not None:
+                # the newer call replaces the pending one, both callers get its result
+                job.factory = factory
+                return job.future
+
+        job = SendJob(priority=priority, seq=next(self.counter), factory=factory, future=get_running_loop().create_future(), coalesce_key=coalesce_key)
+        if coalesce_key is not None:
+            self.coalescing[coalesce_key] = job
+        heappush(self.jobs.setdefault(chat_id, []), job)
+        self.schedule(chat_id)
+        return job.future
+
+    async def send(self, chat_id: int | str, factory: Callable[[], Awaitable[Any]], priority: Priority = Priority.INTERACTIVE, coalesce_key: Hashable | None = None) -> Any:
+        return await self.submit(chat_id, factory, priority, coalesce_key)
+
+    async def edit(self, chat_id: int | str, message_id: int, factory: Callable[[], Awaitable[Any]], priority: Priority = Priority.INTERACTIVE) -> Any:
+        # consecutive edits of one message that did not start yet are sent once, with the last text
+        return await self.send(chat_id, factory, priority, coalesce_key=("edit", chat_id, message_id))
+
+    def post(self, chat_id: int | str, factory: Callable[[], Awaitable[Any]], priority: Priority = Priority.BACKGROUND) -> None:
+        # nobody waits for the result, errors are logged
+        self.submit(chat_id, factory, priority).add_done_callback(log_error)
+
+    def schedule(self, chat_id: int | str) -> None:
+        if chat_id in self.busy or not self.jobs.get(chat_id) or self.scheduled.get(chat_id) == self.DELAYED:
+            return
+
+        now = monotonic()
+        delay = self.get_chat_bucket(chat_id).delay(now)
+        if delay > 0:
+            heappush(self.delayed, (now + delay, next(self.counter), chat_id))
+            self.scheduled[chat_id] = self.DELAYED
+        else:
+            head = self.jobs[chat_id][0]
+            key = (head.priority, head.seq)
+            if self.scheduled.get(chat_id) != key:
+                heappush(self.ready, (*key, chat_id))
+                self.scheduled[chat_id] = key
+        self.wakeup.set()
+
+    async def run(self) -> None:
+        while True:
+            now = monotonic()
+            while self.delayed and self.delayed[0][0] <= now:
+                _time, _seq, chat_id = heappop(self.delayed)
+                del self.scheduled[chat_id]
+                self.schedule(chat_id)
+
+            if not self.ready:
+                self.wakeup.clear()
+                timeout = self.delayed[0][0] - now if self.delayed else None
+                try:
+                    await wait_for(self.wakeup.wait(), timeout)
+                except TimeoutError:
+                    pass
+                continue
+
+            delay = max(self.global_bucket.delay(now), self.paused_until - now)
+            if delay > 0:
+                await sleep(delay)
+                continue
+
+            priority, seq, chat_id = heappop(self.ready)
+            if self.scheduled.get(chat_id) != (priority, seq):
+                continue
+            del self.scheduled[chat_id]
+
+            job = heappop(self.jobs[chat_id])
+            if job.coalesce_key is not None and self.coalescing.get(job.coalesce_key) is job:
+                del self.coalescing[job.coalesce_key]
+            if job.future.cancelled():
+                self.schedule(chat_id)
+                continue
+
+            self.global_bucket.take(now)
+            self.get_chat_bucket(chat_id).take(now)
+            self.busy.add(chat_id)
+            create_task(self.execute(chat_id, job))
+
+    async def execute(self, chat_id: int | str, job: SendJob) -> None:
+        # the task has its own context, the flag is not seen by the callers
+        in_send_queue.set(True)
+        try:
+            result = await job.factory()
+        except TelegramRetryAfter as e:
+            # flood control: everything waits, the job goes back to the head of its chat
+            logger.msg("WARNING", f"Telegram flood control: retry after {e.retry_after}s, {chat_id=}")
+            self.paused_until = max(self.paused_until, monotonic() + e.retry_after)
+            if job.retries < cf.SEND_RETRIES:
+                job.retries += 1
+                heappush(self.jobs.setdefault(chat_id, []), job)
+            elif not job.future.done():
+                job.future.set_exception(e)
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self.busy.discard(chat_id)
+            if self.jobs.get(chat_id):
+                self.schedule(chat_id)
+            else:
+                self.jobs.pop(chat_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "pending": sum(len(jobs) for jobs in self.jobs.values()),
+            "chats": len(self.jobs),
+            "in_flight": len(self.busy),
+        }
+
+
+class SendQueueMiddleware(BaseRequestMiddleware):
+    # every Bot API call to a chat goes through the queue, also message.answer, edit_text and answer_document
+    # of the handlers; calls without a chat (getUpdates, answerCallbackQuery) are made directly
+    queue: SendQueue
+
+    def __init__(self, queue: SendQueue) -> None:
+        self.queue = queue
+
+    async def __call__(self, make_request: NextRequestMiddlewareType, bot: Bot, method: TelegramMethod) -> Response:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or in_send_queue.get():
+            return await make_request(bot, method)
+        coalesce_key = None
+        if isinstance(method, EditMessageText) and method.message_id is not None:
+            # same key as SendQueue.edit
+            coalesce_key = ("edit", chat_id, method.message_id)
+        return await self.queue.send(chat_id, partial(make_request, bot, method), send_priority.get(), coalesce_key)
+
+
+def log_error(future: Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        logger.msg("ERROR", f"Could not send: {future.exception()!r}")
+
+
+send_queue = SendQueue()
+send_queue_middleware = SendQueueMiddleware(send_queue)
@@ -0,0 +1,84 @@
+import asyncio
+import json
+
+import pytest
+
+from src.analytics import cache
+from src.analytics.schemas import decode_report
+
+
+class Clock:
+    now: float
+
+    def __init__(self) -> None:
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> Clock:
+    # the report cache reads time() for the expiration of its entries and as the TLRU timer
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+
+def make_cache(disk_path: str | None = None) -> cache.ReportCache:
+    return cache.ReportCache(maxsize=10, closed_ttl=100, open_ttl=10, stale_maxsize=10, disk_path=disk_path)
+
+
+def key(scope: str, date_from: str = "2024-01-01") -> cache.ReportKey:
+    return (scope, "revenue", None, (), date_from, date_from)
+
+
+def test_open_period_expires_after_open_ttl(clock: Clock) -> None:
+    report_cache = make_cache()
+    asyncio.run(report_cache.set(key("a"), "report", is_closed=False))
+
+    clock.now += 9
+    assert asyncio.run(report_cache.get(key("a"))).report == "report"
+    clock.now += 2
+    assert asyncio.run(report_cache.get(key("a"))) is None
+    # the last good response is still there for a backend outage
+    assert report_cache.get_stale(key("a")).report == "report"
+
+
+def test_closed_period_lives_for_closed_ttl(clock: Clock) -> None:
+    report_cache = make_cache()
+    asyncio.run(report_cache.set(key("a"), "report", is_closed=True))
+
+    clock.now += 99
+    assert asyncio.run(report_cache.get(key("a"))).report == "report"
+    clock.now += 2
+    assert asyncio.run(report_cache.get(key("a"))) is None
+
+
+def test_invalidate_drops_only_the_scope(clock: Clock) -> None:
+    report_cache = make_cache()
+    asyncio.run(report_cache.set(key("a"), "a1", is_closed=False))
+    asyncio.run(report_cache.set(key("a", "2024-01-02"), "a2", is_closed=False))
+    asyncio.run(report_cache.set(key("b"), "b1", is_closed=False))
+
+    asyncio.run(report_cache.invalidate("a"))
+
+    assert asyncio.run(report_cache.get(key("a"))) is None
+    assert asyncio.run(report_cache.get(key("a", "2024-01-02"))) is None
+    assert report_cache.get_stale(key("a")) is None
+    assert asyncio.run(report_cache.get(key("b"))).report == "b1"
+
+
+def test_invalidate_drops_the_scope_from_disk(clock: Clock, tmp_path) -> None:
+    report_cache = make_cache(str(tmp_path / "reports.db"))
+    report = decode_report("revenue", json.dumps({"data": [{"label": "a", "revenue": 1}], "sum": None}))
+    for scope in ("a", "b"):
+        asyncio.run(report_cache.set(key(scope), report, is_closed=True))
+    # only the disk has them now
+    report_cache.clear()
+
+    asyncio.run(report_cache.invalidate("a"))
+
+    assert asyncio.run(report_cache.get(key("a"))) is None
+    assert asyncio.run(report_cache.get(key("b"))) is not None
+    report_cache.disk.close()
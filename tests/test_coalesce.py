@@ -0,0 +1,75 @@
+import asyncio
+
+from src.analytics.coalesce import RequestCoalescer
+
+
+def test_same_key_runs_once() -> None:
+    calls = 0
+
+    async def request() -> str:
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "report"
+
+    async def main() -> list[str]:
+        coalescer = RequestCoalescer()
+        results = await asyncio.gather(*(coalescer.run("key", request) for _ in range(3)))
+        assert coalescer.stats() == {"requests": 3, "coalesced": 2, "in_flight": 0}
+        return results
+
+    assert asyncio.run(main()) == ["report"] * 3
+    assert calls == 1
+
+
+def test_request_goes_on_while_a_waiter_is_left() -> None:
+    async def main() -> None:
+        coalescer = RequestCoalescer()
+        release = asyncio.Event()
+
+        async def request() -> str:
+            await release.wait()
+            return "report"
+
+        first = asyncio.create_task(coalescer.run("key", request))
+        second = asyncio.create_task(coalescer.run("key", request))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        task = coalescer.in_flight["key"]
+        assert not task.cancelled()
+
+        release.set()
+        assert await second == "report"
+        assert first.cancelled()
+
+    asyncio.run(main())
+
+
+def test_request_is_cancelled_when_no_waiters_are_left() -> None:
+    async def main() -> None:
+        coalescer = RequestCoalescer()
+        cancelled = asyncio.Event()
+
+        async def request() -> str:
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            return "report"
+
+        callers = [asyncio.create_task(coalescer.run("key", request)) for _ in range(2)]
+        await asyncio.sleep(0)
+        task = coalescer.in_flight["key"]
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0)
+
+        assert cancelled.is_set()
+        assert task.cancelled()
+        assert coalescer.in_flight == {}
+        assert coalescer.waiters == {}
+
+    asyncio.run(main())
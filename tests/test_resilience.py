@@ -0,0 +1,146 @@
+import asyncio
+
+import pytest
+from aiohttp import ClientError
+
+from src.analytics import resilience
+from src.analytics.resilience import BackendError, CircuitBreaker, CircuitOpenError, retry_with_backoff
+
+
+class Clock:
+    now: float
+
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch: pytest.MonkeyPatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(resilience, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def delays(monkeypatch: pytest.MonkeyPatch) -> list[float]:
+    # backoff delays of retry_with_backoff, not slept
+    delays = []
+
+    async def sleep(delay: float) -> None:
+        delays.append(delay)
+
+    monkeypatch.setattr(resilience, "sleep", sleep)
+    return delays
+
+
+async def fail() -> None:
+    raise ClientError("down")
+
+
+async def succeed() -> str:
+    return "ok"
+
+
+def call(breaker: CircuitBreaker, func) -> object:
+    try:
+        return asyncio.run(breaker.call(func))
+    except Exception as e:
+        return type(e)
+
+
+def test_breaker_opens_after_threshold(clock: Clock) -> None:
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30)
+
+    assert [call(breaker, fail) for _ in range(3)] == [ClientError] * 3
+    assert breaker.is_open
+    # open: the call is not made at all
+    assert call(breaker, succeed) is CircuitOpenError
+
+
+def test_breaker_success_resets_failures(clock: Clock) -> None:
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30)
+
+    call(breaker, fail)
+    call(breaker, fail)
+    assert call(breaker, succeed) == "ok"
+    call(breaker, fail)
+    assert not breaker.is_open
+
+
+def test_breaker_half_open_trial_closes_it(clock: Clock) -> None:
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    call(breaker, fail)
+
+    clock.now += 29
+    assert call(breaker, succeed) is CircuitOpenError
+    clock.now += 1
+    assert call(breaker, succeed) == "ok"
+    assert not breaker.is_open
+    assert breaker.failures == 0
+
+
+def test_breaker_failed_trial_opens_it_again(clock: Clock) -> None:
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30)
+    for _ in range(3):
+        call(breaker, fail)
+
+    clock.now += 30
+    assert call(breaker, fail) is ClientError
+    # the reset timeout starts again from the failed trial
+    clock.now += 29
+    assert call(breaker, succeed) is CircuitOpenError
+    clock.now += 1
+    assert call(breaker, succeed) == "ok"
+
+
+def test_breaker_allows_one_trial_at_a_time(clock: Clock) -> None:
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    call(breaker, fail)
+    clock.now += 30
+
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_retry_stops_after_attempts(delays: list[float]) -> None:
+    calls = 0
+
+    async def request() -> tuple[int, None]:
+        nonlocal calls
+        calls += 1
+        return 503, None
+
+    with pytest.raises(BackendError):
+        asyncio.run(retry_with_backoff(request, attempts=3, base_delay=1, max_delay=10))
+    assert calls == 3
+    # no sleep after the last attempt, each delay is within its backoff bound
+    assert len(delays) == 2
+    assert 0 <= delays[0] <= 1 and 0 <= delays[1] <= 2
+
+
+def test_retry_returns_first_non_server_error(delays: list[float]) -> None:
+    responses = iter([(502, None), (404, "not found"), (200, "ok")])
+
+    async def request() -> tuple[int, str | None]:
+        return next(responses)
+
+    assert asyncio.run(retry_with_backoff(request, attempts=5, base_delay=1, max_delay=10)) == (404, "not found")
+    assert len(delays) == 1
+
+
+def test_retry_delay_is_capped(delays: list[float]) -> None:
+    async def request() -> tuple[int, None]:
+        raise TimeoutError
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(retry_with_backoff(request, attempts=6, base_delay=1, max_delay=3))
+    assert len(delays) == 5
+    assert max(delays) <= 3
+
+
+def test_retry_needs_an_attempt() -> None:
+    with pytest.raises(ValueError):
+        asyncio.run(retry_with_backoff(succeed, attempts=0, base_delay=1, max_delay=10))
@@ -0,0 +1,47 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from src.analytics.schemas import decode_report, encode_report
+
+
+EXAMPLES = Path(__file__).parent.parent / "files" / "jsons_for_reports"
+
+# example file -> backend url of its schema
+example_urls = {
+    "example.json": "revenue",
+    "revenue analys.json": "revenue",
+    "food-cost-dish_server_data_example.json": "food-cost",
+    "food_cost_server_data_example.json": "food-cost",
+    "inventory_store_example.json": "inventory",
+    "loss-forecast_data_example.json": "loss-forecast",
+    "turnouver-product_example.json": "turnover",
+    "turnover-store_example.json": "turnover",
+}
+
+
+def missing_fields(raw: object, encoded: object, path: str = "") -> list[str]:
+    # fields of the backend response that did not survive decode -> encode
+    if isinstance(raw, dict):
+        missing = []
+        for key, value in raw.items():
+            if key not in encoded:
+                missing.append(f"{path}{key}")
+            else:
+                missing += missing_fields(value, encoded[key], f"{path}{key}.")
+        return missing
+    if isinstance(raw, list):
+        return [field for i, (r, e) in enumerate(zip(raw, encoded)) for field in missing_fields(r, e, f"{path}{i}.")]
+    return [] if raw == encoded else [f"{path[:-1]} ({raw!r} != {encoded!r})"]
+
+
+@pytest.mark.parametrize("file_name, url", example_urls.items())
+def test_schema_keeps_all_fields(file_name: str, url: str) -> None:
+    raw = (EXAMPLES / file_name).read_bytes()
+
+    report = decode_report(url, raw)
+    assert report is not None
+
+    encoded = json.loads(encode_report(url, report))
+    assert missing_fields(json.loads(raw), encoded) == []
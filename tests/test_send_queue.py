@@ -0,0 +1,71 @@
+import asyncio
+
+import pytest
+
+from src.util.telegram.send_queue import Priority, SendQueue, is_group_chat
+
+
+def test_chat_jobs_run_by_priority() -> None:
+    async def main() -> list[str]:
+        queue = SendQueue()
+        order = []
+
+        def job(name: str):
+            async def factory() -> str:
+                order.append(name)
+                return name
+            return factory
+
+        futures = [
+            queue.submit(1, job("cleanup"), Priority.BACKGROUND),
+            queue.submit(1, job("mailing"), Priority.BROADCAST),
+            queue.submit(1, job("reply"), Priority.INTERACTIVE),
+        ]
+        await asyncio.gather(*futures)
+        await queue.close()
+        return order
+
+    assert asyncio.run(main()) == ["reply", "mailing", "cleanup"]
+
+
+def test_pending_edits_of_a_message_are_sent_once() -> None:
+    async def main() -> tuple[list[str], list[str]]:
+        queue = SendQueue()
+        sent = []
+
+        def edit(text: str):
+            async def factory() -> str:
+                sent.append(text)
+                return text
+            return factory
+
+        results = await asyncio.gather(*(queue.edit(1, 10, edit(text)) for text in ("1/3", "2/3", "3/3")))
+        await queue.close()
+        return sent, results
+
+    sent, results = asyncio.run(main())
+    assert sent == ["3/3"]
+    assert results == ["3/3"] * 3
+
+
+def test_errors_reach_the_caller() -> None:
+    async def main() -> None:
+        queue = SendQueue()
+
+        async def factory() -> None:
+            raise ValueError("bad request")
+
+        try:
+            await queue.send(1, factory)
+        finally:
+            await queue.close()
+
+    with pytest.raises(ValueError):
+        asyncio.run(main())
+
+
+def test_group_chats() -> None:
+    assert is_group_chat(-100123)
+    assert is_group_chat("@channel")
+    assert not is_group_chat(123)
+    assert not is_group_chat("123")
@@ -0,0 +1,76 @@
+import asyncio
+import json
+from base64 import urlsafe_b64encode
+
+import pytest
+
+from src.analytics.auth import tokens
+from src.analytics.auth.tokens import TokenExpiredError, TokenManager, get_token_owner, get_token_scope
+
+NOW = 1_700_000_000.0
+
+
+def make_token(exp: float | None, user_id: str = "1", iat: float = NOW) -> str:
+    payload = {"userId": user_id, "slug": "network", "iat": iat}
+    if exp is not None:
+        payload["exp"] = exp
+    encoded = urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+    return f"header.{encoded}.signature"
+
+
+class FakeTokensDB:
+    tokens: dict[str, str]
+
+    def __init__(self, tokens: dict[str, str]) -> None:
+        self.tokens = tokens
+
+    async def get_token(self, tgid: str) -> str | None:
+        return self.tokens.get(tgid)
+
+
+@pytest.fixture(autouse=True)
+def now(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(tokens, "time", lambda: NOW)
+
+
+def test_expiring_returns_tokens_by_expiration() -> None:
+    manager = TokenManager(margin=60)
+    manager.track("late", make_token(NOW + 3600))
+    manager.track("soon", make_token(NOW + 100))
+    manager.track("never", make_token(None))
+
+    assert manager.expiring(within=50) == []
+    assert manager.expiring(within=100) == ["soon"]
+    assert manager.expiring(within=3600) == ["soon", "late"]
+
+
+def test_track_replaces_the_old_expiration() -> None:
+    manager = TokenManager(margin=60)
+    manager.track("user", make_token(NOW + 100))
+    manager.track("user", make_token(NOW + 3600))
+
+    assert manager.expiry_index == [(NOW + 3600, "user")]
+    manager.forget("user")
+    assert manager.expiry_index == []
+    assert manager.infos == {}
+
+
+def test_get_valid_token_fails_within_margin(monkeypatch: pytest.MonkeyPatch) -> None:
+    manager = TokenManager(margin=60)
+    monkeypatch.setattr(tokens, "user_tokens_db", FakeTokensDB({
+        "valid": make_token(NOW + 61),
+        "expiring": make_token(NOW + 60),
+    }))
+
+    assert asyncio.run(manager.get_valid_token("valid")) is not None
+    with pytest.raises(TokenExpiredError):
+        asyncio.run(manager.get_valid_token("expiring"))
+    assert asyncio.run(manager.get_valid_token("unknown")) is None
+
+
+def test_owner_stays_after_refresh() -> None:
+    old, new = make_token(NOW + 100), make_token(NOW + 3600, iat=NOW + 1)
+
+    assert get_token_scope(old) != get_token_scope(new)
+    assert get_token_owner(old) == get_token_owner(new)
+    assert get_token_owner(old) != get_token_owner(make_token(NOW + 100, user_id="2"))
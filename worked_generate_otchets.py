@@ -7,6 +7,8 @@ from aiogram.enums import ParseMode
 from aiogram.filters import Command
 from aiogram.types import Message
 import config as cf
+from src.analytics.api_client import sova_api_client
+from src.util.telegram.send_queue import send_queue, send_queue_middleware
 
 
 from src.mailing.notifications.select_report import subscribe_notifications, setup_routers_select_reports
@@ -99,11 +101,15 @@ def get_markup(user_id: int, has_token: bool) -> types.InlineKeyboardMarkup:
 
 async def main() -> None:
     bot = Bot(token=cf.TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+    bot.session.middleware(send_queue_middleware)
     dp.include_router(router)
     setup_routers_select_reports()
     dp.include_router(subscribe_notifications)
     dp.include_router(ai_answer)
     dp.include_router(subcsribe_mailing_router)
+    dp.startup.register(sova_api_client.start)
+    dp.shutdown.register(sova_api_client.close)
+    dp.shutdown.register(send_queue.close)
     await bot.delete_webhook()
 
     try:
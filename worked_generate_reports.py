@@ -5,6 +5,8 @@ from aiogram.filters import Command
 from aiogram.types import CallbackQuery
 import logging
 import config as cf
+from src.analytics.api_client import sova_api_client
+from src.util.telegram.send_queue import send_queue, send_queue_middleware
 
 import logging
 from io import BytesIO
@@ -322,6 +324,7 @@ async def handle_format_excel(callback_query: CallbackQuery):
 
 # Инициализация бота и диспетчера
 bot = Bot(token=cf.TOKEN)
+bot.session.middleware(send_queue_middleware)
 dp = Dispatcher()
 
 # Обработчик команды /start
@@ -351,6 +354,9 @@ async def handle_revenue_analysis_excel(callback_query: CallbackQuery):
 
 # Запуск бота
 async def main():
+    dp.startup.register(sova_api_client.start)
+    dp.shutdown.register(sova_api_client.close)
+    dp.shutdown.register(send_queue.close)
     await dp.start_polling(bot)
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
 import asyncio
 import logging
 from asyncio import CancelledError
+from functools import partial
 
 from aiogram import Bot, Dispatcher, Router, F, types
 from aiogram.client.default import DefaultBotProperties
@@ -12,23 +13,28 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, InlineKe
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 import asyncpg
+from src.util.db.postgres import pg_pool
 from datetime import datetime, time
 
 from apscheduler.triggers.interval import IntervalTrigger
 
 import config as cf
+from src.util.fsm.storage import create_fsm_storage
+from src.analytics.api_client import sova_api_client
 from src.mailing.data.notification.notification_google_sheets_worker import notification_gsworker
 from src.mailing.notifications.select_report import subscribe_notifications, setup_routers_select_reports
 from src.sound_and_text_ai.ai_answers import ai_answer
 
 from src.mailing.notifications.keyboards import periodicity_kb, timezone_kb, weekdays_kb
+from src.util.telegram.send_queue import Priority, send_priority, send_queue, send_queue_middleware
 
 from src.basic.revenue_analysis.graphics_for_pdf import handle_format_pdf
 from src.basic.revenue_analysis.make_excel import handle_format_excel
 
 # Настройка бота
 bot = Bot(token=cf.TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-dp = Dispatcher()
+bot.session.middleware(send_queue_middleware)
+dp = Dispatcher(storage=create_fsm_storage())
 
 # Множество пользователей, ожидающих ввода
 waiting_for_question = set()
@@ -79,7 +85,7 @@ DB_CONFIG = cf.DB_CONFIG
 
 
 async def init_db_pool():
-    return await asyncpg.create_pool(cf.DB_LINK)
+    return await pg_pool.get_pool()
 
 
 db_pool = None
@@ -93,7 +99,7 @@ logging.basicConfig(level=logging.INFO)
 router = Router(name=__name__)
 
 async def get_subscriptions_from_db():
-    conn = await asyncpg.connect(**DB_CONFIG)
+    conn = await pg_pool.acquire()
     try:
         # Получаем все подписки, которые активны
         result = await conn.fetch('''
@@ -105,7 +111,7 @@ async def get_subscriptions_from_db():
         logging.error(f"Failed to get subscriptions: {e}")
         return []
     finally:
-        await conn.close()
+        await pg_pool.release(conn)
 
 
 # Функция для добавления задачи в планировщик
@@ -128,6 +134,8 @@ async def add_subscription_task(user_id, sub_type, time_obj, report_type):
 async def send_report(user_id, report_type):
     # Здесь должна быть логика формирования отчёта и отправки
     logging.info(f"Sending {report_type} report for user {user_id}")
+    # the scheduler runs the job in its own task, replies to users go ahead of these messages
+    send_priority.set(Priority.BROADCAST)
     # Например, использовать обработчики для формата отчёта:
     if report_type == 'pdf':
         await handle_format_pdf(user_id)
@@ -152,7 +160,7 @@ async def schedule_all_subscriptions():
 async def send_notification(user_id, subscription_type, time_obj):
     # Отправляем уведомление пользователю
     message = f"Время для {subscription_type} подписки: {time_obj.strftime('%H:%M')}"
-    await bot.send_message(user_id, message)
+    await send_queue.send(user_id, partial(bot.send_message, user_id, message), priority=Priority.BROADCAST)
 
 
 async def add_subscription_task(user_id, subscription_type, time_obj, report_type):
@@ -391,7 +399,7 @@ async def save_time(message: Message, state: FSMContext):
 
 @router.callback_query(F.data == 'show_subscriptions')
 async def show_subscriptions(callback_query: CallbackQuery):
-    conn = await asyncpg.connect(**DB_CONFIG)
+    conn = await pg_pool.acquire()
     try:
         # Извлекаем подписки для текущего пользователя
         subscriptions = await conn.fetch(''' 
@@ -428,18 +436,18 @@ async def show_subscriptions(callback_query: CallbackQuery):
         logging.error(f"Error fetching subscriptions: {e}")
         await callback_query.message.answer("Произошла ошибка при извлечении подписок. Попробуйте позже.")
     finally:
-        await conn.close()
+        await pg_pool.release(conn)
 
 
 async def execute_db_query(query: str, *args):
-    conn = await asyncpg.connect(**DB_CONFIG)
+    conn = await pg_pool.acquire()
     try:
         return await conn.fetch(query, *args)
     except Exception as e:
         logging.error(f"DB error: {e}")
         return None
     finally:
-        await conn.close()
+        await pg_pool.release(conn)
 
 
 @router.callback_query(F.data.startswith("unsubscribe_"))
@@ -469,7 +477,7 @@ async def unsubscribe(callback_query: CallbackQuery):
         return
 
     # Удаляем подписку из базы данных
-    conn = await asyncpg.connect(**DB_CONFIG)
+    conn = await pg_pool.acquire()
     try:
         # Запрос, который использует объект time, а не строку
         await conn.execute(''' 
@@ -482,7 +490,7 @@ async def unsubscribe(callback_query: CallbackQuery):
         logging.error(f"Ошибка при удалении подписки: {e}")
         await callback_query.message.answer("Произошла ошибка при удалении подписки. Попробуйте позже.")
     finally:
-        await conn.close()
+        await pg_pool.release(conn)
 
 
 # Обработчик нажатия на кнопку подписки
@@ -508,7 +516,7 @@ async def manage_subscription(callback_query: CallbackQuery):
 
 @router.callback_query(F.data == "back_to_subscriptions")
 async def back_to_subscriptions(callback_query: CallbackQuery):
-    conn = await asyncpg.connect(**DB_CONFIG)
+    conn = await pg_pool.acquire()
     try:
         # Извлекаем подписки для текущего пользователя
         subscriptions = await conn.fetch(''' 
@@ -552,7 +560,7 @@ async def back_to_subscriptions(callback_query: CallbackQuery):
         logging.error(f"Error fetching subscriptions: {e}")
         await callback_query.message.answer("Произошла ошибка при извлечении подписок. Попробуйте позже.")
     finally:
-        await conn.close()
+        await pg_pool.release(conn)
 
 
 @router.callback_query(F.data.startswith("unsubscribe_"))
@@ -570,7 +578,7 @@ async def unsubscribe(callback_query: CallbackQuery):
         return
 
     # Удаляем подписку из базы данных
-    conn = await asyncpg.connect(**DB_CONFIG)
+    conn = await pg_pool.acquire()
     try:
         # Запрос, который использует объект time, а не строку
         await conn.execute(''' 
@@ -586,7 +594,7 @@ async def unsubscribe(callback_query: CallbackQuery):
         logging.error(f"Failed to unsubscribe: {e}")
         await callback_query.message.answer("Произошла ошибка при удалении подписки. Попробуйте позже.")
     finally:
-        await conn.close()
+        await pg_pool.release(conn)
 
 
 
@@ -647,7 +655,7 @@ async def save_subscription(user_id, sub_type, periodicity, weekday, day_of_mont
     logging.info(f"Saving subscription for user {user_id}: sub_type={sub_type}, periodicity={periodicity}, "
                  f"weekday={weekday}, day_of_month={day_of_month}, time={time_obj}, report_type={report_type}, token={token}")
 
-    conn = await asyncpg.connect(**DB_CONFIG)
+    conn = await pg_pool.acquire()
     try:
         # Вставляем новую подписку
         await conn.execute(''' 
@@ -663,7 +671,7 @@ async def save_subscription(user_id, sub_type, periodicity, weekday, day_of_mont
     except Exception as e:
         logging.error(f"Failed to save subscription: {e}")
     finally:
-        await conn.close()
+        await pg_pool.release(conn)
 
 
 async def main() -> None:
@@ -673,6 +681,11 @@ async def main() -> None:
     setup_routers_select_reports()
     dp.include_router(subscribe_notifications)
     dp.include_router(ai_answer)
+    dp.startup.register(sova_api_client.start)
+    dp.shutdown.register(sova_api_client.close)
+    dp.shutdown.register(send_queue.close)
+    dp.shutdown.register(dp.storage.close)
+    dp.shutdown.register(pg_pool.close)
 
     # Удаляем webhook, если был установлен
     await bot.delete_webhook()